@@ -2,85 +2,286 @@
 
 import os
 import json
+import shutil
+import tempfile
+
+from Instrumentation import NO_INSTRUMENTATION
+from MediatorClass import Mediator, MediatorStream, MediatorCategories, MediatorBboxs, NO_ID
+
+# json files larger than this size (bytes) are parsed incrementally unless told otherwise
+INCREMENTAL_SIZE = 256<<20
+
+class JsonStreamParser:
+    """
+    Incremental JSON parser reading a file chunk by chunk.
+    
+    Only the structure needed to walk a COCO file is exposed: keys of the top-level object and items of arrays,
+    any other value is decoded at once with json.
+    """
+    def __init__(self, fileObj, chunkSize=1<<20):
+        self.file = fileObj
+        self.chunkSize = chunkSize
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+    
+    def read_chunk(self):
+        # drop parsed characters before reading more
+        chunk = self.file.read(self.chunkSize)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if not chunk: self.eof = True
+    
+    def peek(self):
+        # next non whitespace character, '' at end of file
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof: break
+            self.read_chunk()
+        return(self.buffer[self.pos:self.pos+1])
+    
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars: raise(Exception('Invalid json file: expected one of {} at character {}, got {!r}.'.format(chars, self.pos, char)))
+        self.pos += 1
+        return(char)
+    
+    def parse_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a value touching the end of buffer may be truncated (numbers)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return(value)
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self.read_chunk()
+    
+    def iter_object(self):
+        # yield keys, the caller must consume each value before asking for the next key
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.parse_value()
+            self.expect(':')
+            yield(key)
+            if self.expect(',}') == '}': return
+    
+    def iter_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield(self.parse_value())
+            if self.expect(',]') == ']': return
 
-from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
 
 class CocoReader:
     def __init__(self):
         self.jsonFname = None
+        self.incremental = None
+        self.instrument = NO_INSTRUMENTATION
         
     def set_json_file(self, jsonFile):
         assert os.path.isfile(jsonFile), 'Json file must exist.'
         self.jsonFname = os.path.abspath(jsonFile)
+    
+    def set_incremental(self, incremental):
+        # None to choose from the file size
+        if incremental is None: incremental = os.path.getsize(self.jsonFname) > INCREMENTAL_SIZE
+        self.incremental = incremental
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+    
+    def set_info(self, stream, info):
+        stream.infoYear = info['year']
+        stream.infoVersion = info['version']
+        stream.infoDes = info['description']
+        stream.infoCont = info['contributor']
+        stream.infoUrl = info['url']
+        stream.infoDateCreated = info['date_created']
+    
+    def get_img_kwargs(self, stream, imgInfo):
+        # those are optional
+        try: dateCaptured = imgInfo['date_captured']
+        except: dateCaptured = None
+        
+        try: flickrURL = imgInfo['flickr_url']
+        except: flickrURL = None
+        
+        try: cocoURL = imgInfo['coco_url']
+        except: cocoURL = None
+        
+        return({'ID':imgInfo['id'], 'height':imgInfo['height'], 'width':imgInfo['width'], 'sourceName':stream.infoDes,
+                'fname':imgInfo['file_name'], 'path':imgInfo['file_name'], 'licenseID':imgInfo['license'],
+                'date_captured':dateCaptured, 'flickrURL':flickrURL, 'cocoURL':cocoURL, 'handlepath':False})
+    
+    def append_annotation(self, mediatorBboxs, annotation):
+        mediatorBboxs.append(ID=annotation['id'], labelID=annotation['category_id'],
+                             x=annotation['bbox'][0], y=annotation['bbox'][1],
+                             height=annotation['bbox'][3], width=annotation['bbox'][2], iscrowd=annotation['iscrowd'])
 
-    def create_mediator(self):
-        # open json file
-        jsonOpen = open(self.jsonFname, 'r')
-        jsonFile = json.load(jsonOpen)
+    def create_stream(self):
+        self.instrument.count('bytes_read', os.path.getsize(self.jsonFname))
+        if self.incremental: return(self.create_incremental_stream())
         
-        # get database informations
-        infoYear = jsonFile['info']['year']
-        infoVersion = jsonFile['info']['version']
-        infoDes = jsonFile['info']['description']
-        infoCont = jsonFile['info']['contributor']
-        infoUrl = jsonFile['info']['url']
-        infoDateCreated = jsonFile['info']['date_created']
+        # open json file
+        with self.instrument.stage('parse'):
+            jsonOpen = open(self.jsonFname, 'r')
+            jsonFile = json.load(jsonOpen)
+            jsonOpen.close()
         
-        # get licences informations
-        licenses = jsonFile['licenses']
+        # get database informations and licences informations
+        stream = MediatorStream(licenses=jsonFile['licenses'], objCateg=MediatorCategories())
+        self.set_info(stream, jsonFile['info'])
         
         # get categories informations
-        mediatorCateg = MediatorCategories()
         for categ in jsonFile['categories']:
-            mediatorCateg.append(ID=categ['id'], name=categ['name'], supercategory=categ['supercategory'])
+            stream.categList.append(ID=categ['id'], name=categ['name'], supercategory=categ['supercategory'])
+        
+        stream.records = self.instrument.track(self.iter_records(stream, jsonFile), 'read')
+        self.instrument.set_total(len(jsonFile['images']))
+        return(stream)
+    
+    def iter_records(self, stream, jsonFile):
+        # group annotations by image, annotations are listed after all images in COCO files
+        self.instrument.info('Loading COCO annotations ...')
+        annotsByImg = {}
+        for annotation in jsonFile['annotations']:
+            annotsByImg.setdefault(annotation['image_id'], []).append(annotation)
+        
+        # annotations are given by image ID, which must then be unique
+        imgIDs = set()
+        for imgInfo in jsonFile['images']:
+            self.check_img_id(imgIDs, imgInfo['id'])
         
         # get images informations
-        mediatorImgs = MediatorImages()
-        print('[INFO] Loading COCO images informations ...')
+        self.instrument.info('Loading COCO images informations ...')
         for imgInfo in jsonFile['images']:
-            # those are optional
-            try: dateCaptured = imgInfo['date_captured']
-            except: dateCaptured = None
-            
-            try: flickrURL = imgInfo['flickr_url']
-            except: flickrURL = None
-            
-            try: cocoURL = imgInfo['coco_url']
-            except: cocoURL = None
+            # get annotations informations
+            mediatorBboxs = MediatorBboxs()
+            for annotation in annotsByImg.pop(imgInfo['id'], []):
+                self.append_annotation(mediatorBboxs, annotation)
             
-            mediatorImgs.append(ID=imgInfo['id'], height=imgInfo['height'], width=imgInfo['width'], sourceName=infoDes,
-                                fname=imgInfo['file_name'], path=imgInfo['file_name'], licenseID=imgInfo['license'],
-                                date_captured=dateCaptured, flickrURL=flickrURL, cocoURL=cocoURL, bboxs=MediatorBboxs(), handlepath=False)
-        # get annotations informations
-        print('[INFO] Loading COCO annotations ...')
-        for annotation in jsonFile['annotations']:
-            arg = mediatorImgs.get_arg_object(annotation['image_id'])
-            
-            mediatorImgs.list[arg]['bboxs'].append(ID=annotation['id'], labelID=annotation['category_id'],
-                                                   x=annotation['bbox'][0], y=annotation['bbox'][1],
-                                                   height=annotation['bbox'][3], width=annotation['bbox'][2], iscrowd=annotation['iscrowd'])
-        # create Mediator variable
-        cocoMed = Mediator(infoYear=infoYear, infoVersion=infoVersion, infoDes=infoDes, infoCont=infoCont, 
-                           infoUrl=infoUrl, infoDateCreated=infoDateCreated, licenses=licenses,
-                           objImgs=mediatorImgs, objCateg=mediatorCateg)
+            yield(stream.create_record(bboxs=mediatorBboxs, **self.get_img_kwargs(stream, imgInfo)))
+        
+        # annotations left refer to no image
+        for imgID in annotsByImg:
+            raise(Exception('No object has ID {}.'.format(imgID)))
+    
+    def check_img_id(self, imgIDs, imgID):
+        if imgID in imgIDs: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(imgID)))
+        imgIDs.add(imgID)
+    
+    def create_incremental_stream(self):
+        jsonOpen = open(self.jsonFname, 'r', encoding='utf-8')
+        parser = JsonStreamParser(jsonOpen)
+        keys = parser.iter_object()
+        stream = MediatorStream(objCateg=MediatorCategories())
+        
+        # info, licenses and categories come first in COCO files, read them right away
+        with self.instrument.stage('parse'):
+            key = next(keys, None)
+            while key is not None and key not in ('images', 'annotations'):
+                self.read_header_key(stream, parser, key)
+                key = next(keys, None)
+        
+        stream.records = self.instrument.track(self.iter_incremental_records(stream, parser, keys, key, jsonOpen), 'read')
+        return(stream)
+    
+    def read_header_key(self, stream, parser, key):
+        if key == 'info':
+            self.set_info(stream, parser.parse_value())
+        elif key == 'licenses':
+            stream.licenses = parser.parse_value()
+        elif key == 'categories':
+            for categ in parser.iter_array():
+                stream.categList.append(ID=categ['id'], name=categ['name'], supercategory=categ['supercategory'])
+        else:
+            parser.parse_value()
+    
+    def iter_incremental_records(self, stream, parser, keys, key, jsonOpen):
+        # only images informations and compact bboxs are kept, annotations may refer to any image
+        imgsKwargs = []
+        imgIDs = set()
+        bboxsByImg = {}
+        with self.instrument.stage('parse'):
+            while key is not None:
+                if key == 'images':
+                    self.instrument.info('Loading COCO images informations ...')
+                    for imgInfo in parser.iter_array():
+                        self.check_img_id(imgIDs, imgInfo['id'])
+                        imgsKwargs.append(self.get_img_kwargs(stream, imgInfo))
+                elif key == 'annotations':
+                    self.instrument.info('Loading COCO annotations ...')
+                    for annotation in parser.iter_array():
+                        if annotation['image_id'] not in bboxsByImg: bboxsByImg[annotation['image_id']] = MediatorBboxs()
+                        self.append_annotation(bboxsByImg[annotation['image_id']], annotation)
+                else:
+                    self.read_header_key(stream, parser, key)
+                key = next(keys, None)
         jsonOpen.close()
-        return(cocoMed)
+        self.instrument.set_total(len(imgsKwargs))
+        
+        for imgKwargs in imgsKwargs:
+            yield(stream.create_record(bboxs=bboxsByImg.pop(imgKwargs['ID'], None), **imgKwargs))
+        
+        # annotations left refer to no image
+        for imgID in bboxsByImg:
+            raise(Exception('No object has ID {}.'.format(imgID)))
     
-    def translate2mediator(self, jsonFname):
+    def create_mediator(self):
+        return(self.create_stream().to_mediator())
+    
+    def translate2stream(self, jsonFname, incremental=None, instrument=None):
+        """
+        Translate COCO annotation file to MediatorStream Class, images are yielded one by one while the stream is browsed.
+        
+        input: jsonFname: file path (.json) containing COCO annotations
+               incremental: parse the file chunk by chunk instead of loading the whole json at once with json.load.
+                            Memory is then bounded by images informations rather than by the raw json, parsing is slower.
+                            None (default) parses incrementally files larger than INCREMENTAL_SIZE only.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+               
+        output: a MediatorStream class object yielding images records
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_json_file(jsonFname)
+        self.set_incremental(incremental)
+        
+        # create mediator stream
+        return(self.create_stream())
+    
+    def translate2mediator(self, jsonFname, incremental=None, instrument=None):
         """
         Translate COCO annotation file to Mediator Class.
         
         input: jsonFname: file path (.json) containing COCO annotations
+               incremental: parse the file chunk by chunk instead of loading the whole json at once with json.load.
+                            None (default) parses incrementally files larger than INCREMENTAL_SIZE only.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
                
         output: a Mediator class object containing annotations and classes informations
         
         for more informations about COCO annotation format: https://towardsdatascience.com/coco-data-format-for-object-detection-a4c5eaf518c5
         """
         # set variables
+        self.set_instrumentation(instrument)
         self.set_json_file(jsonFname)
+        self.set_incremental(incremental)
         
         # create Mediator objects
         cocoMed = self.create_mediator()
+        self.instrument.finish()
         return(cocoMed)   
         
     
@@ -88,15 +289,28 @@ class CocoWriter:
     def __init__(self):
         self.mediator = Mediator()
         self.dataFile = './coco_annot.json'
+        self.chunkSize = 10000 # number of json entries serialised before each write
+        self.instrument = NO_INSTRUMENTATION
         
     def set_mediator(self, mediator):
+        assert mediator.manifest is None, 'mediator has been read with a manifest and misses unchanged sources, read it without manifest to write a COCO file.'
         self.mediator = mediator
         
     def set_output_file(self, outputAnnotFile):
         assert outputAnnotFile.endswith('.json'), 'output file must be a json file.'
         self.dataFile = os.path.abspath(outputAnnotFile)
-        
-    def write_annot(self):
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+    
+    def write_entries(self, fileObj, entries, numWritten):
+        # append json entries of an array, numWritten entries have already been written
+        if entries:
+            if numWritten: fileObj.write(', ')
+            fileObj.write(', '.join(entries))
+        return(numWritten + len(entries))
+    
+    def write_header(self, fileObj):
         # set coco informations
         info = {'year': self.mediator.infoYear,
                 'version': self.mediator.infoVersion,
@@ -112,58 +326,93 @@ class CocoWriter:
         categories = []
         for categ in self.mediator.categList.list:
             categories.append({'id':categ['id'], 'name':categ['name'], 'supercategory':categ['supercategory']})
+        
+        # same layout as json.dumps of the whole document, up to the images array
+        fileObj.write('{"info": ' + json.dumps(info) + ', "licenses": ' + json.dumps(licenses) +
+                      ', "categories": ' + json.dumps(categories) + ', "images": [')
+        
+    def write_annot(self):
+        # images are written right after the categories when they are known before browsing, otherwise (MediatorStream)
+        # they are spooled to a temporary file until the categories are complete.
+        # annotations come after all images and are always spooled
+        jsonOpen = open(self.dataFile, 'w', buffering=1<<20)
+        if self.mediator.categories_complete():
+            self.write_header(jsonOpen)
+            imgsSpool = None
+        else:
+            imgsSpool = tempfile.TemporaryFile('w+', dir=os.path.dirname(self.dataFile))
+        annotsSpool = tempfile.TemporaryFile('w+', dir=os.path.dirname(self.dataFile))
+        images, numImgs = [], 0
+        annotations, numAnnots = [], 0
+        
+        for imgObject in self.instrument.track(self.mediator.iter_records(), 'written'):
+            with self.instrument.stage('serialise'):
+                # set coco images
+                imgInfo = ({'id': imgObject['id'],
+                            'width': imgObject['width'],
+                            'height': imgObject['height'],
+                            'file_name': imgObject['fname'],
+                            'license': imgObject['license']})
+                if imgObject['date_captured']: imgInfo['date_captured']=imgObject['date_captured']
+                if imgObject['flickrURL']: imgInfo['flickr_url']=imgObject['flickrURL']
+                if imgObject['cocoURL']: imgInfo['coco_url']=imgObject['cocoURL']
+                images.append(json.dumps(imgInfo))
+                
+                # set coco annotations, coordinates as they were read so that integers stay integers
+                bboxs = imgObject['bboxs']
+                for ID, labelID, (x, y, width, height), iscrowd in zip(bboxs.get_column('id'), bboxs.get_column('labelID'), bboxs.get_coords(), bboxs.get_column('iscrowd')):
+                    annotations.append(json.dumps({'id': None if ID == NO_ID else ID,
+                                                   'image_id': imgObject['id'],
+                                                   'category_id': labelID,
+                                                   'bbox': [x, y, width, height],
+                                                   'iscrowd': iscrowd,
+                                                   'segmentation': [0,0,0],
+                                                   'area': 0.0}))
             
-        # set coco images
-        images = []
-        annotations = []
-        for imgObject in self.mediator.imgList.list:
-            imgInfo = ({'id': imgObject['id'],
-                        'width': imgObject['width'],
-                        'height': imgObject['height'],
-                        'file_name': imgObject['fname'],
-                        'license': imgObject['license']})
-            if imgObject['date_captured']: imgInfo['date_captured']=imgObject['date_captured']
-            if imgObject['flickrURL']: imgInfo['flickr_url']=imgObject['flickrURL']
-            if imgObject['cocoURL']: imgInfo['coco_url']=imgObject['cocoURL']
-            images.append(imgInfo)
-            
-            # set coco annotations
-            for annotObject in imgObject['bboxs'].list:
-                annotations.append({'id': annotObject['id'],
-                                    'image_id': imgObject['id'],
-                                    'category_id': annotObject['labelID'],
-                                    'bbox': [annotObject['x'], annotObject['y'], annotObject['width'], annotObject['height']],
-                                    'iscrowd': annotObject['iscrowd'],
-                                    'segmentation': [0,0,0],
-                                    'area': 0.0})
-        # create global variable for writing
-        outJson = {'info':info,
-                   'licenses':licenses,
-                   'categories':categories,
-                   'images':images,
-                   'annotations':annotations}
-        
-        # write result on json file
-        jsonFile = json.dumps(outJson)
-        jsonOpen = open(self.dataFile, 'w')
-        jsonOpen.write(jsonFile)
-        jsonOpen.close()
+            # flush serialised entries
+            if len(images) >= self.chunkSize:
+                numImgs = self.write_entries(imgsSpool or jsonOpen, images, numImgs)
+                images = []
+            if len(annotations) >= self.chunkSize:
+                numAnnots = self.write_entries(annotsSpool, annotations, numAnnots)
+                annotations = []
+        numImgs = self.write_entries(imgsSpool or jsonOpen, images, numImgs)
+        numAnnots = self.write_entries(annotsSpool, annotations, numAnnots)
+        
+        # write the rest of the json file
+        with self.instrument.stage('write'):
+            if imgsSpool is not None:
+                self.write_header(jsonOpen)
+                imgsSpool.seek(0)
+                shutil.copyfileobj(imgsSpool, jsonOpen, 1<<20)
+                imgsSpool.close()
+            jsonOpen.write('], "annotations": [')
+            annotsSpool.seek(0)
+            shutil.copyfileobj(annotsSpool, jsonOpen, 1<<20)
+            jsonOpen.write(']}')
+            jsonOpen.close()
+            annotsSpool.close()
+        self.instrument.count('bytes_written', os.path.getsize(self.dataFile))
         
         
-    def write(self, mediator, outputAnnotFile='./coco_annot.json'):
+    def write(self, mediator, outputAnnotFile='./coco_annot.json', instrument=None):
         """
         Translate Mediator class object to COCO annotation file.
         
-        input: mediator: Mediator object obtained by reading in another format
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
                outputAnnotFile: file path where .json annotation file will be stored
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           its profile is reported at the end
 
         for more informations about COCO annotation format: https://towardsdatascience.com/coco-data-format-for-object-detection-a4c5eaf518c5
         """
         # set variables
         self.set_mediator(mediator)
         self.set_output_file(outputAnnotFile)
+        self.set_instrumentation(instrument)
         
         # write files
-        print("[INFO] Writing COCO annotation file...")
+        self.instrument.info("Writing COCO annotation file...")
         self.write_annot()
-        print("[INFO] Successfully created annotation file at {}".format(self.dataFile))
+        self.instrument.info("Successfully created annotation file at {}".format(self.dataFile))
+        self.instrument.finish()
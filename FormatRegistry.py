@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+
+from Instrumentation import defer_finish
+
+# format name -> (module, reader class, writer class), modules and their dependencies are imported at first use only
+FORMATS = {'yolo': ('YoloDataClass', 'YoloReader', 'YoloWriter'),
+           'pascalvoc': ('PascalVocDataClass', 'PascalVocReader', 'PascalVocWriter'),
+           'coco': ('CocoDataClass', 'CocoReader', 'CocoWriter'),
+           'tfrecord': ('TfrecordsDataClass', 'TfrecordsReader', 'TfrecordsWriter'),
+           'snapshot': ('SnapshotDataClass', 'SnapshotReader', 'SnapshotWriter')}
+
+def register_format(name, moduleName, readerName, writerName):
+    """
+    Add a format to the registry, or replace an existing one.
+
+    input: name: format name given to get_reader, get_writer and convert
+           moduleName: name of the module defining the reader and the writer, imported at first use
+           readerName: reader class name, None if the format can not be read
+           writerName: writer class name, None if the format can not be written
+    """
+    FORMATS[name] = (moduleName, readerName, writerName)
+
+def get_format_class(name, role):
+    assert name in FORMATS, 'Unknown format {}, available formats: {}.'.format(name, ', '.join(FORMATS))
+    moduleName, readerName, writerName = FORMATS[name]
+    className = readerName if role == 'reader' else writerName
+    if className is None: raise(Exception('Format {} has no {}.'.format(name, role)))
+    return(getattr(importlib.import_module(moduleName), className))
+
+def get_reader(name):
+    """
+    input: name: format name, one of FORMATS keys
+
+    output: reader class of the format
+    """
+    return(get_format_class(name, 'reader'))
+
+def get_writer(name):
+    """
+    input: name: format name, one of FORMATS keys
+
+    output: writer class of the format
+    """
+    return(get_format_class(name, 'writer'))
+
+def convert(srcFormat, dstFormat, readArgs, writeArgs, stream=True, instrument=None):
+    """
+    Convert annotations from a format to another, only modules of both formats are imported.
+
+    input: srcFormat: format name of the annotations to read, one of FORMATS keys
+           dstFormat: format name of the annotations to write, one of FORMATS keys
+           readArgs: dict of arguments of the reader translate2stream/translate2mediator, e.g. {'dataDir': ..., 'namesFname': ...}
+           writeArgs: dict of arguments of the writer write method except mediator, e.g. {'outputAnnotDir': ...}
+           stream: read images one by one while writing (translate2stream), else load all annotations first (translate2mediator)
+           instrument: Instrumentation object (e.g. Profiler) given to both the reader and the writer
+
+    output: the Mediator or MediatorStream object that has been written
+    """
+    reader = get_reader(srcFormat)()
+    if stream:
+        mediator = reader.translate2stream(instrument=instrument, **readArgs)
+    else:
+        # the reader finishes once all annotations are loaded, the profile is reported once the writer returns
+        mediator = reader.translate2mediator(instrument=defer_finish(instrument), **readArgs)
+    get_writer(dstFormat)().write(mediator=mediator, instrument=instrument, **writeArgs)
+    return(mediator)
+
+def convert_many(srcFormat, targets, readArgs, stream=True, queueSize=256, instrument=None):
+    """
+    Convert annotations to several formats at once, annotations are read once and given to all writers (see MultiWriter).
+
+    input: srcFormat: format name of the annotations to read, one of FORMATS keys
+           targets: list of (format name, dict of arguments of the writer write method except mediator), e.g.
+                    [('yolo', {'outputAnnotDir': ..., 'outputNamesFname': ...}), ('coco', {'outputAnnotFile': ...})]
+           readArgs: dict of arguments of the reader translate2stream/translate2mediator
+           stream: read images one by one while writing (translate2stream), else load all annotations first (translate2mediator)
+           queueSize: number of images each target can be behind the fastest one
+           instrument: Instrumentation object (e.g. Profiler) given to the reader and the MultiWriter
+
+    output: the Mediator or MediatorStream object that has been written
+    """
+    from MultiWriter import MultiWriter # MultiWriter imports this module
+    reader = get_reader(srcFormat)()
+    if stream:
+        mediator = reader.translate2stream(instrument=instrument, **readArgs)
+    else:
+        mediator = reader.translate2mediator(instrument=defer_finish(instrument), **readArgs)
+    MultiWriter().write(mediator=mediator, targets=targets, queueSize=queueSize, instrument=instrument)
+    return(mediator)
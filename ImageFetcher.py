@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import hashlib
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# status codes worth another try
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class ImageFetcher:
+    """
+    Download images concurrently, in order, with retries and a local cache.
+    
+    Downloaded content is stored in cacheDir under its own hash, URLs only point to it,
+    so that images shared by several URLs are stored once and re-runs never download again.
+    """
+    def __init__(self, cacheDir=None, workers=16, maxInFlight=64, retries=3, backoff=0.5, timeout=30):
+        self.cacheDir = os.path.abspath(cacheDir) if cacheDir else None
+        self.workers = workers
+        self.maxInFlight = max(maxInFlight, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.numDownloads = 0
+        self.numCacheHits = 0
+        
+        if self.cacheDir:
+            os.makedirs(os.path.join(self.cacheDir, 'urls'), exist_ok=True)
+            os.makedirs(os.path.join(self.cacheDir, 'blobs'), exist_ok=True)
+    
+    def get_session(self):
+        # one session per thread, each keeping its connections alive
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return(self.local.session)
+    
+    def get_url_file(self, url):
+        return(os.path.join(self.cacheDir, 'urls', hashlib.sha1(url.encode('utf8')).hexdigest()))
+    
+    def get_blob_file(self, digest):
+        return(os.path.join(self.cacheDir, 'blobs', digest[:2], digest))
+    
+    def write_atomic(self, path, data, mode='wb'):
+        # readers never see partial files, even if the process is killed
+        tmpPath = '{}.{}.tmp'.format(path, threading.get_ident())
+        fileOpen = open(tmpPath, mode)
+        fileOpen.write(data)
+        fileOpen.close()
+        os.replace(tmpPath, path)
+    
+    def read_cache(self, url):
+        if not self.cacheDir: return(None)
+        urlFile = self.get_url_file(url)
+        if not os.path.isfile(urlFile): return(None)
+        urlOpen = open(urlFile, 'r')
+        digest = urlOpen.read().strip()
+        urlOpen.close()
+        blobFile = self.get_blob_file(digest)
+        if not os.path.isfile(blobFile): return(None)
+        blobOpen = open(blobFile, 'rb')
+        data = blobOpen.read()
+        blobOpen.close()
+        return(data)
+    
+    def write_cache(self, url, data):
+        if not self.cacheDir: return
+        digest = hashlib.sha1(data).hexdigest()
+        blobFile = self.get_blob_file(digest)
+        if not os.path.isfile(blobFile):
+            os.makedirs(os.path.dirname(blobFile), exist_ok=True)
+            self.write_atomic(blobFile, data)
+        self.write_atomic(self.get_url_file(url), digest, mode='w')
+    
+    def download(self, url):
+        for attempt in range(self.retries+1):
+            try:
+                response = self.get_session().get(url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return(response.content)
+                error = Exception('Download of {} failed with status {}.'.format(url, response.status_code))
+            except requests.exceptions.ConnectionError as exception:
+                error = exception
+            except requests.exceptions.Timeout as exception:
+                error = exception
+            # exponential backoff before the next attempt
+            if attempt < self.retries: time.sleep(self.backoff * 2**attempt)
+        raise(Exception('Download of {} failed after {} attempts: {}'.format(url, self.retries+1, error)))
+    
+    def fetch(self, url):
+        """
+        input: url: image URL
+        
+        output: image content, read from the cache if it has already been downloaded
+        """
+        data = self.read_cache(url)
+        if data is not None:
+            with self.lock: self.numCacheHits += 1
+            return(data)
+        data = self.download(url)
+        self.write_cache(url, data)
+        with self.lock: self.numDownloads += 1
+        return(data)
+    
+    def iter_fetch(self, items, get_url):
+        """
+        Fetch images of items concurrently, at most maxInFlight at once.
+        
+        input: items: iterable of any objects
+               get_url: function returning the URL to fetch for an item, or None when nothing has to be fetched
+        
+        output: generator of (item, content) tuples in items order, content being None when nothing was fetched
+        """
+        window = deque()
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                # keep the window full
+                while len(window) < self.maxInFlight:
+                    item = next(items, window)
+                    if item is window: break
+                    url = get_url(item)
+                    window.append((item, pool.submit(self.fetch, url) if url else None))
+                if not window: break
+                
+                item, future = window.popleft()
+                yield(item, future.result() if future else None)
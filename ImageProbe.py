@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SOI = b'\xff\xd8'
+
+# start of frame markers (baseline, progressive, lossless, ...), DHT/JPG/DAC share the range but are not frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# markers standing alone, without length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+# PNG color type -> number of channels, as PIL bands
+PNG_CHANNELS = {0:1, 2:3, 3:1, 4:2, 6:4}
+
+def probe_png(fileObj):
+    # IHDR is always the first chunk, right after the signature
+    header = fileObj.read(18)
+    if len(header) < 18 or header[4:8] != b'IHDR': return(None)
+    width, height, bitDepth, colorType = struct.unpack('>IIBB', header[8:18])
+    if colorType not in PNG_CHANNELS: return(None)
+    return(width, height, PNG_CHANNELS[colorType])
+
+def probe_jpeg(fileObj):
+    # browse segments until a start of frame, skipping their content
+    while True:
+        byte = fileObj.read(1)
+        if byte != b'\xff': return(None)
+        # markers may be preceded by fill bytes
+        while byte == b'\xff':
+            byte = fileObj.read(1)
+        if not byte: return(None)
+        marker = byte[0]
+        if marker in JPEG_STANDALONE_MARKERS: continue
+        if marker == 0xD9: return(None) # end of image
+        
+        length = fileObj.read(2)
+        if len(length) < 2: return(None)
+        length = struct.unpack('>H', length)[0]
+        if marker in JPEG_SOF_MARKERS:
+            frame = fileObj.read(6)
+            if len(frame) < 6: return(None)
+            height, width, components = struct.unpack('>HHB', frame[1:6])
+            return(width, height, components)
+        fileObj.seek(length-2, 1)
+
+def detect_format(data):
+    """
+    Get the format of an encoded image from its magic bytes, whatever its file extension.
+    
+    input: data: first bytes of the encoded image (at least 8)
+    
+    output: 'jpeg', 'png' or None for other formats
+    """
+    if data[:8] == PNG_SIGNATURE: return('png')
+    if data[:2] == JPEG_SOI: return('jpeg')
+    return(None)
+
+def probe_header(fileObj):
+    """
+    Get image dimensions from a JPEG or PNG header, without decoding pixels.
+    
+    input: fileObj: binary file object positioned at the start of the image
+    
+    output: (width, height, depth) tuple, depth being the number of channels, or None for other formats or corrupted headers
+    """
+    signature = fileObj.read(8)
+    if signature == PNG_SIGNATURE:
+        return(probe_png(fileObj))
+    if signature[:2] == JPEG_SOI:
+        fileObj.seek(-len(signature)+2, 1)
+        return(probe_jpeg(fileObj))
+    return(None)
+
+def probe_image(path):
+    """
+    Get image dimensions reading only its header, PIL is used for formats other than JPEG and PNG.
+    
+    input: path: image file path
+    
+    output: (width, height, depth) tuple, depth being the number of channels
+    """
+    imgOpen = open(path, 'rb')
+    result = probe_header(imgOpen)
+    imgOpen.close()
+    
+    if result is None:
+        # PIL reads headers lazily as well, getbands does not decode pixels. Imported here as JPEG and PNG do not need it
+        from PIL import Image
+        img = Image.open(path)
+        result = (img.size[0], img.size[1], len(img.getbands()))
+        img.close()
+    return(result)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+from datetime import timedelta
+
+
+class NullStage:
+    # context manager doing nothing, shared by all stages when instrumentation is disabled
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        return(False)
+
+NULL_STAGE = NullStage()
+
+
+class Instrumentation:
+    """
+    Messages of readers and writers. Stages, counters and progress cost nothing here, see Profiler to record them.
+    """
+    enabled = False
+
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+
+    def info(self, message):
+        # one write per message, so that messages of writers running in threads are not interleaved
+        if self.verbose: print('[INFO] {}\n'.format(message), end='')
+
+    def stage(self, name):
+        return(NULL_STAGE)
+
+    def time_iter(self, iterable, name):
+        return(iterable)
+
+    def track(self, records, prefix):
+        return(records)
+
+    def count(self, name, value=1):
+        pass
+
+    def set_total(self, total):
+        pass
+
+    def finish(self):
+        pass
+
+NO_INSTRUMENTATION = Instrumentation()
+
+
+class DeferredFinish:
+    """
+    Instrumentation given to a reader whose annotations are then written: the reader's finish does nothing,
+    the instrumentation is finished once by the writer.
+    """
+    def __init__(self, instrument):
+        self.instrument = instrument
+
+    def __getattr__(self, name):
+        return(getattr(self.instrument, name))
+
+    def finish(self):
+        pass
+
+
+def defer_finish(instrument):
+    """
+    input: instrument: Instrumentation object or None
+
+    output: instrument whose finish does nothing, None if instrument is None
+    """
+    return(DeferredFinish(instrument) if instrument else None)
+
+
+def print_progress(progress):
+    """
+    Default progress callback of Profiler.
+
+    input: progress: dict given by Profiler.get_progress
+    """
+    total = '/{}'.format(progress['total']) if progress['total'] else ''
+    eta = ', ETA {}'.format(timedelta(seconds=int(progress['eta']))) if progress['eta'] is not None else ''
+    print('[INFO] {}{} images ({:.1f} images/s){}'.format(progress['images'], total, progress['rate'], eta))
+
+
+class Profiler(Instrumentation):
+    """
+    Record time spent in each stage, counters and progress of conversions.
+
+    Stages are exclusive: time of a stage started inside another one (e.g. reading images while a writer
+    pulls them from a stream) is not counted in the outer stage.
+    """
+    enabled = True
+
+    def __init__(self, progress=print_progress, interval=5.0, reportFname=None, verbose=True):
+        """
+        input: progress: function called with a dict of progress informations (see get_progress) every interval seconds, None to disable
+               interval: minimum number of seconds between two progress calls
+               reportFname: JSON file where the profile report (see get_report) is written when a conversion ends, None to disable
+               verbose: print readers and writers messages
+        """
+        Instrumentation.__init__(self, verbose)
+        self.progress = progress
+        self.interval = interval
+        self.reportFname = reportFname
+        self.stages = {}
+        self.counters = {}
+        self.stack = []
+        self.total = None
+        self.start = time.perf_counter()
+        self.lastProgress = self.start
+
+    def stage(self, name):
+        return(Stage(self, name))
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack: self.add_time(self.stack[-1][0], now - self.stack[-1][1])
+        self.stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, mark = self.stack.pop()
+        self.add_time(name, now - mark)
+        if self.stack: self.stack[-1][1] = now
+        return(name)
+
+    def add_time(self, name, seconds):
+        if name not in self.stages: self.stages[name] = {'seconds': 0.0, 'calls': 0}
+        self.stages[name]['seconds'] += seconds
+
+    def time_iter(self, iterable, name):
+        # time spent getting each item, e.g. from a process pool or a tf.data pipeline
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.exit()
+                return
+            except BaseException:
+                self.exit()
+                raise
+            self.exit()
+            self.stages[name]['calls'] += 1
+            yield(item)
+
+    def track(self, records, prefix):
+        # count images records and their bboxs going through a reader (prefix 'read'), a writer (prefix 'written')
+        # or a MultiWriter giving them to its targets (prefix 'dispatched')
+        imagesKey = 'images_{}'.format(prefix)
+        bboxsKey = 'bboxs_{}'.format(prefix)
+        for record in records:
+            self.count(imagesKey)
+            self.count(bboxsKey, record['bboxs'].get_num_bboxs())
+            now = time.perf_counter()
+            if self.progress and now - self.lastProgress >= self.interval:
+                self.lastProgress = now
+                self.progress(self.get_progress(now))
+            yield(record)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def merge(self, profiler, prefix):
+        # stages and counters of a profiler used in another thread (e.g. a MultiWriter target), names prefixed with prefix/
+        for name, stage in profiler.stages.items():
+            key = '{}/{}'.format(prefix, name)
+            self.add_time(key, stage['seconds'])
+            self.stages[key]['calls'] += stage['calls']
+        for name, value in profiler.counters.items():
+            self.count('{}/{}'.format(prefix, name), value)
+
+    def set_total(self, total):
+        self.total = total
+
+    def get_progress(self, now=None):
+        """
+        output: dict of 'images' done, 'total' images (None if unknown), 'elapsed' seconds, 'rate' in images/s and 'eta' in seconds (None if unknown)
+        """
+        elapsed = (now or time.perf_counter()) - self.start
+        images = max(self.counters.get('images_{}'.format(prefix), 0) for prefix in ('read', 'written', 'dispatched'))
+        rate = images / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - images) / rate if self.total and rate > 0 else None
+        return({'images': images, 'total': self.total, 'elapsed': elapsed, 'rate': rate, 'eta': eta})
+
+    def get_report(self):
+        """
+        output: dict of 'elapsed' seconds, 'stages' (seconds and calls of each stage), 'counters' and 'rates' (per second)
+        """
+        elapsed = time.perf_counter() - self.start
+        return({'elapsed': elapsed,
+                'stages': {name: dict(stage) for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])},
+                'counters': dict(self.counters),
+                'rates': {name: value / elapsed for name, value in self.counters.items()} if elapsed > 0 else {}})
+
+    def finish(self):
+        report = self.get_report()
+        stages = ', '.join('{} {:.2f}s'.format(name, stage['seconds']) for name, stage in report['stages'].items())
+        self.info('Profile: {:.2f}s, {} images, stages: {}'.format(report['elapsed'], self.get_progress()['images'], stages or 'none'))
+        if self.reportFname:
+            reportOpen = open(self.reportFname, 'w')
+            json.dump(report, reportOpen, indent=2)
+            reportOpen.close()
+            self.info('Profile report written at {}'.format(self.reportFname))
+
+
+class Stage:
+    # context manager timing a stage of a Profiler
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+        return(self)
+
+    def __exit__(self, *args):
+        self.profiler.exit()
+        self.profiler.stages[self.name]['calls'] += 1
+        return(False)
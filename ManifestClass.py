@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+
+from Instrumentation import NO_INSTRUMENTATION
+
+class ConversionManifest:
+    """
+    Record of a conversion, used to convert again only what changed since the last run.
+    
+    For each source (annotation file and its image) the manifest keeps size, modification time and content hash
+    of its files and the output files written from it. Readers skip unchanged sources, writers record their outputs,
+    then delete outputs of sources which no longer exist. Categories are kept so that IDs stay the same across runs.
+    """
+    VERSION = 1
+    
+    def __init__(self, manifestFname):
+        self.manifestFname = os.path.abspath(manifestFname)
+        self.entries = {}
+        self.shared = {}
+        self.categories = []
+        self.seen = set()
+        self.pending = {}
+        self.forceAll = False
+        self.numChanged = 0
+        self.numUnchanged = 0
+        
+        if os.path.isfile(self.manifestFname):
+            manifestOpen = open(self.manifestFname, 'r')
+            content = json.load(manifestOpen)
+            manifestOpen.close()
+            if content.get('version') == self.VERSION:
+                self.entries = content['sources']
+                self.shared = content['shared']
+                self.categories = content['categories']
+    
+    @staticmethod
+    def default_fname(outputDir):
+        # manifest stored next to the output folder
+        return(os.path.abspath(outputDir).rstrip(os.sep) + '.manifest.json')
+    
+    def file_signature(self, path, previous=None):
+        # content is hashed only if size or modification time changed
+        stat = os.stat(path)
+        if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+            return(previous)
+        digest = hashlib.sha1()
+        fileOpen = open(path, 'rb')
+        for chunk in iter(lambda: fileOpen.read(1<<20), b''):
+            digest.update(chunk)
+        fileOpen.close()
+        return([stat.st_size, stat.st_mtime_ns, digest.hexdigest()])
+    
+    def check_shared(self, path):
+        """
+        Check a file all sources depend on (classes names file for instance), all sources are converted again if it changed.
+        """
+        path = os.path.abspath(path)
+        previous = self.shared.get(path)
+        signature = self.file_signature(path, previous)
+        if not previous or previous[2] != signature[2]:
+            self.forceAll = True
+        self.shared[path] = signature
+    
+    def check(self, sourceFiles):
+        """
+        Check if a source changed since the last run.
+        
+        input: sourceFiles: files of one source, the first one identifies the source
+        
+        output: True if the source is new or changed and must be converted, False otherwise
+        """
+        key = sourceFiles[0]
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        previousFiles = entry['files'] if entry else {}
+        
+        changed = self.forceAll or entry is None or set(previousFiles) != set(sourceFiles)
+        signatures = {}
+        for path in sourceFiles:
+            signatures[path] = self.file_signature(path, previousFiles.get(path))
+            if path not in previousFiles or previousFiles[path][2] != signatures[path][2]: changed = True
+        
+        if changed:
+            # signatures are stored once outputs have been written
+            self.pending[key] = signatures
+            self.numChanged += 1
+        else:
+            entry['files'] = signatures
+            self.numUnchanged += 1
+        return(changed)
+    
+    def set_outputs(self, sourceFiles, outputs):
+        # outputs written by a previous run and not anymore are deleted
+        key = sourceFiles[0]
+        entry = self.entries.get(key)
+        if entry:
+            for output in set(entry['outputs']) - set(outputs):
+                if os.path.isfile(output): os.remove(output)
+        # sources not checked by the reader (manifest given to the writer only) are written, so they are seen too
+        if key not in self.seen:
+            self.seen.add(key)
+            self.numChanged += 1
+        signatures = self.pending.pop(key, None) or {path: self.file_signature(path) for path in sourceFiles}
+        self.entries[key] = {'files': signatures, 'outputs': list(outputs)}
+    
+    def remove_unseen(self):
+        """
+        Delete outputs of sources which have not been checked during this run.
+        
+        output: the number of removed sources
+        """
+        removed = [key for key in self.entries if key not in self.seen]
+        for key in removed:
+            for output in self.entries[key]['outputs']:
+                if os.path.isfile(output): os.remove(output)
+            del self.entries[key]
+        return(len(removed))
+    
+    def load_categories(self, mediatorCateg):
+        # categories of previous runs keep their IDs
+        for categ in self.categories:
+            mediatorCateg.append(ID=categ['id'], name=categ['name'], supercategory=categ['supercategory'])
+    
+    def finish(self, mediatorCateg, instrument=NO_INSTRUMENTATION):
+        """
+        Remove outputs of deleted sources, keep categories and save the manifest, called by writers once all records are written.
+        """
+        numRemoved = self.remove_unseen()
+        self.categories = [dict(categ) for categ in mediatorCateg.list]
+        instrument.count('sources_changed', self.numChanged)
+        instrument.count('sources_unchanged', self.numUnchanged)
+        instrument.count('sources_removed', numRemoved)
+        instrument.info('Incremental conversion: {} sources converted, {} unchanged, {} removed.'.format(self.numChanged, self.numUnchanged, numRemoved))
+        self.save()
+    
+    def save(self):
+        content = {'version': self.VERSION, 'shared': self.shared, 'categories': self.categories, 'sources': self.entries}
+        tmpFname = self.manifestFname + '.tmp'
+        manifestOpen = open(tmpFname, 'w')
+        json.dump(content, manifestOpen)
+        manifestOpen.close()
+        os.replace(tmpFname, self.manifestFname)
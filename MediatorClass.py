@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import numpy as np
+from array import array
+from collections.abc import MutableMapping
 from datetime import datetime
 now = datetime.now()
 
@@ -22,6 +26,9 @@ class Mediator:
         self.infoUrl = kwargs.get('infoUrl', "http://unknown.org")
         self.infoDateCreated = kwargs.get('infoDateCreated', str(now.date()))
         
+        # ConversionManifest the images were read with, unchanged sources are then missing
+        self.manifest = kwargs.get('manifest', None)
+        
     def set_obj_list(self, objList):
         assert type(objList) is MediatorImages, 'objList must be a MediatorImages object.'
         self.objects = objList
@@ -30,6 +37,77 @@ class Mediator:
     def set_categ(self, objCateg):
         assert type(objCateg) is MediatorCategories, 'objCateg must be a MediatorCategories object.'
         self.categories = objCateg
+    
+    def iter_records(self):
+        # images records in the same layout as MediatorImages.list items
+        return(iter(self.imgList.list))
+    
+    def categories_complete(self):
+        # categories are known before records are browsed
+        return(True)
+    
+    def shares(self, name):
+        # derived data computed once for several writers, see MediatorBranch
+        return(False)
+    
+    def get_derived(self, record, name):
+        """
+        Data derived from an image record by writers, e.g. its normalised bboxs.
+        
+        input: record: images record given by iter_records
+               name: one of DERIVED_DATA keys
+        
+        output: the derived data
+        """
+        return(DERIVED_DATA[name](self, record))
+        
+
+class MediatorStream(Mediator):
+    """
+    Mediator whose images are produced one by one by a reader instead of being stored.
+    
+    Records have the same layout as MediatorImages.list items and can be browsed only once.
+    Categories are filled while reading for formats without a labels file (PascalVOC),
+    they are complete only once all records have been browsed.
+    """
+    def __init__(self, records=(), *args, **kwargs):
+        Mediator.__init__(self, *args, **kwargs)
+        self.imgList = None
+        self.records = records
+        self.numImgs = 0
+        self.numBboxs = 0
+    
+    def iter_records(self):
+        for record in self.records:
+            yield(record)
+    
+    def categories_complete(self):
+        return(False)
+    
+    def create_record(self, handlepath=True, *args, **kwargs):
+        self.numImgs += 1
+        kwargs.setdefault('ID', self.numImgs)
+        return(create_img_record(handlepath, **kwargs))
+    
+    def get_new_bbox_id(self):
+        self.numBboxs += 1
+        return(self.numBboxs)
+    
+    def get_new_bbox_ids(self, numBboxs):
+        # IDs of numBboxs new bboxs at once
+        self.numBboxs += numBboxs
+        return(np.arange(self.numBboxs - numBboxs + 1, self.numBboxs + 1, dtype=np.int64))
+    
+    def to_mediator(self):
+        # browse all records and store them
+        mediatorImgs = MediatorImages()
+        for record in self.iter_records():
+            mediatorImgs.append_record(record)
+        mediatorImgs.numBboxs = self.numBboxs
+        
+        return(Mediator(objImgs=mediatorImgs, objCateg=self.categList, licenses=self.licenses,
+                        infoYear=self.infoYear, infoVersion=self.infoVersion, infoDes=self.infoDes,
+                        infoCont=self.infoCont, infoUrl=self.infoUrl, infoDateCreated=self.infoDateCreated, manifest=self.manifest))
         
     
 class MediatorCategories:
@@ -38,26 +116,32 @@ class MediatorCategories:
         self.numClasses = 0
         self.numSuperC = 0
         
+        # (name, supercategory) -> ID and ID -> (name, supercategory), IDs appended more than once are kept apart
+        self.nameIndex = {}
+        self.idIndex = {}
+        self.duplicates = set()
+        self.superCs = set()
+        
     def append(self, name, ID=None, supercategory='Unspecified'):
         if not ID: ID=self.numClasses+1
         
         if self.isnewClass(name, supercategory):
             if self.isnewSuperC(supercategory):
                 self.numSuperC += 1
+                self.superCs.add(supercategory)
             self.list.append({'id':int(ID), 'name':name, 'supercategory':supercategory})
             self.numClasses += 1
+            
+            # keep indexes up to date
+            self.nameIndex[(name, supercategory)] = int(ID)
+            if int(ID) in self.idIndex: self.duplicates.add(int(ID))
+            else: self.idIndex[int(ID)] = (name, supercategory)
     
     def isnewClass(self, name, supercategory):
-        for classe in self.list:
-            if classe['supercategory']==supercategory and classe['name']==name:
-                return(False)
-        return(True)
+        return((name, supercategory) not in self.nameIndex)
     
     def isnewSuperC(self, supercategory):
-        for classe in self.list:
-            if classe['supercategory']==supercategory:
-                return(False)
-        return(True)
+        return(supercategory not in self.superCs)
     
     def get_num_classes(self):
         return(self.numClasses)
@@ -66,16 +150,14 @@ class MediatorCategories:
         return(self.numSuperC)
     
     def get_label_num(self, className, supercategory='Unspecified'):
-        match = [classe for classe in self.list if classe['name']==className and classe['supercategory']==supercategory]
-        if len(match)>1: raise(Exception('Multiple classes have the class name {} and superclass name {}. Check your data or add supercategory to differentiate same classes names.'.format(className, supercategory)))
-        if len(match)==0: raise(Exception('No object has class name {} and superclass name {}.'.format(className, supercategory)))
-        return(match[0]['id'])
+        # append refuses an existing (name, supercategory) pair, so a match is always unique
+        if (className, supercategory) not in self.nameIndex: raise(Exception('No object has class name {} and superclass name {}.'.format(className, supercategory)))
+        return(self.nameIndex[(className, supercategory)])
     
     def get_class_name(self, labelNumber):
-        match = [classe for classe in self.list if classe['id']==labelNumber]
-        if len(match)>1: raise(Exception('Multiple classes have the ID {}. Check your ID assignment.'.format(labelNumber)))
-        if len(match)==0: raise(Exception('No object has label ID {}.'.format(labelNumber)))
-        return(match[0]['name'], match[0]['supercategory'])
+        if labelNumber in self.duplicates: raise(Exception('Multiple classes have the ID {}. Check your ID assignment.'.format(labelNumber)))
+        if labelNumber not in self.idIndex: raise(Exception('No object has label ID {}.'.format(labelNumber)))
+        return(self.idIndex[labelNumber])
 
     
 class MediatorImages:
@@ -84,48 +166,26 @@ class MediatorImages:
         self.numImgs = 0
         self.numBboxs = 0
         self.numSubboxs = 0
+        
+        # ID -> position in self.list, IDs appended more than once are kept apart
+        self.index = {}
+        self.duplicates = set()
+        
+        # bboxs of all images, stored in one table
+        self.bboxTable = MediatorBboxTable()
     
     def append(self, handlepath=True, *args, **kwargs):
+        kwargs.setdefault('ID', self.numImgs+1)
+        self.append_record(create_img_record(handlepath, **kwargs))
+    
+    def append_record(self, record):
         self.numImgs += 1
+        record['bboxs'].move_to(self.bboxTable)
+        self.list.append(record)
         
-        ID = kwargs.get('ID', self.numImgs)
-        path = kwargs.get('path', None)
-        folder = kwargs.get('folder', None)
-        fname = kwargs.get('fname', None)
-        
-        width = kwargs.get('width', 0)
-        height = kwargs.get('height', 0)
-        depth = kwargs.get('depth', 0)
-
-        sourceName = kwargs.get('sourceName', 'Unknown')
-        sourceImg = kwargs.get('sourceImg', 'Unknown')
-        sourceAnnot = kwargs.get('sourceAnnot', 'Unknown')
-        
-        licenseID = kwargs.get('licenseID', 1)
-        segmented = kwargs.get('segmented', 0)
-        dateCaptured = kwargs.get('date_captured', None)
-        cocoURL = kwargs.get('cocoURL', None)
-        flickrURL = kwargs.get('flickrURL', None)
-
-        bboxs = kwargs.get('bboxs', MediatorBboxs())
-        
-        # in case handlepath is enable
-        if handlepath:
-            if path and not fname and not folder:
-                path = os.path.abspath(path)
-                folder = os.path.basename(os.path.dirname(path))
-                fname = os.path.basename(path)
-            elif not path and fname and folder:
-                path = os.path.join(folder, fname)
-                path = os.path.abspath(path)
-            elif fname and not path and not folder:
-                path = os.path.abspath(fname)
-
-        self.list.append({'id':ID, 'width':width, 'height':height, 'depth':depth,
-                          'path':path, 'folder':folder, 'fname':fname, 'license':licenseID,
-                          'sourceName':sourceName, 'sourceImg':sourceImg, 'sourceAnnot':sourceAnnot,
-                          'segmented':segmented, 'date_captured':dateCaptured, 'flickrURL':flickrURL, 'cocoURL':cocoURL,
-                          'bboxs':bboxs})
+        # keep ID index up to date
+        if record['id'] in self.index: self.duplicates.add(record['id'])
+        else: self.index[record['id']] = len(self.list)-1
         
     def get_num_imgs(self):
         return(self.numImgs)
@@ -137,23 +197,15 @@ class MediatorImages:
         return(self.numSubboxs)
     
     def get_object(self, ID):
-        match = [obj for obj in self.list if obj['id']==ID]
-        if len(match)>1: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(ID)))
-        if len(match)==0: raise(Exception('No object has ID {}.'.format(ID)))
-        return(match[0])
+        return(self.list[self.get_arg_object(ID)])
     
     def get_arg_object(self, ID):
-        match = [index for index, classe in enumerate(self.list) if classe['id']==ID]
-        if len(match)>1: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(ID)))
-        if len(match)==0: raise(Exception('No object has ID {}.'.format(ID)))
-        return(match[0])
+        if ID in self.duplicates: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(ID)))
+        if ID not in self.index: raise(Exception('No object has ID {}.'.format(ID)))
+        return(self.index[ID])
     
     def get_image_format(self, ID):
-        match = [obj for obj in self.list if obj['id']==ID]
-        if len(match)>1: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(ID)))
-        if len(match)==0: raise(Exception('No object has ID {}.'.format(ID)))
-        ext = os.path.basename(match[0]['path']).split(".")[1]
-        return(ext)
+        return(get_path_format(self.get_object(ID)['path']))
     
     def get_new_bbox_id(self):
         self.numBboxs += 1
@@ -163,10 +215,191 @@ class MediatorImages:
         self.numSubboxs += 1
         return(self.numSubboxs)
 
+
+def create_img_record(handlepath=True, *args, **kwargs):
+    ID = kwargs.get('ID', None)
+    path = kwargs.get('path', None)
+    folder = kwargs.get('folder', None)
+    fname = kwargs.get('fname', None)
+    
+    width = kwargs.get('width', 0)
+    height = kwargs.get('height', 0)
+    depth = kwargs.get('depth', 0)
+
+    sourceName = kwargs.get('sourceName', 'Unknown')
+    sourceImg = kwargs.get('sourceImg', 'Unknown')
+    sourceAnnot = kwargs.get('sourceAnnot', 'Unknown')
+    
+    licenseID = kwargs.get('licenseID', 1)
+    segmented = kwargs.get('segmented', 0)
+    dateCaptured = kwargs.get('date_captured', None)
+    cocoURL = kwargs.get('cocoURL', None)
+    flickrURL = kwargs.get('flickrURL', None)
+    sourceFiles = kwargs.get('sourceFiles', None) # files the record was read from, used by incremental conversions
+
+    bboxs = kwargs.get('bboxs', None)
+    if bboxs is None: bboxs = MediatorBboxs()
+    
+    # in case handlepath is enable
+    if handlepath:
+        if path and not fname and not folder:
+            path = os.path.abspath(path)
+            folder = os.path.basename(os.path.dirname(path))
+            fname = os.path.basename(path)
+        elif not path and fname and folder:
+            path = os.path.join(folder, fname)
+            path = os.path.abspath(path)
+        elif fname and not path and not folder:
+            path = os.path.abspath(fname)
+
+    # values repeated across images are stored once
+    return(MediatorImage(ID, width, height, depth, path, intern_value(folder), fname, licenseID,
+                         intern_value(sourceName), intern_value(sourceImg), intern_value(sourceAnnot), intern_value(segmented),
+                         intern_value(dateCaptured), flickrURL, cocoURL, None if sourceFiles is None else tuple(sourceFiles), bboxs))
+
+def intern_value(value):
+    if type(value) is str: return(sys.intern(value))
+    return(value)
+
+def get_path_format(path):
+    return(os.path.basename(path).split(".")[1])
+
+
+# images records fields, in the order of MediatorImage arguments
+IMG_FIELDS = ('id', 'width', 'height', 'depth', 'path', 'folder', 'fname', 'license',
+              'sourceName', 'sourceImg', 'sourceAnnot', 'segmented', 'date_captured', 'flickrURL', 'cocoURL',
+              'sourceFiles', 'bboxs')
+IMG_FIELDS_SET = frozenset(IMG_FIELDS)
+
+class MediatorImage(MutableMapping):
+    """ One image record, with dict-like access to its fields (IMG_FIELDS) and the memory of a slotted object. """
+    __slots__ = IMG_FIELDS
+    
+    def __init__(self, ID, width, height, depth, path, folder, fname, licenseID, sourceName, sourceImg, sourceAnnot,
+                 segmented, dateCaptured, flickrURL, cocoURL, sourceFiles, bboxs):
+        self.id = ID
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.path = path
+        self.folder = folder
+        self.fname = fname
+        self.license = licenseID
+        self.sourceName = sourceName
+        self.sourceImg = sourceImg
+        self.sourceAnnot = sourceAnnot
+        self.segmented = segmented
+        self.date_captured = dateCaptured
+        self.flickrURL = flickrURL
+        self.cocoURL = cocoURL
+        self.sourceFiles = sourceFiles
+        self.bboxs = bboxs
+    
+    def __getitem__(self, key):
+        if key not in IMG_FIELDS_SET: raise(KeyError(key))
+        return(getattr(self, key))
+    
+    def __setitem__(self, key, value):
+        if key not in IMG_FIELDS_SET: raise(KeyError(key))
+        setattr(self, key, value)
+    
+    def __delitem__(self, key):
+        raise(Exception('Image fields cannot be deleted.'))
+    
+    def __iter__(self):
+        return(iter(IMG_FIELDS))
+    
+    def __len__(self):
+        return(len(IMG_FIELDS))
+    
+    def __repr__(self):
+        return(repr(dict(self)))
+
+
+# bbox numeric columns and their array typecodes, pose is kept apart as a list of strings
+BBOX_COLUMNS = {'id':'q', 'labelID':'q',
+                'x':'d', 'y':'d', 'width':'d', 'height':'d',
+                'truncated':'i', 'occluded':'i', 'difficult':'i', 'iscrowd':'i', 'intCoords':'b'}
+NO_ID = -1 # stored in 'id' column when no ID is given
+# values of columns not given, as in MediatorBboxs.append
+BBOX_DEFAULTS = {'id':NO_ID, 'labelID':0, 'x':np.nan, 'y':np.nan, 'width':np.nan, 'height':np.nan,
+                 'truncated':0, 'occluded':0, 'difficult':0, 'iscrowd':0, 'intCoords':0}
+# coordinates are stored as floats, missing ones as nan, 'intCoords' has the bit of each coordinate given as an integer
+COORD_BITS = {'x':1, 'y':2, 'width':4, 'height':8}
+# fields of a bbox seen through MediatorBboxView
+BBOX_FIELDS = tuple(key for key in BBOX_COLUMNS if key != 'intCoords') + ('pose',)
+
+def is_int(value):
+    return(isinstance(value, (int, np.integer)) and not isinstance(value, bool))
+
+def get_coord(value, isInt):
+    # coordinate as it was given
+    if value != value: return(None)
+    if isInt: return(int(value))
+    return(value)
+
+class MediatorBboxTable:
+    """
+    Bboxs of many images in one typed array per column (see BBOX_COLUMNS) and a list of poses.
+    
+    MediatorBboxs objects are rows start to start+numBboxs of a table, so that images with few bboxs
+    do not each allocate a set of columns.
+    """
+    __slots__ = ('columns', 'poses')
+    
+    def __init__(self, columns=None, poses=None):
+        # given columns must have the same length as poses
+        self.columns = columns or {key: array(typecode) for key, typecode in BBOX_COLUMNS.items()}
+        self.poses = poses if poses is not None else []
+    
+    def __len__(self):
+        return(len(self.poses))
+    
+    def extend(self, bboxs):
+        # append rows of a MediatorBboxs, output: position of its first row
+        start = len(self.poses)
+        for key, column in self.columns.items():
+            column.extend(bboxs.table.columns[key][bboxs.start:bboxs.start+bboxs.numBboxs])
+        self.poses.extend(bboxs.poses)
+        return(start)
+
+
 class MediatorBboxs:
-    def __init__(self):
-        self.list = []
-        self.numBboxs = 0
+    __slots__ = ('table', 'start', 'numBboxs')
+    
+    def __init__(self, columns=None, poses=None, table=None, start=0, numBboxs=None):
+        # bboxs have their own table unless rows of a shared table are given
+        self.table = table if table is not None else MediatorBboxTable(columns, poses)
+        self.start = start
+        self.numBboxs = len(self.table) - start if numBboxs is None else numBboxs
+    
+    @property
+    def columns(self):
+        # dict of typed arrays of each column, copies of the rows of a shared table
+        if self.start == 0 and self.numBboxs == len(self.table): return(self.table.columns)
+        return({key: column[self.start:self.start+self.numBboxs] for key, column in self.table.columns.items()})
+    
+    def get_column(self, key):
+        # typed array of one column, a copy of the rows of a shared table
+        column = self.table.columns[key]
+        if self.start == 0 and self.numBboxs == len(column): return(column)
+        return(column[self.start:self.start+self.numBboxs])
+    
+    @property
+    def poses(self):
+        if self.start == 0 and self.numBboxs == len(self.table): return(self.table.poses)
+        return(self.table.poses[self.start:self.start+self.numBboxs])
+    
+    def move_to(self, table):
+        # store rows in table, e.g. the table of all bboxs of a MediatorImages
+        if table is not self.table:
+            self.start, self.table = table.extend(self), table
+    
+    def detach(self):
+        # rows followed by other bboxs in a shared table are copied to their own table before adding more
+        if self.start + self.numBboxs != len(self.table):
+            self.table = MediatorBboxTable(self.columns, self.poses)
+            self.start = 0
 
     def append(self, *args, **kwargs):
         ID = kwargs.get('ID', None)
@@ -182,19 +415,145 @@ class MediatorBboxs:
         difficult = kwargs.get('difficult', 0)
         iscrowd = kwargs.get('iscrowd', 0)
         
-        self.list.append({'id':ID, 'labelID':labelID,
-                          'x':x, 'y':y, 'width':width, 'height':height,
-                          'pose':pose, 'truncated':truncated, 'occluded':occluded, 'difficult':difficult, 'iscrowd':iscrowd})
+        self.detach()
+        columns = self.table.columns
+        columns['id'].append(NO_ID if ID is None else int(ID))
+        columns['labelID'].append(int(labelID))
+        intCoords = 0
+        for key, value in (('x', x), ('y', y), ('width', width), ('height', height)):
+            columns[key].append(np.nan if value is None else float(value))
+            if is_int(value): intCoords |= COORD_BITS[key]
+        for key, value in (('truncated', truncated), ('occluded', occluded), ('difficult', difficult), ('iscrowd', iscrowd)):
+            columns[key].append(int(value))
+        columns['intCoords'].append(intCoords)
+        self.table.poses.append(pose)
         self.numBboxs += 1
+    
+    @property
+    def list(self):
+        # dict-like views kept for code browsing bboxs one by one, a tuple as bboxs are added by append only
+        return(tuple(MediatorBboxView(self, idx) for idx in range(self.numBboxs)))
         
     def get_num_bboxs(self):
         return(self.numBboxs)
     
+    def get_arrays(self):
+        """
+        output: a dict of numpy float or integer arrays, copies of each bbox column ('id', 'labelID', 'x', 'y', 'width', 'height',
+                'truncated', 'occluded', 'difficult', 'iscrowd', 'intCoords'), missing coordinates are nan
+        """
+        return({key: np.frombuffer(column, dtype=column.typecode, count=self.numBboxs, offset=self.start*column.itemsize).copy()
+                for key, column in self.table.columns.items()})
+    
+    def get_coords(self):
+        """
+        output: list of (x, y, width, height) of each bbox as they were given, integers stay integers and missing values are None
+        """
+        return([tuple(get_coord(value, intCoords & COORD_BITS[key]) for key, value in zip(COORD_BITS, coords))
+                for intCoords, coords in zip(self.get_column('intCoords'), zip(*[self.get_column(key) for key in COORD_BITS]))])
+    
     def get_object(self, ID):
-        match = [classe for classe in self.list if classe['id']==ID]
+        match = [idx for idx, boxID in enumerate(self.get_column('id')) if boxID==ID]
         if len(match)>1: raise(Exception('Multiple objects have the ID {}. Check the ID assignment.'.format(ID)))
         if len(match)==0: raise(Exception('No object has ID {}.'.format(ID)))
-        return(match[0])
+        return(MediatorBboxView(self, match[0]))
+
+
+def split_bboxs(offsets, **columns):
+    """
+    Create the MediatorBboxs of several images at once, from the columns of all their bboxs.
+    
+    input: offsets: list of numImgs+1 positions, bboxs of image i are rows offsets[i]:offsets[i+1]
+           columns: arrays of all bboxs values by column name (see BBOX_COLUMNS), and 'pose' as a list of strings.
+                    Columns not given take the same default values as MediatorBboxs.append.
+    
+    output: list of numImgs MediatorBboxs objects
+    """
+    # all bboxs are stored in one table, each image gets its rows
+    numBboxs = offsets[-1]
+    tableColumns = {}
+    for key, typecode in BBOX_COLUMNS.items():
+        if key in columns: values = np.ascontiguousarray(columns[key], dtype=typecode)
+        else: values = np.full(numBboxs, BBOX_DEFAULTS[key], dtype=typecode)
+        tableColumns[key] = array(typecode, values.tobytes())
+    poses = columns.get('pose', None)
+    table = MediatorBboxTable(tableColumns, list(poses) if poses is not None else ['Unspecified'] * numBboxs)
+    
+    return([MediatorBboxs(table=table, start=start, numBboxs=stop-start) for start, stop in zip(offsets[:-1], offsets[1:])])
+
+
+def get_relative_centers(mediator, record):
+    # bboxs centers and sizes divided by the image size (YOLO)
+    bboxs = record['bboxs'].get_arrays()
+    return({'x': (bboxs['x'] + bboxs['width']/2) / record['width'],
+            'y': (bboxs['y'] + bboxs['height']/2) / record['height'],
+            'width': bboxs['width'] / record['width'],
+            'height': bboxs['height'] / record['height']})
+
+def get_relative_corners(mediator, record):
+    # bboxs corners divided by the image size (TFRecord)
+    bboxs = record['bboxs'].get_arrays()
+    return({'xmin': bboxs['x'] / record['width'],
+            'xmax': (bboxs['x']+bboxs['width']) / record['width'],
+            'ymin': bboxs['y'] / record['height'],
+            'ymax': (bboxs['y']+bboxs['height']) / record['height']})
+
+def get_class_names(mediator, record):
+    # class name of each bbox
+    return([str(mediator.categList.get_class_name(labelID)[0]) for labelID in record['bboxs'].get_column('labelID')])
+
+def get_image_bytes(mediator, record):
+    # encoded image file, None if it is not on disk (e.g. COCO images to download)
+    if not os.path.isfile(record['path']): return(None)
+    with open(record['path'], 'rb') as imgOpen:
+        return(imgOpen.read())
+
+# data derived from images records by writers, name -> function(mediator, record)
+DERIVED_DATA = {'relative_centers': get_relative_centers,
+                'relative_corners': get_relative_corners,
+                'class_names': get_class_names,
+                'image_bytes': get_image_bytes}
+
+
+class MediatorBboxView(MutableMapping):
+    """ Dict-like access to one row of a MediatorBboxs object. """
+    __slots__ = ('bboxs', 'index')
+    
+    def __init__(self, bboxs, index):
+        self.bboxs = bboxs
+        self.index = index
+    
+    def __getitem__(self, key):
+        table, row = self.bboxs.table, self.bboxs.start + self.index
+        if key == 'pose': return(table.poses[row])
+        if key not in BBOX_FIELDS: raise(KeyError(key))
+        value = table.columns[key][row]
+        if key == 'id' and value == NO_ID: return(None)
+        if key in COORD_BITS: return(get_coord(value, table.columns['intCoords'][row] & COORD_BITS[key]))
+        return(value)
+    
+    def __setitem__(self, key, value):
+        if key not in BBOX_FIELDS: raise(KeyError(key))
+        table, row = self.bboxs.table, self.bboxs.start + self.index
+        if key == 'pose': table.poses[row] = value
+        elif key == 'id': table.columns[key][row] = NO_ID if value is None else value
+        elif key in COORD_BITS:
+            table.columns[key][row] = np.nan if value is None else float(value)
+            intCoords = table.columns['intCoords'][row] & ~COORD_BITS[key]
+            table.columns['intCoords'][row] = intCoords | COORD_BITS[key] if is_int(value) else intCoords
+        else: table.columns[key][row] = value
+    
+    def __delitem__(self, key):
+        raise(Exception('Bbox fields cannot be deleted.'))
+    
+    def __iter__(self):
+        return(iter(BBOX_FIELDS))
+    
+    def __len__(self):
+        return(len(BBOX_FIELDS))
+    
+    def __repr__(self):
+        return(repr(dict(self)))
     
     
 class MediatorSubBoxs:
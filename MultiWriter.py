@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from FormatRegistry import FORMATS, get_writer
+from Instrumentation import NO_INSTRUMENTATION, Profiler
+from MediatorClass import Mediator, DERIVED_DATA
+
+# markers put in the queues of the targets after the last record
+END_OF_RECORDS = object()
+ABORT = object()
+# number of images given at once to the targets, so that threads hand over to each other less often
+DISPATCH_BATCH = 64
+
+
+class MediatorBranch(Mediator):
+    """
+    Records of a mediator browsed once by a MultiWriter, given to one of its targets through a bounded queue.
+
+    Other attributes (categories, licenses, informations) are the ones of the browsed mediator.
+    Derived data used by several targets (see MediatorClass.DERIVED_DATA) is computed once per image and shared between them.
+    """
+    def __init__(self, source, sharedNames, lock, queueSize=256):
+        self.source = source
+        self.sharedNames = sharedNames
+        self.lock = lock
+        self.queue = queue.Queue(max(1, queueSize // DISPATCH_BATCH))
+        self.current = None # (record, its shared derived data) last given to the target
+        self.exhausted = False
+
+    def __getattr__(self, name):
+        if name == 'source': raise(AttributeError(name))
+        return(getattr(self.source, name))
+
+    def iter_records(self):
+        while True:
+            item = self.queue.get()
+            if item is END_OF_RECORDS or item is ABORT:
+                self.exhausted = True
+                self.current = None
+                if item is ABORT: raise(Exception('Writing has been aborted, another target or the reader failed.'))
+                return
+            for current in item:
+                self.current = current
+                yield(current[0])
+
+    def drain(self):
+        # records left when the target stopped early, so that the MultiWriter is never blocked
+        while not self.exhausted:
+            item = self.queue.get()
+            if item is END_OF_RECORDS or item is ABORT: self.exhausted = True
+
+    def categories_complete(self):
+        return(self.source.categories_complete())
+    
+    def shares(self, name):
+        return(name in self.sharedNames)
+
+    def get_derived(self, record, name):
+        if name not in self.sharedNames or self.current is None or self.current[0] is not record:
+            return(DERIVED_DATA[name](self.source, record))
+        # the first target asking for it computes it, the others wait for its result.
+        # the lock is only held to find who computes, so that different images are read in parallel
+        derived = self.current[1]
+        with self.lock:
+            future = derived.get(name)
+            compute = future is None
+            if compute: future = derived[name] = Future()
+        if compute:
+            try:
+                future.set_result(DERIVED_DATA[name](self.source, record))
+            except BaseException as error:
+                future.set_exception(error)
+        return(future.result())
+
+
+class TargetProfiler(Profiler):
+    """
+    Profiler of one MultiWriter target, its profile is merged in the profile of the MultiWriter instead of being reported by the writer.
+    """
+    def __init__(self, verbose=True):
+        Profiler.__init__(self, progress=None, verbose=verbose)
+
+    def finish(self):
+        pass
+
+
+class MultiWriter:
+    def __init__(self):
+        self.mediator = Mediator()
+        self.targets = []
+        self.queueSize = 256
+        self.instrument = NO_INSTRUMENTATION
+        self.error = None # first error of a target, the others are aborted
+
+    def set_mediator(self, mediator):
+        assert isinstance(mediator, Mediator), 'mediator variable must be a Mediator or MediatorStream object.'
+        self.mediator = mediator
+
+    def set_targets(self, targets):
+        assert len(targets) >= 1, 'targets must contain at least one (format, writeArgs) pair.'
+        for fmt, writeArgs in targets:
+            assert fmt in FORMATS, 'Unknown format {}, available formats: {}.'.format(fmt, ', '.join(FORMATS))
+            assert 'mediator' not in writeArgs and 'instrument' not in writeArgs, 'mediator and instrument are given by MultiWriter, not by writeArgs.'
+        assert sum('manifest' in writeArgs for _, writeArgs in targets) <= 1, 'a manifest can be given to one target only.'
+        self.targets = [(fmt, dict(writeArgs)) for fmt, writeArgs in targets]
+
+    def set_queue_size(self, queueSize):
+        assert int(queueSize) >= 1, 'queueSize must be a positive number of images.'
+        self.queueSize = int(queueSize)
+
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+
+    def get_labels(self):
+        # name of each target in messages and profiles, formats written several times are numbered
+        formats = [fmt for fmt, _ in self.targets]
+        return([fmt if formats.count(fmt) == 1 else '{}{}'.format(fmt, formats[:idx+1].count(fmt)) for idx, fmt in enumerate(formats)])
+
+    def get_shared_names(self, writers):
+        # derived data used by more than one target
+        names = [name for writer in writers for name in getattr(writer, 'derivedData', ())]
+        return(frozenset(name for name in names if names.count(name) > 1))
+
+    def write_target(self, writer, branch, writeArgs, instrument):
+        try:
+            writer.write(mediator=branch, instrument=instrument, **writeArgs)
+        except BaseException as error:
+            if self.error is None: self.error = error
+            raise
+        finally:
+            branch.drain()
+
+    def write_annot(self):
+        self.error = None
+        writers = [get_writer(fmt)() for fmt, _ in self.targets]
+        sharedNames = self.get_shared_names(writers)
+        lock = threading.Lock()
+        branches = [MediatorBranch(self.mediator, sharedNames, lock, self.queueSize) for _ in writers]
+        # each target is profiled apart as stages of threads can not be nested, their profiles are merged at the end
+        instruments = [TargetProfiler(self.instrument.verbose) if self.instrument.enabled else self.instrument for _ in writers]
+
+        with ThreadPoolExecutor(max_workers=len(writers)) as pool:
+            for writer, branch, (_, writeArgs), instrument in zip(writers, branches, self.targets, instruments):
+                pool.submit(self.write_target, writer, branch, writeArgs, instrument)
+
+            # the mediator is browsed once, each record is given to every target with a dict of its shared derived data
+            end = ABORT
+            records = self.instrument.track(self.mediator.iter_records(), 'dispatched')
+            try:
+                while self.error is None:
+                    batch = [(record, {}) for _, record in zip(range(DISPATCH_BATCH), records)]
+                    if not batch:
+                        end = END_OF_RECORDS
+                        break
+                    with self.instrument.stage('dispatch'):
+                        for branch in branches:
+                            branch.queue.put(batch)
+            finally:
+                for branch in branches:
+                    branch.queue.put(end)
+
+        if self.error is not None: raise(self.error)
+
+        if self.instrument.enabled:
+            for label, instrument in zip(self.get_labels(), instruments):
+                self.instrument.merge(instrument, label)
+
+    def write(self, mediator, targets, queueSize=256, instrument=None):
+        """
+        Translate Mediator class object to several formats at once. The mediator is browsed once and each image is given
+        to the writers of all targets, running in their own threads.
+
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
+               targets: list of (format name, dict of arguments of the writer write method except mediator and instrument), e.g.
+                        [('yolo', {'outputAnnotDir': ..., 'outputNamesFname': ...}), ('coco', {'outputAnnotFile': ...})]
+               queueSize: number of images each target can be behind the fastest one
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           stages and counters of each target are reported with its format as prefix (e.g. 'yolo/write')
+        """
+        # set variables
+        self.set_mediator(mediator)
+        self.set_targets(targets)
+        self.set_queue_size(queueSize)
+        self.set_instrumentation(instrument)
+
+        # write files
+        self.instrument.info("Writing {} annotations ...".format(', '.join(self.get_labels())))
+        self.write_annot()
+        self.instrument.info("Successfully written {} annotations".format(', '.join(self.get_labels())))
+        self.instrument.finish()
@@ -2,103 +2,249 @@
 
 import os
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from Instrumentation import NO_INSTRUMENTATION
+from MediatorClass import Mediator, MediatorStream, MediatorCategories, MediatorBboxs
+
+def parse_xml_file(xmlFile): #https://stackoverflow.com/questions/53317592/reading-pascal-voc-annotations-in-python
+    """
+    Parse one PascalVOC annotation file, kept at module level so that it can run in worker processes.
+    
+    input: xmlFile: path of the PascalVOC annotation file
+    
+    output: a dict of image informations and a list of bboxs tuples (class name, xmin, ymin, width, height, pose, truncated, occluded, difficult)
+    """
+    tree = ET.parse(xmlFile)
+    root = tree.getroot()
+    
+    height= int(root.find('size/height').text)
+    width= int(root.find('size/width').text)
+    depth= int(root.find('size/depth').text)
+    
+    try: path = root.find('path').text
+    except: path = xmlFile.replace('.xml','.jpg')
+    
+    try: sourceName = root.find('source/database').text
+    except: sourceName = 'Unknown'
+    
+    try: sourceAnnot = root.find('source/annotation').text
+    except: sourceAnnot = 'Unknown'
+    
+    try: sourceImg = root.find('source/image').text
+    except: sourceImg = 'Unknown'
+    
+    try: segmented = root.find('segmented').text
+    except: segmented = 0
+    
+    bboxs = []
+    for boxes in root.iter('object'):
+        classe = boxes.find("name").text
+        ymin = float(boxes.find("bndbox/ymin").text)
+        xmin = float(boxes.find("bndbox/xmin").text)
+        bboxW = float(boxes.find("bndbox/xmax").text) - xmin
+        bboxH = float(boxes.find("bndbox/ymax").text) - ymin
+        
+        try: pose = boxes.find('pose').text
+        except: pose = 'Unspecified'
+        
+        try: truncated = int(boxes.find('truncated').text)
+        except: truncated = 0
+        
+        try: occluded = int(boxes.find('occluded').text)
+        except: occluded = 0
+        
+        try: difficult = int(boxes.find('difficult').text)
+        except: difficult = 0
+        
+        bboxs.append((classe, xmin, ymin, bboxW, bboxH, pose, truncated, occluded, difficult))
+    
+    imgInfo = {'path':path, 'height':height, 'width':width, 'depth':depth, 'sourceFiles':[xmlFile],
+               'sourceName':sourceName, 'sourceImg':sourceImg, 'sourceAnnot':sourceAnnot, 'segmented':segmented}
+    return(imgInfo, bboxs)
+
+
+# fixed parts of PascalVOC files, laid out as ElementTree output indented by PascalVocWriter.tree_indent
+VOC_SIZE_TEMPLATE = "\t<size>\n\t\t<width>{}</width>\n\t\t<height>{}</height>\n\t\t<depth>{}</depth>\n\t</size>\n"
+VOC_BNDBOX_TEMPLATE = ("\t\t<bndbox>\n\t\t\t<xmin>{}</xmin>\n\t\t\t<ymin>{}</ymin>\n\t\t\t<xmax>{}</xmax>\n\t\t\t<ymax>{}</ymax>\n"
+                       "\t\t</bndbox>\n\t</object>\n")
+
+def xml_text_element(tag, text, level):
+    # same rendering as ElementTree: escaped text, or a short empty element when there is no text
+    if text: return("\t"*level + "<{0}>{1}</{0}>\n".format(tag, escape(text)))
+    return("\t"*level + "<{} />\n".format(tag))
+
+def render_xml(imgInfo, bboxs):
+    """
+    Render one PascalVOC annotation file from templates.
+    
+    input: imgInfo: dict of image informations ('folder', 'fname', 'path', 'sourceName', 'sourceImg', 'sourceAnnot', 'width', 'height', 'depth', 'segmented')
+           bboxs: list of bboxs tuples (class name, pose, truncated, difficult, occluded, xmin, ymin, xmax, ymax)
+    
+    output: the file content
+    """
+    parts = ["<annotation>\n",
+             xml_text_element("folder", imgInfo['folder'], 1),
+             xml_text_element("filename", imgInfo['fname'], 1),
+             xml_text_element("path", imgInfo['path'], 1),
+             "\t<source>\n",
+             xml_text_element("database", imgInfo['sourceName'], 2)]
+    if imgInfo['sourceImg'] != 'Unknown':
+        parts.append(xml_text_element("annotation", imgInfo['sourceImg'], 2))
+    if imgInfo['sourceAnnot'] != 'Unknown':
+        parts.append(xml_text_element("image", imgInfo['sourceAnnot'], 2))
+    parts.append("\t</source>\n")
+    parts.append(VOC_SIZE_TEMPLATE.format(imgInfo['width'], imgInfo['height'], imgInfo['depth']))
+    parts.append(xml_text_element("segmented", str(imgInfo['segmented']), 1))
+    
+    for name, pose, truncated, difficult, occluded, xmin, ymin, xmax, ymax in bboxs:
+        parts.append("\t<object>\n")
+        parts.append(xml_text_element("name", name, 2))
+        parts.append(xml_text_element("pose", pose, 2))
+        parts.append("\t\t<truncated>{}</truncated>\n\t\t<difficult>{}</difficult>\n".format(truncated, difficult))
+        if occluded != 0:
+            parts.append("\t\t<occluded>{}</occluded>\n".format(occluded))
+        parts.append(VOC_BNDBOX_TEMPLATE.format(xmin, ymin, xmax, ymax))
+    parts.append("</annotation>\n")
+    return(''.join(parts))
+
+def write_xml_file(xmlFile, imgInfo, bboxs):
+    # module level so that it can run in worker processes, returns the number of bytes written
+    xmlOpen = open(xmlFile, 'w', encoding='utf-8', errors='xmlcharrefreplace')
+    xmlOpen.write(render_xml(imgInfo, bboxs))
+    size = xmlOpen.tell()
+    xmlOpen.close()
+    return(size)
 
-from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
 
 class PascalVocReader:
     def __init__(self):
         self.allxml = []
         self.dataDir = None
+        self.workers = 1
+        self.manifest = None
+        self.instrument = NO_INSTRUMENTATION
     
     def set_data_dir(self, dataDir):
         assert os.path.isdir(dataDir), "Data path must be a directory"
         self.dataDir = os.path.abspath(dataDir)
-        self.allxml = [f for f in os.listdir(self.dataDir) if f.endswith(".xml")]
+        with self.instrument.stage('scan'):
+            self.allxml = [f for f in os.listdir(self.dataDir) if f.endswith(".xml")]
     
-    def create_mediator(self): #https://stackoverflow.com/questions/53317592/reading-pascal-voc-annotations-in-python
-        mediatorImgs = MediatorImages()
-        mediatorCateg = MediatorCategories()
+    def set_workers(self, workers):
+        assert int(workers) >= 1, 'workers must be a positive number of processes.'
+        self.workers = int(workers)
+    
+    def set_manifest(self, manifest):
+        self.manifest = manifest
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+    
+    def create_stream(self):
+        # categories are discovered while records are browsed, those of previous incremental runs keep their IDs
+        stream = MediatorStream(objCateg=MediatorCategories(), manifest=self.manifest)
+        if self.manifest: self.manifest.load_categories(stream.categList)
+        stream.records = self.instrument.track(self.iter_records(stream), 'read')
+        self.instrument.set_total(len(self.allxml))
+        return(stream)
+    
+    def iter_parsed_files(self):
+        xmlFiles = [os.path.join(self.dataDir, xmlFile) for xmlFile in self.allxml]
+        # skip files unchanged since the last incremental conversion
+        if self.manifest: xmlFiles = [xmlFile for xmlFile in xmlFiles if self.manifest.check([xmlFile])]
+        if self.workers == 1:
+            for result in map(parse_xml_file, xmlFiles):
+                yield(result)
+        else:
+            # results come back in files order, so IDs do not depend on the number of workers
+            chunksize = max(1, min(256, len(xmlFiles) // (self.workers*4)))
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for result in pool.map(parse_xml_file, xmlFiles, chunksize=chunksize):
+                    yield(result)
+    
+    def iter_records(self, stream):
+        mediatorCateg = stream.categList
         
-        for xmlFile in self.allxml:
-            xmlFile = os.path.join(self.dataDir, xmlFile)
-            tree = ET.parse(xmlFile)
-            root = tree.getroot()
-            
-            height= int(root.find('size/height').text)
-            width= int(root.find('size/width').text)
-            depth= int(root.find('size/depth').text)
-            
-            try: path = root.find('path').text
-            except: path = xmlFile.replace('.xml','.jpg')
-            
-            try: sourceName = root.find('source/database').text
-            except: sourceName = 'Unknown'
-            
-            try: sourceAnnot = root.find('source/annotation').text
-            except: sourceAnnot = 'Unknown'
-            
-            try: sourceImg = root.find('source/image').text
-            except: sourceImg = 'Unknown'
-            
-            try: segmented = root.find('segmented').text
-            except: segmented = 0
-            
+        for imgInfo, bboxs in self.instrument.time_iter(self.iter_parsed_files(), 'parse'):
+            if self.instrument.enabled: self.instrument.count('bytes_read', os.path.getsize(imgInfo['sourceFiles'][0]))
             mediatorBboxs = MediatorBboxs()
-            for boxes in root.iter('object'):
-                classe = boxes.find("name").text
-                ymin = float(boxes.find("bndbox/ymin").text)
-                xmin = float(boxes.find("bndbox/xmin").text)
-                bboxW = float(boxes.find("bndbox/xmax").text) - xmin
-                bboxH = float(boxes.find("bndbox/ymax").text) - ymin
-                
-                try: pose = boxes.find('pose').text
-                except: pose = 'Unspecified'
-                
-                try: truncated = int(boxes.find('truncated').text)
-                except: truncated = 0
-                
-                try: occluded = int(boxes.find('occluded').text)
-                except: occluded = 0
-                
-                try: difficult = int(boxes.find('difficult').text)
-                except: difficult = 0
-                
+            for classe, xmin, ymin, bboxW, bboxH, pose, truncated, occluded, difficult in bboxs:
                 # handle class names
                 mediatorCateg.append(name=classe)
                 
                 # handle bboxs of the current image
-                mediatorBboxs.append(ID=mediatorImgs.get_new_bbox_id(), labelID=mediatorCateg.get_label_num(classe), 
+                mediatorBboxs.append(ID=stream.get_new_bbox_id(), labelID=mediatorCateg.get_label_num(classe), 
                                      x=xmin, y=ymin, height=bboxH, width=bboxW,
                                      truncated=truncated, difficult=difficult, occluded=occluded, pose=pose)
             
-            mediatorImgs.append(path=path, height=height, width=width, depth=depth, bboxs=mediatorBboxs,
-                                sourceName=sourceName, sourceImg=sourceImg, sourceAnnot=sourceAnnot,
-                                segmented=segmented, handlepath=True)
-        return(Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg))
+            yield(stream.create_record(bboxs=mediatorBboxs, handlepath=True, **imgInfo))
+    
+    def create_mediator(self):
+        return(self.create_stream().to_mediator())
+    
+    def translate2stream(self, dataDir, workers=1, manifest=None, instrument=None):
+        """
+        Translate PascalVOC annotations files to MediatorStream Class, files are parsed one by one while the stream is browsed.
+        
+        input: dataDir: folder path containing images and PascalVOC annotations (images and annotations must have the same name)
+               workers: number of processes parsing xml files, IDs are the same whatever the number of workers
+               manifest: ConversionManifest object of an incremental conversion, only files changed since the last run are read.
+                         The same manifest must be given to the writer.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+               
+        output: a MediatorStream class object yielding images records, its categories are complete once all records have been browsed
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_data_dir(dataDir)
+        self.set_workers(workers)
+        self.set_manifest(manifest)
+        
+        # create mediator stream
+        self.instrument.info('Streaming PascalVOC annotations ...')
+        return(self.create_stream())
     
-    def translate2mediator(self, dataDir):
+    def translate2mediator(self, dataDir, workers=1, manifest=None, instrument=None):
         """
         Translate PascalVOC annotations files to Mediator Class.
         
         input: dataDir: folder path containing images and PascalVOC annotations (images and annotations must have the same name)
+               workers: number of processes parsing xml files, IDs are the same whatever the number of workers
+               manifest: ConversionManifest object of an incremental conversion, only files changed since the last run are read.
+                         The same manifest must be given to the writer.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
                
         output: a Mediator class object containing annotations and classes informations
         
         for more informations about PascalVOC annotation format: https://towardsdatascience.com/coco-data-format-for-object-detection-a4c5eaf518c5
         """
         # set variables
+        self.set_instrumentation(instrument)
         self.set_data_dir(dataDir)
+        self.set_workers(workers)
+        self.set_manifest(manifest)
         
         # create Mediator objects
-        print('[INFO] Loading PascalVOC annotations ...')
+        self.instrument.info('Loading PascalVOC annotations ...')
         pascalMed = self.create_mediator()
+        self.instrument.finish()
         return(pascalMed)
     
     
 class PascalVocWriter:
+    # derived data used by the writer (see MediatorClass.DERIVED_DATA)
+    derivedData = ('class_names',)
+    
     def __init__(self):
         self.mediator = Mediator()
         self.dataDir = './pascalvoc_annot/'
+        self.useTemplates = True
+        self.workers = 1
+        self.processes = False
+        self.manifest = None
+        self.instrument = NO_INSTRUMENTATION
         
     def set_output_dir(self, outputAnnotDir):
         if not os.path.isdir(outputAnnotDir):
@@ -106,11 +252,60 @@ class PascalVocWriter:
         self.dataDir = os.path.abspath(outputAnnotDir)
         
     def set_mediator(self, mediator):
-        assert type(mediator) is Mediator, 'mediator variable must be a Mediator object.'
+        assert isinstance(mediator, Mediator), 'mediator variable must be a Mediator or MediatorStream object.'
         self.mediator = mediator
-
+    
+    def set_workers(self, workers, processes=False):
+        assert int(workers) >= 1, 'workers must be a positive number of threads or processes.'
+        self.workers = int(workers)
+        self.processes = processes
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+    
+    def get_xml_task(self, imgObject):
+        # everything a worker needs to write one file, class names are resolved here
+        xmlFname = os.path.splitext(os.path.basename(imgObject['path']))[0] + '.xml'
+        imgInfo = {key: imgObject[key] for key in ('folder', 'fname', 'path', 'sourceName', 'sourceImg', 'sourceAnnot',
+                                                   'width', 'height', 'depth', 'segmented', 'sourceFiles')}
+        
+        columns = [imgObject['bboxs'].get_column(key) for key in ('truncated', 'difficult', 'occluded', 'x', 'y', 'width', 'height')]
+        bboxs = []
+        for name, pose, truncated, difficult, occluded, x, y, width, height in zip(self.mediator.get_derived(imgObject, 'class_names'), imgObject['bboxs'].poses,
+                                                                                     *columns):
+            bboxs.append((name, pose, truncated, difficult, occluded, int(x), int(y), int(x + width), int(y + height)))
+        return(os.path.join(self.dataDir, xmlFname), imgInfo, bboxs)
+    
+    def record_outputs(self, task):
+        xmlFile, imgInfo, bboxs = task
+        if imgInfo['sourceFiles']: self.manifest.set_outputs(imgInfo['sourceFiles'], [xmlFile])
+        return(task)
+    
     def write_annot(self):
-        for imgObject in self.mediator.imgList.list:
+        if not self.useTemplates: return(self.write_annot_etree())
+        
+        records = self.instrument.track(self.mediator.iter_records(), 'written')
+        tasks = (self.get_xml_task(imgObject) for imgObject in records)
+        if self.manifest: tasks = map(self.record_outputs, tasks)
+        if self.workers == 1:
+            for task in tasks:
+                with self.instrument.stage('write'):
+                    self.instrument.count('bytes_written', write_xml_file(*task))
+            return
+        
+        # submit files by batches so that a stream is never held entirely
+        batchSize = self.workers * 64
+        Executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with Executor(max_workers=self.workers) as pool:
+            while True:
+                batch = [task for _, task in zip(range(batchSize), tasks)]
+                if not batch: break
+                with self.instrument.stage('write'):
+                    sizes = pool.map(write_xml_file, *zip(*batch), chunksize=max(1, batchSize // (self.workers*4)))
+                    self.instrument.count('bytes_written', sum(sizes))
+    
+    def write_annot_etree(self):
+        for imgObject in self.instrument.track(self.mediator.iter_records(), 'written'):
             xmlFname = os.path.splitext(os.path.basename(imgObject['path']))[0] + '.xml'
             xmlFile = os.path.join(self.dataDir, xmlFname)
             
@@ -151,8 +346,13 @@ class PascalVocWriter:
                 ET.SubElement(bndbox, "ymax").text = str(int(bbox['y'] + bbox['height']))
             
             tree = ET.ElementTree(annotation)
-            self.tree_indent(annotation) #indent to smooth file viewing
-            tree.write(xmlFile, 'UTF-8')
+            with self.instrument.stage('write'):
+                self.tree_indent(annotation) #indent to smooth file viewing
+                tree.write(xmlFile, 'UTF-8')
+            if self.instrument.enabled: self.instrument.count('bytes_written', os.path.getsize(xmlFile))
+            
+            if self.manifest and imgObject['sourceFiles']:
+                self.manifest.set_outputs(imgObject['sourceFiles'], [xmlFile])
         
     
     def tree_indent(self, elem, level=0): #https://stackoverflow.com/questions/3095434/inserting-newlines-in-xml-file-generated-via-xml-etree-elementtree-in-python
@@ -170,20 +370,34 @@ class PascalVocWriter:
             if level and (not elem.tail or not elem.tail.strip()):
                 elem.tail = i 
 
-    def write(self, mediator, outputAnnotDir='./pascalvoc_annot/'):
+    def write(self, mediator, outputAnnotDir='./pascalvoc_annot/', workers=1, processes=False, useTemplates=True, manifest=None, instrument=None):
         """
         Translate Mediator class object to PascalVOC annotations files.
         
-        input: mediator: Mediator object obtained by reading in another format
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
                outputAnnotDir: folder path where annotations will be stored
+               workers: number of threads (or processes) rendering and writing files
+               processes: use processes instead of threads when workers is above 1
+               useTemplates: render files from templates, otherwise build and indent an ElementTree per file (slower, same output)
+               manifest: ConversionManifest object given to the reader for an incremental conversion,
+                         outputs of deleted sources are removed and the manifest is saved at the end.
+                         Given to the writer only, all sources are written and recorded for the next runs
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           its profile is reported at the end
 
         for more informations about PascalVOC annotation format: https://towardsdatascience.com/coco-data-format-for-object-detection-a4c5eaf518c5
         """
         # set variables
         self.set_output_dir(outputAnnotDir)
         self.set_mediator(mediator)
+        self.set_workers(workers, processes)
+        self.useTemplates = useTemplates
+        self.manifest = manifest
+        self.set_instrumentation(instrument)
         
         # write files
-        print("[INFO] Writing PascalVOC annotations files ...")
+        self.instrument.info("Writing PascalVOC annotations files ...")
         self.write_annot()
-        print("[INFO] Successfully created annotations files at {}".format(self.dataDir))
+        self.instrument.info("Successfully created annotations files at {}".format(self.dataDir))
+        if self.manifest: self.manifest.finish(self.mediator.categList, self.instrument)
+        self.instrument.finish()
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import mmap
+import zlib
+import struct
+import numpy as np
+from array import array
+
+from Instrumentation import NO_INSTRUMENTATION
+from MediatorClass import Mediator, MediatorStream, MediatorCategories, MediatorImage, BBOX_COLUMNS, IMG_FIELDS, NO_ID, split_bboxs
+
+SNAPSHOT_MAGIC = b'DEERSNAP'
+SNAPSHOT_VERSION = 2
+# magic, version, number of images, bboxs and values, size of values and metadata sections, crc32 of everything after the header
+SNAPSHOT_HEADER = struct.Struct('<8sIqqqqqI')
+SNAPSHOT_ALIGN = 8
+ARRAY_DTYPES = {'q': '<i8', 'd': '<f8', 'i': '<i4', 'b': 'i1'}
+
+# images fields stored as integers, NO_ID standing for None, the others are positions in the values table where each distinct value is stored once as JSON
+IMG_INT_FIELDS = ('id', 'width', 'height', 'depth')
+IMG_VALUE_FIELDS = tuple(key for key in IMG_FIELDS if key not in IMG_INT_FIELDS and key != 'bboxs')
+# number of images whose columns are converted to lists at once while browsing
+SNAPSHOT_CHUNK = 4096
+
+def get_sections(numImgs, numBboxs, numValues, valuesSize, metaSize):
+    # (name, dtype, count) of each section, in file order
+    sections = [('meta', 'u1', metaSize)]
+    sections += [('img/' + key, '<i8', numImgs) for key in IMG_INT_FIELDS]
+    sections += [('img/' + key, '<i4', numImgs) for key in IMG_VALUE_FIELDS]
+    sections.append(('offsets', '<i8', numImgs+1))
+    sections += [('bbox/' + key, ARRAY_DTYPES[typecode], numBboxs) for key, typecode in BBOX_COLUMNS.items()]
+    sections.append(('bbox/pose', '<i4', numBboxs))
+    sections.append(('values/offsets', '<i8', numValues+1))
+    sections.append(('values', 'u1', valuesSize))
+    return(sections)
+
+def get_padding(size):
+    return(b'\0' * (-size % SNAPSHOT_ALIGN))
+
+def int_field(value, key):
+    if value is None: return(NO_ID)
+    assert value != NO_ID, 'Image {} {} is kept for missing values and can not be saved in a snapshot.'.format(key, NO_ID)
+    assert int(value) == value, 'Image {} must be an integer to be saved in a snapshot, got {}.'.format(key, value)
+    return(int(value))
+
+
+class SnapshotValues:
+    # distinct values of images fields and poses, kept as JSON texts in the order of their first use
+    def __init__(self):
+        # values positions by type and value, so that 1, 1.0 and True stay apart, or by JSON text for unhashable values
+        self.index = {}
+        self.texts = []
+
+    def add(self, value):
+        key = (type(value), value)
+        try:
+            position = self.index.get(key)
+        except TypeError:
+            key = json.dumps(value)
+            position = self.index.get(key)
+        if position is None:
+            position = len(self.texts)
+            self.index[key] = position
+            self.texts.append(json.dumps(value))
+        return(position)
+
+    def get_sections(self):
+        # texts separated by commas, so that all values are decoded by a single json.loads call
+        offsets = np.zeros(len(self.texts)+1, dtype='<i8')
+        offsets[1:] = np.cumsum([len(text)+1 for text in self.texts])
+        return(offsets, ','.join(self.texts).encode('ascii'))
+
+
+def copy_bboxs(rows, bboxColumns, poses, values):
+    # append rows (table, start, stop) of a MediatorBboxTable to the snapshot columns
+    table, start, stop = rows
+    if table is None: return
+    for key in BBOX_COLUMNS:
+        bboxColumns[key].extend(table.columns[key][start:stop])
+    poses.extend([values.add(pose) for pose in table.poses[start:stop]])
+
+def save_snapshot(mediator, fname, instrument=NO_INSTRUMENTATION):
+    """
+    Save a Mediator, or a MediatorStream while browsing it, in a binary snapshot file.
+
+    input: mediator: Mediator or MediatorStream object
+           fname: snapshot file path, written atomically
+           instrument: Instrumentation object receiving stages timings and counters
+    """
+    values = SnapshotValues()
+    imgInts = {key: array('q') for key in IMG_INT_FIELDS}
+    imgValues = {key: array('i') for key in IMG_VALUE_FIELDS}
+    offsets = array('q', [0])
+    bboxColumns = {key: array(typecode) for key, typecode in BBOX_COLUMNS.items()}
+    poses = array('i')
+    rows = [None, 0, 0] # bboxs rows not copied yet
+
+    for imgObject in instrument.track(mediator.iter_records(), 'written'):
+        with instrument.stage('serialise'):
+            for key in IMG_INT_FIELDS:
+                imgInts[key].append(int_field(imgObject[key], key))
+            for key in IMG_VALUE_FIELDS:
+                imgValues[key].append(values.add(imgObject[key]))
+
+            # rows following each other in one table (e.g. images of a Mediator) are copied at once
+            bboxs = imgObject['bboxs']
+            if bboxs.table is not rows[0] or bboxs.start != rows[2]:
+                copy_bboxs(rows, bboxColumns, poses, values)
+                rows = [bboxs.table, bboxs.start, bboxs.start]
+            rows[2] += bboxs.get_num_bboxs()
+            offsets.append(offsets[-1] + bboxs.get_num_bboxs())
+    copy_bboxs(rows, bboxColumns, poses, values)
+
+    # categories are complete once a stream has been browsed
+    meta = json.dumps({'categories': [dict(categ) for categ in mediator.categList.list], 'licenses': mediator.licenses,
+                       'infoYear': mediator.infoYear, 'infoVersion': mediator.infoVersion, 'infoDes': mediator.infoDes,
+                       'infoCont': mediator.infoCont, 'infoUrl': mediator.infoUrl, 'infoDateCreated': mediator.infoDateCreated}).encode('utf-8')
+    valueOffsets, valuesData = values.get_sections()
+    data = {'meta': meta, 'offsets': offsets, 'bbox/pose': poses, 'values/offsets': valueOffsets, 'values': valuesData}
+    data.update({'img/' + key: column for key, column in imgInts.items()})
+    data.update({'img/' + key: column for key, column in imgValues.items()})
+    data.update({'bbox/' + key: column for key, column in bboxColumns.items()})
+
+    with instrument.stage('write'):
+        tmpFname = fname + '.tmp'
+        snapOpen = open(tmpFname, 'wb')
+        snapOpen.write(b'\0' * SNAPSHOT_HEADER.size)
+        checksum = 0
+        for name, dtype, count in get_sections(len(offsets)-1, len(poses), len(values.texts), len(valuesData), len(meta)):
+            sectionBytes = np.asarray(data[name], dtype=dtype).tobytes() if dtype != 'u1' else data[name]
+            sectionBytes += get_padding(len(sectionBytes))
+            snapOpen.write(sectionBytes)
+            checksum = zlib.crc32(sectionBytes, checksum)
+        snapOpen.seek(0)
+        snapOpen.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(offsets)-1, len(poses), len(values.texts),
+                                            len(valuesData), len(meta), checksum))
+        size = snapOpen.seek(0, os.SEEK_END)
+        snapOpen.close()
+        os.replace(tmpFname, fname)
+    instrument.count('bytes_written', size)
+
+def load_snapshot(fname, verify=True):
+    """
+    input: fname: snapshot file path
+           verify: check the snapshot checksum, reading the whole file once
+
+    output: a SnapshotStream object, images are read from the memory mapped file while it is browsed, until it is closed
+    """
+    return(SnapshotStream(SnapshotFile(fname, verify)))
+
+
+class SnapshotFile:
+    """
+    Memory mapped snapshot file, its columns are numpy arrays over the file and images records are built while browsed.
+    """
+    def __init__(self, fname, verify=True):
+        self.fname = fname
+        if os.path.getsize(fname) < SNAPSHOT_HEADER.size: raise(Exception('{} is not a Mediator snapshot.'.format(fname)))
+        self.fileOpen = open(fname, 'rb')
+        self.data = mmap.mmap(self.fileOpen.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.numImgs, self.numBboxs, numValues, valuesSize, metaSize, checksum = SNAPSHOT_HEADER.unpack_from(self.data, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise(Exception('{} is not a Mediator snapshot.'.format(fname)))
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise(Exception('{} is a version {} snapshot, only version {} is supported.'.format(fname, version, SNAPSHOT_VERSION)))
+
+        sections = get_sections(self.numImgs, self.numBboxs, numValues, valuesSize, metaSize)
+        sizes = [np.dtype(dtype).itemsize * count for _, dtype, count in sections]
+        if SNAPSHOT_HEADER.size + sum(size + len(get_padding(size)) for size in sizes) != len(self.data):
+            self.close()
+            raise(Exception('Truncated snapshot {}.'.format(fname)))
+
+        # columns are views of the mapped file
+        self.sections = {}
+        offset = SNAPSHOT_HEADER.size
+        for (name, dtype, count), size in zip(sections, sizes):
+            self.sections[name] = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+            offset += size + len(get_padding(size))
+        if verify:
+            body = memoryview(self.data)[SNAPSHOT_HEADER.size:]
+            valid = zlib.crc32(body) == checksum
+            body.release()
+            if not valid:
+                self.close()
+                raise(Exception('Corrupted snapshot {}, checksum does not match.'.format(fname)))
+
+        self.meta = json.loads(self.sections['meta'].tobytes().decode('utf-8'))
+        self.values = None
+
+    def __len__(self):
+        return(self.numImgs)
+
+    def get_values(self):
+        # all distinct values decoded at once, at first use
+        if self.values is None:
+            values = json.loads('[' + self.sections['values'].tobytes().decode('ascii') + ']')
+            self.values = [tuple(value) if type(value) is list else value for value in values]
+        return(self.values)
+
+    def create_mediator_categ(self):
+        mediatorCateg = MediatorCategories()
+        for categ in self.meta['categories']:
+            mediatorCateg.append(ID=categ['id'], name=categ['name'], supercategory=categ['supercategory'])
+        return(mediatorCateg)
+
+    def iter_range(self, start=0, stop=None):
+        # images records of positions start to stop excluded, columns are converted by chunks
+        start, stop, _ = slice(start, stop).indices(self.numImgs)
+        values = self.get_values()
+        for chunkStart in range(start, stop, SNAPSHOT_CHUNK):
+            chunkStop = min(chunkStart + SNAPSHOT_CHUNK, stop)
+            imgInts = [[None if value == NO_ID else value for value in self.sections['img/' + key][chunkStart:chunkStop].tolist()] for key in IMG_INT_FIELDS]
+            imgValues = [self.sections['img/' + key][chunkStart:chunkStop].tolist() for key in IMG_VALUE_FIELDS]
+            offsets = self.sections['offsets'][chunkStart:chunkStop+1]
+            # bboxs of the chunk in one table
+            bboxStart, bboxStop = int(offsets[0]), int(offsets[-1])
+            bboxsList = split_bboxs((offsets - bboxStart).tolist(), pose=[values[pose] for pose in self.sections['bbox/pose'][bboxStart:bboxStop].tolist()],
+                                    **{key: self.sections['bbox/' + key][bboxStart:bboxStop] for key in BBOX_COLUMNS})
+
+            for idx, mediatorBboxs in enumerate(bboxsList):
+                yield(MediatorImage(*[column[idx] for column in imgInts],
+                                    *[values[column[idx]] for column in imgValues], mediatorBboxs))
+
+    def get_record(self, position):
+        """
+        input: position: image number in the snapshot, negative values count from the end
+
+        output: the image record
+        """
+        position = range(self.numImgs)[position]
+        return(next(self.iter_range(position, position+1)))
+
+    def close(self):
+        self.sections = {}
+        self.data.close()
+        self.fileOpen.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SnapshotStream(MediatorStream):
+    """
+    MediatorStream over a snapshot file. Unlike other streams it can be browsed several times, by several writers.
+
+    The snapshot file stays mapped until close is called, or at the end of a with block.
+    """
+    def __init__(self, snapshot, instrument=NO_INSTRUMENTATION):
+        meta = snapshot.meta
+        MediatorStream.__init__(self, objCateg=snapshot.create_mediator_categ(), licenses=meta['licenses'],
+                                infoYear=meta['infoYear'], infoVersion=meta['infoVersion'], infoDes=meta['infoDes'],
+                                infoCont=meta['infoCont'], infoUrl=meta['infoUrl'], infoDateCreated=meta['infoDateCreated'])
+        self.snapshot = snapshot
+        self.instrument = instrument
+        self.numImgs = len(snapshot)
+        self.numBboxs = snapshot.numBboxs
+
+    def iter_records(self):
+        return(self.instrument.track(self.snapshot.iter_range(), 'read'))
+
+    def close(self):
+        self.snapshot.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SnapshotReader:
+    def __init__(self):
+        self.snapshotFname = None
+        self.verify = True
+        self.instrument = NO_INSTRUMENTATION
+
+    def set_snapshot_file(self, snapshotFname):
+        assert os.path.isfile(snapshotFname), 'Snapshot file must exist.'
+        self.snapshotFname = os.path.abspath(snapshotFname)
+
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+
+    def create_stream(self):
+        with self.instrument.stage('load'):
+            snapshot = SnapshotFile(self.snapshotFname, self.verify)
+        self.instrument.count('bytes_read', os.path.getsize(self.snapshotFname))
+        self.instrument.set_total(len(snapshot))
+        return(SnapshotStream(snapshot, self.instrument))
+
+    def translate2stream(self, snapshotFname, verify=True, instrument=None):
+        """
+        Load a Mediator snapshot without parsing annotations again, images are read from the memory mapped file while browsed.
+
+        input: snapshotFname: snapshot file path written by SnapshotWriter
+               verify: check the snapshot checksum, reading the whole file once
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+
+        output: a SnapshotStream object yielding images records, it can be browsed several times and has to be closed
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_snapshot_file(snapshotFname)
+        self.verify = verify
+
+        # create mediator stream
+        self.instrument.info('Loading Mediator snapshot ...')
+        return(self.create_stream())
+
+    def translate2mediator(self, snapshotFname, verify=True, instrument=None):
+        """
+        Load a Mediator snapshot in a Mediator Class.
+
+        input: snapshotFname: snapshot file path written by SnapshotWriter
+               verify: check the snapshot checksum, reading the whole file once
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+
+        output: a Mediator class object containing annotations and classes informations
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_snapshot_file(snapshotFname)
+        self.verify = verify
+
+        # create Mediator objects
+        self.instrument.info('Loading Mediator snapshot ...')
+        with self.create_stream() as stream:
+            snapMed = stream.to_mediator()
+        self.instrument.finish()
+        return(snapMed)
+
+
+class SnapshotWriter:
+    def __init__(self):
+        self.mediator = Mediator()
+        self.dataFile = './mediator.snapshot'
+        self.instrument = NO_INSTRUMENTATION
+
+    def set_mediator(self, mediator):
+        assert isinstance(mediator, Mediator), 'mediator variable must be a Mediator or MediatorStream object.'
+        assert mediator.manifest is None, 'mediator has been read with a manifest and misses unchanged sources, read it without manifest to write a snapshot.'
+        self.mediator = mediator
+
+    def set_output_file(self, outputFile):
+        self.dataFile = os.path.abspath(outputFile)
+
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+
+    def write(self, mediator, outputFile='./mediator.snapshot', instrument=None):
+        """
+        Save a Mediator class object in a binary snapshot: fixed-width images and bboxs columns, a table of distinct strings
+        (paths, names, ...), a version header and a checksum. Reading it back (SnapshotReader) does not parse the source again.
+
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
+               outputFile: file path where the snapshot will be stored
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           its profile is reported at the end
+        """
+        # set variables
+        self.set_mediator(mediator)
+        self.set_output_file(outputFile)
+        self.set_instrumentation(instrument)
+
+        # write file
+        self.instrument.info("Writing Mediator snapshot ...")
+        save_snapshot(self.mediator, self.dataFile, self.instrument)
+        self.instrument.info("Successfully created snapshot at {}".format(self.dataFile))
+        self.instrument.finish()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import struct
+import numpy as np
+
+try:
+    # optional C implementation of CRC32C (pip install crc32c), much faster on images bytes
+    from crc32c import crc32c as crc32c_c
+except ImportError:
+    crc32c_c = None
+
+# TFRecord framing: uint64 length, uint32 masked crc of length, data, uint32 masked crc of data
+# https://www.tensorflow.org/tutorials/load_data/tfrecord#tfrecords_format_details
+CRC_MASK_DELTA = 0xa282ead8
+CRC32C_POLY = 0x82f63b78
+
+# tf.train.Feature fields, the kind of a feature is the field number of its list
+FEATURE_KINDS = {1:'bytes', 2:'float', 3:'int64'}
+KIND_FIELDS = {kind:field for field, kind in FEATURE_KINDS.items()}
+
+def make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC32C_POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return(table)
+
+CRC_TABLE = make_crc_table()
+NP_CRC_TABLE = np.array(CRC_TABLE, np.uint32)
+BIT_SHIFTS = np.arange(32, dtype=np.uint32)
+MAX_LANES = 4096
+SMALL_CRC = 1024 # bytes, shorter data is faster byte by byte
+combineTables = {}
+
+def crc32c_bytes(data, crc=0xffffffff):
+    table = CRC_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+    return(crc)
+
+def get_combine_table(laneLength):
+    # row k gives where each bit of a crc lands after k*laneLength zero bytes, crc being linear over bits
+    if laneLength not in combineTables:
+        basis = np.left_shift(np.uint32(1), BIT_SHIFTS)
+        shifted = basis.copy()
+        for _ in range(laneLength):
+            shifted = NP_CRC_TABLE[shifted & 0xff] ^ (shifted >> 8)
+        rows = [basis]
+        for _ in range(MAX_LANES-1):
+            bits = (rows[-1][:, None] >> BIT_SHIFTS) & 1
+            rows.append(np.bitwise_xor.reduce(np.where(bits == 1, shifted, 0), axis=1).astype(np.uint32))
+        combineTables[laneLength] = np.array(rows)
+    return(combineTables[laneLength])
+
+def crc32c_numpy(data):
+    # crc of interleaved lanes computed together, then shifted to their position and xored
+    laneLength = 16
+    while len(data) > laneLength * MAX_LANES: laneLength *= 2
+    numLanes = -(-len(data) // laneLength)
+    
+    # initial crc value is the same as inverting the first 4 bytes, leading zeros do not change a crc starting at 0
+    buffer = np.zeros(numLanes*laneLength, np.uint8)
+    buffer[-len(data):] = np.frombuffer(data, np.uint8)
+    buffer[-len(data):-len(data)+4] ^= 0xff
+    lanes = buffer.reshape(numLanes, laneLength)
+    
+    crcs = np.zeros(numLanes, np.uint32)
+    for column in range(laneLength):
+        crcs = NP_CRC_TABLE[(crcs ^ lanes[:, column]) & 0xff] ^ (crcs >> 8)
+    
+    shifts = get_combine_table(laneLength)[numLanes-1::-1]
+    bits = (crcs[:, None] >> BIT_SHIFTS) & 1
+    return(int(np.bitwise_xor.reduce(np.where(bits == 1, shifts, 0), axis=None)) ^ 0xffffffff)
+
+def crc32c(data):
+    if crc32c_c: return(crc32c_c(data))
+    if len(data) < SMALL_CRC: return(crc32c_bytes(data) ^ 0xffffffff)
+    return(crc32c_numpy(data))
+
+def masked_crc(data):
+    crc = crc32c(data)
+    return((((crc >> 15) | (crc << 17)) + CRC_MASK_DELTA) & 0xffffffff)
+
+
+class TFRecordWriter:
+    """
+    Write records to a .record file, same interface as tf.io.TFRecordWriter.
+    """
+    def __init__(self, path):
+        self.fileOpen = open(path, 'wb')
+
+    def write(self, data):
+        length = struct.pack('<Q', len(data))
+        self.fileOpen.write(length + struct.pack('<I', masked_crc(length)) + data + struct.pack('<I', masked_crc(data)))
+
+    def close(self):
+        self.fileOpen.close()
+
+def iter_tfrecord(path, verify=True):
+    """
+    Read records of a .record file one by one.
+
+    input: path: .record file path
+           verify: check crc of records data, crc of lengths are always checked
+
+    output: generator of records bytes
+    """
+    fileOpen = open(path, 'rb')
+    while True:
+        header = fileOpen.read(12)
+        if not header: break
+        if len(header) < 12: raise(Exception('Truncated record header in {}.'.format(path)))
+        length = header[:8]
+        if struct.unpack('<I', header[8:])[0] != masked_crc(length): raise(Exception('Corrupted record length in {}.'.format(path)))
+
+        length = struct.unpack('<Q', length)[0]
+        data = fileOpen.read(length)
+        footer = fileOpen.read(4)
+        if len(data) < length or len(footer) < 4: raise(Exception('Truncated record in {}.'.format(path)))
+        if verify and struct.unpack('<I', footer)[0] != masked_crc(data): raise(Exception('Corrupted record data in {}.'.format(path)))
+        yield(data)
+    fileOpen.close()
+
+# framing bytes around the data of a record: length, its crc and the data crc
+RECORD_OVERHEAD = 16
+
+def get_index_fname(path):
+    return(path + '.idx')
+
+def build_index(path):
+    """
+    Find records of a .record file reading only their framing, data is skipped.
+
+    input: path: .record file path
+
+    output: (offsets, sizes) numpy arrays, sizes including framing
+    """
+    offsets = []
+    sizes = []
+    fileOpen = open(path, 'rb')
+    offset = 0
+    while True:
+        header = fileOpen.read(12)
+        if not header: break
+        if len(header) < 12: raise(Exception('Truncated record header in {}.'.format(path)))
+        if struct.unpack('<I', header[8:])[0] != masked_crc(header[:8]): raise(Exception('Corrupted record length in {}.'.format(path)))
+        size = struct.unpack('<Q', header[:8])[0] + RECORD_OVERHEAD
+        offsets.append(offset)
+        sizes.append(size)
+        offset += size
+        fileOpen.seek(offset)
+    fileOpen.close()
+    if offset > os.path.getsize(path): raise(Exception('Truncated record in {}.'.format(path)))
+    return(np.array(offsets, np.int64), np.array(sizes, np.int64))
+
+def write_index(indexFname, offsets, sizes):
+    # one "offset size" line per record, like DALI tfrecord2idx
+    indexOpen = open(indexFname, 'w')
+    for offset, size in zip(offsets, sizes):
+        indexOpen.write('{} {}\n'.format(offset, size))
+    indexOpen.close()
+
+def load_index(indexFname):
+    indexOpen = open(indexFname, 'r')
+    values = np.array(indexOpen.read().split(), np.int64)
+    indexOpen.close()
+    return(values[0::2], values[1::2])
+
+
+class TFRecordFile:
+    """
+    Random access to records of a .record file, through its offsets index and a memory map.
+    The index is read from the .idx sidecar file, or built and saved there when missing.
+    """
+    def __init__(self, path, verify=True):
+        self.path = path
+        self.verify = verify
+        indexFname = get_index_fname(path)
+        if os.path.isfile(indexFname) and os.path.getmtime(indexFname) >= os.path.getmtime(path):
+            self.offsets, self.sizes = load_index(indexFname)
+        else:
+            self.offsets, self.sizes = build_index(path)
+            try:
+                write_index(indexFname, self.offsets, self.sizes)
+            except OSError:
+                pass # read-only folder, the index is built again next time
+        
+        self.fileOpen = open(path, 'rb')
+        # an empty file cannot be mapped
+        self.data = mmap.mmap(self.fileOpen.fileno(), 0, access=mmap.ACCESS_READ) if len(self.offsets) else b''
+
+    def __len__(self):
+        return(len(self.offsets))
+
+    def get_record(self, position):
+        """
+        input: position: record number in the file, negative values count from the end
+
+        output: record bytes
+        """
+        offset = int(self.offsets[position])
+        end = offset + int(self.sizes[position])
+        record = self.data[offset+12:end-4]
+        if self.verify and struct.unpack('<I', self.data[end-4:end])[0] != masked_crc(record):
+            raise(Exception('Corrupted record data at position {} in {}.'.format(position, self.path)))
+        return(record)
+
+    def iter_range(self, start=0, stop=None):
+        # records of positions start to stop excluded
+        for position in range(*slice(start, stop).indices(len(self))):
+            yield(self.get_record(position))
+
+    def close(self):
+        if len(self.offsets): self.data.close()
+        self.fileOpen.close()
+
+def read_examples_range(task):
+    """
+    Decode the examples of a range of records, kept at module level so that it can run in worker processes
+    without importing TensorFlow.
+
+    input: task: (path, start, stop) tuple
+
+    output: list of examples features, as given by decode_example
+    """
+    path, start, stop = task
+    recordFile = TFRecordFile(path)
+    examples = [decode_example(record) for record in recordFile.iter_range(start, stop)]
+    recordFile.close()
+    return(examples)
+
+
+def encode_varint(value):
+    # negative int64 are encoded as their 64 bits two's complement
+    value &= 0xffffffffffffffff
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return(bytes(out))
+
+def decode_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80: return(result, pos)
+        shift += 7
+
+def encode_field(field, payload):
+    # length delimited field (wire type 2)
+    return(encode_varint(field << 3 | 2) + encode_varint(len(payload)) + payload)
+
+def encode_feature(kind, values):
+    if kind == 'bytes':
+        payload = b''.join(encode_field(1, value) for value in values)
+    elif kind == 'float':
+        payload = encode_field(1, struct.pack('<{}f'.format(len(values)), *values)) if len(values) else b''
+    elif kind == 'int64':
+        payload = encode_field(1, b''.join(encode_varint(int(value)) for value in values)) if len(values) else b''
+    else:
+        raise(Exception('Feature kind must be bytes, float or int64, not {}.'.format(kind)))
+    return(encode_field(KIND_FIELDS[kind], payload))
+
+def encode_example(features):
+    """
+    Serialise a tf.train.Example without TensorFlow.
+
+    input: features: dict of feature name -> (kind, values), kind being 'bytes', 'float' or 'int64'
+
+    output: the serialised example, features in dict order
+    """
+    entries = b''.join(encode_field(1, encode_field(1, name.encode('utf8')) + encode_field(2, encode_feature(kind, values)))
+                       for name, (kind, values) in features.items())
+    return(encode_field(1, entries))
+
+def iter_fields(data, start=0, end=None):
+    # (field number, wire type, value) of a message, value being bytes for length delimited fields
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        key, pos = decode_varint(data, pos)
+        wireType = key & 7
+        if wireType == 2:
+            length, pos = decode_varint(data, pos)
+            yield(key >> 3, wireType, data[pos:pos+length])
+            pos += length
+        elif wireType == 0:
+            value, pos = decode_varint(data, pos)
+            yield(key >> 3, wireType, value)
+        elif wireType == 5:
+            yield(key >> 3, wireType, data[pos:pos+4])
+            pos += 4
+        elif wireType == 1:
+            yield(key >> 3, wireType, data[pos:pos+8])
+            pos += 8
+        else:
+            raise(Exception('Unsupported protobuf wire type {}.'.format(wireType)))
+
+def decode_int64s(payload):
+    values = []
+    pos = 0
+    while pos < len(payload):
+        value, pos = decode_varint(payload, pos)
+        values.append(value - (1 << 64) if value >> 63 else value)
+    return(values)
+
+def decode_feature(data):
+    for field, _, payload in iter_fields(data):
+        kind = FEATURE_KINDS.get(field)
+        if kind == 'bytes':
+            return([value for _, _, value in iter_fields(payload)])
+        if kind == 'float':
+            # packed, or one field per value for writers not packing
+            values = [np.frombuffer(value, '<f4') for _, _, value in iter_fields(payload)]
+            return(np.concatenate(values) if values else np.zeros(0, np.float32))
+        if kind == 'int64':
+            values = []
+            for _, wireType, value in iter_fields(payload):
+                values.extend(decode_int64s(value) if wireType == 2 else [value - (1 << 64) if value >> 63 else value])
+            return(np.array(values, np.int64))
+    return([])
+
+def decode_example(data):
+    """
+    Parse a serialised tf.train.Example without TensorFlow.
+
+    input: data: serialised example
+
+    output: dict of feature name -> values, a list of bytes for bytes features and numpy arrays for float and int64 features
+    """
+    features = {}
+    for _, _, featuresData in iter_fields(data):
+        for _, _, entry in iter_fields(featuresData):
+            name = None
+            feature = b''
+            for field, _, value in iter_fields(entry):
+                if field == 1: name = value.decode('utf8')
+                elif field == 2: feature = value
+            features[name] = decode_feature(feature)
+    return(features)
@@ -3,13 +3,31 @@
 import os
 import io
 import numpy as np
-import requests
-import tensorflow as tf
 
-from object_detection.utils import dataset_util
+try:
+    import tensorflow as tf
+except ImportError:
+    # records are read and written by the pure Python codec when TensorFlow is not installed
+    tf = None
+
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+from ImageProbe import detect_format, probe_header
+from TfrecordCodec import TFRecordWriter, TFRecordFile, RECORD_OVERHEAD, iter_tfrecord, encode_example, decode_example, read_examples_range, get_index_fname, write_index
+from Instrumentation import NO_INSTRUMENTATION
+from MediatorClass import Mediator, MediatorStream, MediatorCategories, MediatorBboxs, get_path_format
+
+# features read as single values, with their default value when missing (None if required)
+FIXED_FEATURES = {'image/height': None, 'image/width': None, 'image/channels': 0}
 
-from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+def set_fixed_features(image_features):
+    # single values of examples decoded by the pure Python codec, like tf.io.FixedLenFeature
+    for key, default in FIXED_FEATURES.items():
+        if key in image_features: image_features[key] = image_features[key][0]
+        elif default is None: raise(Exception('Example has no {} feature.'.format(key)))
+        else: image_features[key] = default
+    return(image_features)
 
 class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/research/object_detection/g3doc/using_your_own_dataset.md
     def __init__(self):
@@ -17,6 +35,9 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
         self.outputImgsDir = './tfrec_imgs/'
         self.tfrecFname = None
         self.labelsFname = None
+        self.batchSize = 256
+        self.workers = 1
+        self.instrument = NO_INSTRUMENTATION
         
     def set_tfrec_file(self, tfrecFname):
         assert os.path.isfile(tfrecFname), 'Tfrecord file must exist.'
@@ -26,6 +47,17 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
         assert os.path.isfile(labelsFname), 'labels file must exist.'
         self.labelsFname = labelsFname
     
+    def set_batch_size(self, batchSize):
+        assert int(batchSize) >= 1, 'batchSize must be a positive number of examples.'
+        self.batchSize = int(batchSize)
+    
+    def set_workers(self, workers):
+        assert int(workers) >= 1, 'workers must be a positive number of processes.'
+        self.workers = int(workers)
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+    
     def set_output_imgs(self, outputImgsDir):
         # create folder if not existing
         if not os.path.isdir(outputImgsDir):
@@ -38,7 +70,9 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
         # open labels file
         labels = open(self.labelsFname, 'r')
         while True:
-            line = labels.readline().replace(" ", "").replace("\n", "")
+            line = labels.readline()
+            if line == '': break
+            line = line.replace(" ", "").replace("\n", "")
             if line.startswith('item'):
                 # get label number
                 id_line = labels.readline().replace(" ", "").replace("\n", "")
@@ -50,66 +84,130 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
                 for word in label_line.split(":"):
                     if word.startswith("'") and word.endswith("'"):
                         label_name = word.replace("'", "")
-                # add label to categories object
-                mediatorCateg.append(ID=label_num, name=label_name)
-            elif labels.read() == '': break
+                # add label to categories object, IDs are numbers like in examples
+                mediatorCateg.append(ID=int(label_num), name=label_name)
         labels.close()
         return(mediatorCateg)
     
-    def create_mediator_imgs(self): #https://www.tensorflow.org/tutorials/load_data/tfrecord
-        mediatorImgs = MediatorImages()
+    def create_stream(self):
+        stream = MediatorStream(objCateg=self.create_mediator_categ())
+        stream.records = self.instrument.track(self.iter_records(stream), 'read')
+        self.instrument.count('bytes_read', os.path.getsize(self.tfrecFname))
+        return(stream)
+    
+    def iter_examples(self):
+        # features of each example, numpy arrays or lists of bytes whatever the backend
+        if self.workers > 1:
+            for image_features in self.iter_examples_parallel():
+                yield(image_features)
+            return
+        if tf is None:
+            for data in iter_tfrecord(self.tfrecFname):
+                yield(set_fixed_features(decode_example(data)))
+            return
+        
+        # examples parsed by batches in parallel, next batches being prepared while the current one is browsed
+        dataset = tf.data.TFRecordDataset(self.tfrecFname).batch(self.batchSize)
+        dataset = dataset.map(self.extract_fn, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+        for batch_features in dataset:
+            # one numpy conversion per feature and per batch, sparse values are then split by example
+            batch = {}
+            for key, value in batch_features.items():
+                if isinstance(value, tf.sparse.SparseTensor):
+                    rows = value.indices[:, 0].numpy()
+                    batch[key] = np.split(value.values.numpy(), np.cumsum(np.bincount(rows, minlength=int(value.dense_shape[0])))[:-1])
+                else:
+                    batch[key] = value.numpy()
+            for idx in range(len(batch['image/height'])):
+                yield({key: values[idx] for key, values in batch.items()})
     
-        # open .record file and extract informations
-        dataset = tf.data.TFRecordDataset(self.tfrecFname)
-        samples = dataset.map(self.extract_fn)
+    def iter_examples_parallel(self):
+        # ranges of records found with the offsets index are decoded by worker processes, without TensorFlow
+        recordFile = TFRecordFile(self.tfrecFname)
+        numRecords = len(recordFile)
+        recordFile.close()
+        self.instrument.set_total(numRecords)
+        tasks = [(self.tfrecFname, start, min(start+self.batchSize, numRecords)) for start in range(0, numRecords, self.batchSize)]
         
+        # submit ranges by groups so that decoded examples are never held entirely
+        groupSize = self.workers * 4
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, len(tasks), groupSize):
+                for examples in pool.map(read_examples_range, tasks[start:start+groupSize]):
+                    for image_features in examples:
+                        yield(set_fixed_features(image_features))
+    
+    def read_example(self, tfrecFname, position):
+        """
+        Decode a single example of a TFRecord file, to check a few images of a large file for instance.
+        The offsets index of the file is built at first call and saved next to it (.idx).
+        
+        input: tfrecFname: file path containing TFRecords images and annotations
+               position: example number in the file, negative values count from the end
+        
+        output: dict of example features, a list of bytes for bytes features and numpy arrays for float and int64 features
+        """
+        self.set_tfrec_file(tfrecFname)
+        recordFile = TFRecordFile(self.tfrecFname)
+        image_features = set_fixed_features(decode_example(recordFile.get_record(position)))
+        recordFile.close()
+        return(image_features)
+    
+    def iter_records(self, stream): #https://www.tensorflow.org/tutorials/load_data/tfrecord
         # browse all images in .record file
-        for image_features in samples:
-            # decode image
-            image_encoded = image_features["image/encoded"]
-            dense = tf.sparse.to_dense(image_encoded)
-            dense_scalar = tf.reshape(dense, [])
-            image_raw = tf.io.decode_image(dense_scalar).numpy()
+        for image_features in self.instrument.time_iter(self.iter_examples(), 'parse'):
+            # encoded image, pixels are never decoded
+            encoded = image_features["image/encoded"][0]
             
             # decode img informations
-            height = image_features["image/height"].numpy()
-            width = image_features["image/width"].numpy()
-            filename = tf.sparse.to_dense(image_features['image/filename']).numpy()[0].decode('utf-8')
-            sourceid = tf.sparse.to_dense(image_features["image/source_id"]).numpy()[0].decode('utf-8')
-            format_ = tf.sparse.to_dense(image_features["image/format"]).numpy()[0].decode('utf-8')
+            height = int(image_features["image/height"])
+            width = int(image_features["image/width"])
+            filename = image_features['image/filename'][0].decode('utf-8')
+            sourceid = image_features["image/source_id"][0].decode('utf-8')
+            format_ = image_features["image/format"][0].decode('utf-8')
             
-            # get image depth
-            depth = image_raw.shape[2]
-            if depth == 1: image_raw = np.squeeze(np.array(image_raw), axis=2) # convert array if grayscale image
+            # get image depth from image/channels when written, else from the image header
+            depth = int(image_features["image/channels"])
+            if not depth: depth = self.get_encoded_depth(encoded)
             
             # decode object bboxs
-            xmins = tf.sparse.to_dense(image_features['image/object/bbox/xmin']).numpy()
-            xmaxs = tf.sparse.to_dense(image_features['image/object/bbox/xmax']).numpy()
-            ymins = tf.sparse.to_dense(image_features['image/object/bbox/ymin']).numpy()
-            ymaxs = tf.sparse.to_dense(image_features['image/object/bbox/ymax']).numpy()
-            classes = tf.sparse.to_dense(image_features['image/object/class/text']).numpy()
-            labels_n = tf.sparse.to_dense(image_features['image/object/class/label']).numpy()
+            xmins = image_features['image/object/bbox/xmin']
+            xmaxs = image_features['image/object/bbox/xmax']
+            ymins = image_features['image/object/bbox/ymin']
+            ymaxs = image_features['image/object/bbox/ymax']
+            classes = image_features['image/object/class/text']
+            labels_n = image_features['image/object/class/label']
             
             mediatorBboxs = MediatorBboxs()
             for idx in range(len(xmins)):
-                mediatorBboxs.append(ID=mediatorImgs.get_new_bbox_id(), labelID=labels_n[idx],
+                mediatorBboxs.append(ID=stream.get_new_bbox_id(), labelID=labels_n[idx],
                                      x=xmins[idx]*width, y=ymins[idx]*height, 
                                      height=(ymaxs[idx]-ymins[idx])*height, width=(xmaxs[idx]+xmins[idx])*width)
-            # save image if needed
+            # save image if needed, as it is encoded in the .record file
             if self.saveImgs:
                 filename = os.path.join(self.outputImgsDir, os.path.basename(filename))
-                imgOut = Image.fromarray(image_raw)
-                imgOut.save(filename)
-
-                    
+                with self.instrument.stage('save_images'):
+                    imgOut = open(filename, 'wb')
+                    imgOut.write(encoded)
+                    imgOut.close()
+                self.instrument.count('bytes_written', len(encoded))
                 
-            mediatorImgs.append(path=filename, width=width, height=height, depth=depth, bboxs=mediatorBboxs, handlepath=True)
-        return(mediatorImgs)
+            yield(stream.create_record(path=filename, width=width, height=height, depth=depth, bboxs=mediatorBboxs, handlepath=True))
+    
+    def get_encoded_depth(self, encoded):
+        # JPEG and PNG headers give the number of channels, other formats are decoded
+        probed = probe_header(io.BytesIO(encoded))
+        if probed: return(probed[2])
+        return(len(Image.open(io.BytesIO(encoded)).getbands()))
+    
+    def create_mediator_imgs(self):
+        return(self.create_stream().to_mediator().imgList)
             
     def extract_fn(self, data_record): #https://stackoverflow.com/questions/54723912/tensorflow-extracting-image-and-label-from-tfrecords-file
         features = {# Extract features using the keys set during creation
                     "image/height":                 tf.io.FixedLenFeature([], tf.int64),
                     "image/width":                  tf.io.FixedLenFeature([], tf.int64),
+                    "image/channels":               tf.io.FixedLenFeature([], tf.int64, default_value=0),
                     "image/filename":               tf.io.VarLenFeature(tf.string),
                     "image/source_id":              tf.io.VarLenFeature(tf.string),
                     "image/encoded":                tf.io.VarLenFeature(tf.string),
@@ -120,9 +218,38 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
                     "image/object/bbox/ymax":       tf.io.VarLenFeature(tf.float32),
                     "image/object/class/text":      tf.io.VarLenFeature(tf.string),
                     "image/object/class/label":     tf.io.VarLenFeature(tf.int64)}
-        return tf.io.parse_single_example(data_record, features)
+        return tf.io.parse_example(data_record, features)
         
-    def translate2mediator(self, tfrecFname, labelsFname, saveImgs=False, outputImgsDir='./tfrec_imgs/'):
+    def translate2stream(self, tfrecFname, labelsFname, saveImgs=False, outputImgsDir='./tfrec_imgs/', batchSize=256, workers=1, instrument=None):
+        """
+        Translate TFRecords annotation file to MediatorStream Class, examples are decoded by batches while the stream is browsed.
+        
+        input: tfrecFname: file path containing TFRecords images and annotations (most of the time: .record/.tfrecord/.records)
+               labelsFname: file path containing labels informations (most of the time .pbtxt)
+               saveImgs: enable images saving when reading TFRecords file. If this option is enabled, the images will be stored in outputImgsDir directory.
+               outputImgsDir: effective when saveImgs is enabled. Directory where images will be stored.
+               batchSize: number of examples parsed at once by TensorFlow, or by each worker process
+               workers: number of processes decoding examples without TensorFlow, ranges of examples being found
+                        with the offsets index of the file (.idx file next to it, built when missing)
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+               
+        output: a MediatorStream class object yielding images records
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_tfrec_file(tfrecFname)
+        self.set_labels_file(labelsFname)
+        self.set_batch_size(batchSize)
+        self.set_workers(workers)
+        if saveImgs:
+            self.saveImgs = saveImgs
+            self.set_output_imgs(outputImgsDir)
+        
+        # create mediator stream
+        self.instrument.info('Streaming TFRecords annotations...')
+        return(self.create_stream())
+        
+    def translate2mediator(self, tfrecFname, labelsFname, saveImgs=False, outputImgsDir='./tfrec_imgs/', batchSize=256, workers=1, instrument=None):
         """
         Translate TFRecords annotation file to Mediator Class.
         
@@ -130,38 +257,127 @@ class TfrecordsReader: #https://github.com/tensorflow/models/blob/master/researc
                labelsFname: file path containing labels informations (most of the time .pbtxt)
                saveImgs: enable images saving when reading TFRecords file. If this option is enabled, the images will be stored in outputImgsDir directory.
                outputImgsDir: effective when saveImgs is enabled. Directory where images will be stored.
+               batchSize: number of examples parsed at once by TensorFlow, or by each worker process
+               workers: number of processes decoding examples without TensorFlow, ranges of examples being found
+                        with the offsets index of the file (.idx file next to it, built when missing)
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
                
         output: a Mediator class object containing annotations and classes informations
         
         for more informations about TFRecords annotation format: https://github.com/tensorflow/models/blob/master/research/object_detection/g3doc/using_your_own_dataset.md
         """
         # set variables
+        self.set_instrumentation(instrument)
         self.set_tfrec_file(tfrecFname)
         self.set_labels_file(labelsFname)
+        self.set_batch_size(batchSize)
+        self.set_workers(workers)
         if saveImgs:
             self.saveImgs = saveImgs
             self.set_output_imgs(outputImgsDir)
         
         # create Mediator objects
-        mediatorCateg = self.create_mediator_categ()
-        print('[INFO] Loading TFRecords annotations...')
-        mediatorImgs = self.create_mediator_imgs()
-        return(Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg))
+        self.instrument.info('Loading TFRecords annotations...')
+        tfrecMed = self.create_stream().to_mediator()
+        self.instrument.finish()
+        return(tfrecMed)
+    
+    
+def transcode_image(encoded, imgFormat):
+    # full decode and encode, only done on request
+    img = Image.open(io.BytesIO(encoded))
+    if imgFormat == 'jpeg' and img.mode not in ('L', 'RGB', 'CMYK'): img = img.convert('RGB')
+    transcoded = io.BytesIO()
+    img.save(transcoded, format=imgFormat.upper())
+    return(transcoded.getvalue())
+
+def load_image_bytes(task):
+    # image read once for several writers, see MediatorBranch
+    if task.get('encoded') is not None:
+        encoded = task['encoded']
+    # check than the picture exist
+    elif os.path.isfile(task['path']):
+        # import encoded image
+        with (tf.io.gfile.GFile if tf else open)(task['path'], 'rb') as fid: encoded = fid.read()
+    # if datatset is read from COCO dataset, images are downloaded from urls by TfrecordsWriter.fetch_images
+    elif task.get('downloaded') is not None:
+        encoded = task['downloaded']
+
+    # raise error if file doesnt exist and download is disable
+    else:
+         raise(Exception('Image at {} doesnt exist and download is not enable.\nIn case of reading from COCO dataset, enable download to construct .record file.'.format(task['path'])))
+    
+    # encoded bytes are embedded as they are, with the format found in their content rather than in the file name
+    imgFormat = detect_format(encoded)
+    if task['transcode'] and task['transcode'] != imgFormat:
+        return(transcode_image(encoded, task['transcode']), task['transcode'])
+    # the file extension is only used for formats other than JPEG and PNG
+    return(encoded, imgFormat or task['format'])
+
+def serialize_example(task):
+    """
+    Build and serialise one tf.train.Example, kept at module level so that it can run in worker processes.
+    
+    input: task: dict built by TfrecordsWriter.get_example_task
+    
+    output: the serialised example
+    """
+    encoded, imgFormat = load_image_bytes(task)
+    filename = task['fname'].encode('utf8')
     
+    # example features as (kind, values), kind being the tf.train.Feature list
+    features = {'image/height': ('int64', [task['height']]),
+                'image/width': ('int64', [task['width']]),
+                'image/filename': ('bytes', [filename]),
+                'image/source_id': ('bytes', [filename]),
+                'image/encoded': ('bytes', [encoded]),
+                'image/format': ('bytes', [imgFormat.encode('utf8')]),
+                'image/object/bbox/xmin': ('float', task['xmins']),
+                'image/object/bbox/xmax': ('float', task['xmaxs']),
+                'image/object/bbox/ymin': ('float', task['ymins']),
+                'image/object/bbox/ymax': ('float', task['ymaxs']),
+                'image/object/class/text': ('bytes', task['classes_text']),
+                'image/object/class/label': ('int64', task['labels'])}
+    if tf is None: return(encode_example(features))
     
+    # create tf variable example
+    tfFeatures = {'bytes': lambda values: tf.train.Feature(bytes_list=tf.train.BytesList(value=values)),
+                  'float': lambda values: tf.train.Feature(float_list=tf.train.FloatList(value=values)),
+                  'int64': lambda values: tf.train.Feature(int64_list=tf.train.Int64List(value=values))}
+    tfExample = tf.train.Example(features=tf.train.Features(feature={name: tfFeatures[kind](values) for name, (kind, values) in features.items()}))
+    return(tfExample.SerializeToString())
+
+
 class TfrecordsWriter: #https://github.com/tensorflow/models/blob/master/research/object_detection/g3doc/using_your_own_dataset.md
+    # derived data used by the writer (see MediatorClass.DERIVED_DATA)
+    derivedData = ('relative_corners', 'class_names', 'image_bytes')
+    
     def __init__(self):
         self.mediator = Mediator()
         self.dataFile = './tfrec_annot.record'
         self.labelsFname = './labels.pbtxt'
         self.enableDownload = False # in case of dataset read from coco, download is necessary to get images
+        self.numShards = 1
+        self.workers = 1
+        self.downloadCacheDir = None
+        self.downloadWorkers = 16
+        self.transcode = None
+        self.writeIndex = False
+        self.fetcher = None
+        self.instrument = NO_INSTRUMENTATION
         
     def set_enable_download(self, enableDownload):
-        if enableDownload: print('[INFO] Download has been enable, conversion could take some minutes depending to your Internet connection.')
+        if enableDownload: self.instrument.info('Download has been enable, conversion could take some minutes depending to your Internet connection.')
         self.enableDownload = enableDownload
     
+    def set_download(self, downloadCacheDir, downloadWorkers):
+        assert int(downloadWorkers) >= 1, 'downloadWorkers must be a positive number of threads.'
+        self.downloadCacheDir = downloadCacheDir
+        self.downloadWorkers = int(downloadWorkers)
+    
     def set_mediator(self, mediator):
-        assert type(mediator) is Mediator, 'mediator variables must be an Mediator object.'
+        assert isinstance(mediator, Mediator), 'mediator variables must be a Mediator or MediatorStream object.'
+        assert mediator.manifest is None, 'mediator has been read with a manifest and misses unchanged sources, read it without manifest to write a TFRecord file.'
         self.mediator = mediator
     
     def set_output_file(self, dataFile):
@@ -169,6 +385,19 @@ class TfrecordsWriter: #https://github.com/tensorflow/models/blob/master/researc
         
     def set_labels_file(self, labelsFname):
         self.labelsFname = os.path.abspath(labelsFname)
+    
+    def set_shards(self, numShards, workers):
+        assert int(numShards) >= 1, 'numShards must be a positive number of files.'
+        assert int(workers) >= 1, 'workers must be a positive number of processes.'
+        self.numShards = int(numShards)
+        self.workers = int(workers)
+        
+    def set_transcode(self, transcode):
+        assert transcode in (None, 'jpeg', 'png'), "transcode must be None, 'jpeg' or 'png'."
+        self.transcode = transcode
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
         
     def write_labelmap(self):
         labels = open(self.labelsFname, 'w')
@@ -178,94 +407,130 @@ class TfrecordsWriter: #https://github.com/tensorflow/models/blob/master/researc
             labels.write("  name: '" + classe['name'] + "'\n") 
             labels.write("}\n")
         labels.close()
+    
+    def get_shard_files(self):
+        # name-00000-of-00010.record like TensorFlow sharded files
+        if self.numShards == 1: return([self.dataFile])
+        root, ext = os.path.splitext(self.dataFile)
+        return(['{}-{:05d}-of-{:05d}{}'.format(root, idx, self.numShards, ext) for idx in range(self.numShards)])
+    
+    def get_example_task(self, img):
+        # everything a worker needs to build one example, class names are resolved here
+        height = img['height']
+        width = img['width']
+        
+        # all bboxs of the current image are normalised at once
+        relative = self.mediator.get_derived(img, 'relative_corners')
+        task = {'path': img['path'], 'fname': img['fname'], 'cocoURL': img['cocoURL'], 'flickrURL': img['flickrURL'],
+                'format': get_path_format(img['path']), 'transcode': self.transcode, 'height': height, 'width': width,
+                'xmins': relative['xmin'].tolist(),
+                'xmaxs': relative['xmax'].tolist(),
+                'ymins': relative['ymin'].tolist(),
+                'ymaxs': relative['ymax'].tolist(),
+                'classes_text': [name.encode('utf8') for name in self.mediator.get_derived(img, 'class_names')],
+                'labels': img['bboxs'].get_column('labelID').tolist()}
+        # otherwise images are read by the process building the example
+        if self.mediator.shares('image_bytes'): task['encoded'] = self.mediator.get_derived(img, 'image_bytes')
+        return(task)
+    
+    def get_download_url(self, task):
+        # only images missing on disk are downloaded
+        if os.path.isfile(task['path']): return(None)
+        if task['cocoURL']: return(task['cocoURL'])
+        if task['flickrURL']: return(task['flickrURL'])
+        raise(Exception('Download is enable but no URl is available for {} image. Check your URL assignment.'.format(task['fname'])))
+    
+    def fetch_images(self, tasks):
+        # downloads run in threads ahead of the examples being built, in images order
+        from ImageFetcher import ImageFetcher # requests is only needed to download images
+        self.fetcher = ImageFetcher(cacheDir=self.downloadCacheDir, workers=self.downloadWorkers,
+                                    maxInFlight=self.downloadWorkers*4)
+        for task, content in self.instrument.time_iter(self.fetcher.iter_fetch(tasks, self.get_download_url), 'download'):
+            task['downloaded'] = content
+            yield(task)
+    
+    def iter_examples(self):
+        # serialised examples in images order
+        tasks = (self.get_example_task(img) for img in self.instrument.track(self.mediator.iter_records(), 'written'))
+        if self.enableDownload: tasks = self.fetch_images(tasks)
+        if self.workers == 1:
+            for example in map(serialize_example, tasks):
+                yield(example)
+            return
+        
+        # submit images by batches so that a stream is never held entirely
+        batchSize = self.workers * 16
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                batch = [task for _, task in zip(range(batchSize), tasks)]
+                if not batch: break
+                for example in pool.map(serialize_example, batch, chunksize=max(1, batchSize // (self.workers*4))):
+                    yield(example)
         
     def write_annot(self):
-        writer = tf.io.TFRecordWriter(os.path.abspath(self.dataFile))
+        self.fetcher = None
+        shardFiles = self.get_shard_files()
+        writers = [(tf.io.TFRecordWriter if tf else TFRecordWriter)(shardFile) for shardFile in shardFiles]
+        # records size of each shard, for offsets indexes
+        sizes = [[] for _ in shardFiles]
         
-        # browse all images on our dataset
-        for img in self.mediator.imgList.list:
-            # check than the picture exist
-            if os.path.isfile(img['path']):
-                # import and encode image
-                with tf.io.gfile.GFile(img['path'], 'rb') as fid: encoded_jpg = fid.read()
-            # if datatset is read from COCO dataset, download images from urls
-            elif self.enableDownload:
-                if img['cocoURL']:
-                    download_jpg = Image.open(requests.get(img['cocoURL'], stream=True).raw)
-                elif img['flickrURL']:
-                    download_jpg = Image.open(requests.get(img['flickrURL'], stream=True).raw)
-                else:
-                    raise(Exception('Download is enable but no URl is available for {} image. Check your URL assignment.'.format(img['fname'])))
-                
-                encoded_jpg = io.BytesIO()
-                download_jpg.save(encoded_jpg, format='JPEG')
-                encoded_jpg = encoded_jpg.getvalue()
-
-            # raise error if file doesnt exist and download is disable
-            else:
-                 raise(Exception('Image at {} doesnt exist and download is not enable.\nIn case of reading from COCO dataset, enable download to construct .record file.'.format(img['path'])))
-            
-            # get image informations
-            filename = img['fname'].encode('utf8')
-            img_format = self.mediator.imgList.get_image_format(img['id']).encode('utf8')
-            height = img['height']
-            width = img['width']
-            
-            # initialize bboxs lists
-            xmins = []
-            xmaxs = []
-            ymins = []
-            ymaxs = []
-            classes_text = []
-            labels = []
-            
-            # browse all bboxs of the current image
-            for bbox in img['bboxs'].list:
-                xmins.append(bbox['x'] / width)
-                xmaxs.append((bbox['x']+bbox['width']) / width)
-                ymins.append(bbox['y'] / height)
-                ymaxs.append((bbox['y']+bbox['height']) / height)
-                classes_text.append(self.mediator.categList.get_class_name(bbox['labelID'])[0].encode('utf8'))
-                labels.append(bbox['labelID'])
-            
-            # create tf variable example
-            tfExample = tf.train.Example(features=tf.train.Features(feature={
-                                         'image/height': dataset_util.int64_feature(height),
-                                         'image/width': dataset_util.int64_feature(width),
-                                         'image/filename': dataset_util.bytes_feature(filename),
-                                         'image/source_id': dataset_util.bytes_feature(filename),
-                                         'image/encoded': dataset_util.bytes_feature(encoded_jpg),
-                                         'image/format': dataset_util.bytes_feature(img_format),
-                                         'image/object/bbox/xmin': dataset_util.float_list_feature(xmins),
-                                         'image/object/bbox/xmax': dataset_util.float_list_feature(xmaxs),
-                                         'image/object/bbox/ymin': dataset_util.float_list_feature(ymins),
-                                         'image/object/bbox/ymax': dataset_util.float_list_feature(ymaxs),
-                                         'image/object/class/text': dataset_util.bytes_list_feature(classes_text),
-                                         'image/object/class/label': dataset_util.int64_list_feature(labels)}))
-            # add tfExample to .record file
-            writer.write(tfExample.SerializeToString())
-        writer.close()
+        # images are dealt to shards in turn, so that assignment only depends on images order
+        for idx, example in enumerate(self.instrument.time_iter(self.iter_examples(), 'serialise')):
+            with self.instrument.stage('write'):
+                writers[idx % self.numShards].write(example)
+            sizes[idx % self.numShards].append(len(example) + RECORD_OVERHEAD)
+            self.instrument.count('bytes_written', len(example) + RECORD_OVERHEAD)
+        with self.instrument.stage('write'):
+            for writer in writers:
+                writer.close()
+        
+        if self.writeIndex:
+            for shardFile, shardSizes in zip(shardFiles, sizes):
+                offsets = np.cumsum([0] + shardSizes[:-1]) if shardSizes else []
+                write_index(get_index_fname(shardFile), offsets, shardSizes)
+        if self.fetcher:
+            self.instrument.count('downloads', self.fetcher.numDownloads)
+            self.instrument.count('cache_hits', self.fetcher.numCacheHits)
+            self.instrument.info("{} images downloaded, {} read from cache at {}".format(self.fetcher.numDownloads, self.fetcher.numCacheHits, self.fetcher.cacheDir))
     
-    def write(self, mediator, outputAnnotFile='./tfrec_annot.record', outputLabelsFile='./labels.pbtxt', enableDownload=False):
+    def write(self, mediator, outputAnnotFile='./tfrec_annot.record', outputLabelsFile='./labels.pbtxt', enableDownload=False, numShards=1, workers=1,
+              downloadCacheDir=None, downloadWorkers=16, transcode=None, writeIndex=False, instrument=None):
         """
         Translate Mediator class object to TFRecord annotation file.
         
-        input: mediator: Mediator object obtained by reading in another format
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
                outputAnnotFile: file path where .record annotation file will be stored
                outputLabelsFile: file path where .pbtxt labels file will be stored
                enableDownload: enable to download images in case of reading from COCO dataset (coco_url or flickr_url required)
+               numShards: number of .record files, written as name-00000-of-0000N.record when above 1.
+                          Images are dealt to shards in turn.
+               workers: number of processes building and serialising examples
+               downloadCacheDir: effective when enableDownload is enabled. Directory where downloaded images are kept,
+                                 so that another conversion never downloads them again. None (default) disables the cache.
+               downloadWorkers: effective when enableDownload is enabled. Number of threads downloading images.
+               transcode: None to embed images as they are, 'jpeg' or 'png' to convert images in another format.
+                          image/format is read from images content ('jpeg' or 'png'), the file extension is only used for other formats.
+               writeIndex: also write records offsets of each .record file in a .idx file, for random access and parallel reading
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           its profile is reported at the end
 
         for more informations about TFRecords annotation format: https://github.com/tensorflow/models/blob/master/research/object_detection/g3doc/using_your_own_dataset.md
         """
         # set variables
+        self.set_instrumentation(instrument)
         self.set_mediator(mediator)
         self.set_output_file(outputAnnotFile)
         self.set_labels_file(outputLabelsFile)
         self.set_enable_download(enableDownload)
+        self.set_shards(numShards, workers)
+        self.set_download(downloadCacheDir, downloadWorkers)
+        self.set_transcode(transcode)
+        self.writeIndex = writeIndex
         
-        # write files
-        self.write_labelmap()
-        print("[INFO] Successfully created label map at {}".format(self.labelsFname))
-        print("[INFO] Writing TFRecords annotation file...")
+        # write files, label map last as a stream may discover classes while being browsed
+        self.instrument.info("Writing TFRecords annotation file...")
         self.write_annot()
-        print("[INFO] Successfully created annotation file at {}".format(self.dataFile))
+        self.instrument.info("Successfully created annotation file at {}".format(self.dataFile))
+        self.write_labelmap()
+        self.instrument.info("Successfully created label map at {}".format(self.labelsFname))
+        self.instrument.finish()
@@ -1,15 +1,93 @@
 # -*- coding: utf-8 -*-
 
 import os
-import csv
-from PIL import Image
+import numpy as np
 
-from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+from ImageProbe import probe_image
+from Instrumentation import NO_INSTRUMENTATION
+from MediatorClass import Mediator, MediatorStream, MediatorImages, MediatorCategories, split_bboxs
+
+# images extensions paired with annotations files
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MAX_REPORTED_FILES = 10
+# number of annotations files read and parsed at once
+LABELS_BATCH = 4096
+# bytes split by bytes.split()
+WHITESPACES = np.zeros(256, dtype=bool)
+WHITESPACES[list(b' \t\n\r\x0b\x0c')] = True
+
+def count_line_fields(data):
+    """
+    input: data: bytes whose lines all end with a newline
+    
+    output: int array of the number of whitespace separated fields of each line
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    spaces = WHITESPACES[data]
+    # a field starts with a non whitespace byte following a whitespace or the start of data
+    starts = np.flatnonzero(~spaces & np.concatenate(([True], spaces[:-1])))
+    return(np.diff(np.searchsorted(starts, np.flatnonzero(data == ord('\n'))), prepend=0))
+
+def parse_yolo_rows(content, txtFile):
+    # blank lines or extra columns, only the first 5 fields of each row are used
+    rows = [line.split() for line in content.splitlines() if line.strip()]
+    if any(len(row) < 5 for row in rows): raise(Exception('Invalid YOLO annotation file {}, each row must have 5 fields.'.format(txtFile)))
+    return([field for row in rows for field in row[:5]])
+
+def parse_yolo_labels(contents, txtFiles):
+    """
+    Parse the rows of several YOLO annotations files at once.
+    
+    input: contents: list of annotations files contents (bytes)
+           txtFiles: paths of the annotations files, for error messages
+    
+    output: a float array of all rows (class number, x center, y center, width, height), and the number of rows of each file
+    """
+    contents = [content if not content or content.endswith(b'\n') else content + b'\n' for content in contents]
+    numLines = [content.count(b'\n') for content in contents]
+    batch = b''.join(contents)
+    lineFields = count_line_fields(batch)
+    if (lineFields == 5).all():
+        # files of the batch are split at once when every line has 5 fields
+        fields = batch.split()
+        counts = numLines
+    else:
+        fields = []
+        counts = []
+        ends = np.cumsum(numLines).tolist()
+        for content, txtFile, start, end in zip(contents, txtFiles, [0] + ends, ends):
+            fileFields = content.split() if (lineFields[start:end] == 5).all() else parse_yolo_rows(content, txtFile)
+            fields.extend(fileFields)
+            counts.append(len(fileFields) // 5)
+    return(np.array(fields, dtype=np.float64).reshape(-1, 5), np.array(counts, dtype=np.int64))
+
+def get_pixel_bboxs(rows, counts, widths, heights):
+    """
+    Convert YOLO rows to bboxs in pixels, sizes and centers being truncated to whole pixels.
+    
+    input: rows: float array of rows given by parse_yolo_labels
+           counts: number of rows of each image
+           widths, heights: arrays of images dimensions
+    
+    output: a dict of bboxs columns ('labelID', 'x', 'y', 'width', 'height')
+    """
+    w = np.repeat(widths, counts)
+    h = np.repeat(heights, counts)
+    bboxW = np.trunc(rows[:, 3] * w)
+    bboxH = np.trunc(rows[:, 4] * h)
+    return({'labelID': rows[:, 0].astype(np.int64) + 1, # mediator categories ID start with 1
+            'x': np.trunc(rows[:, 1] * w) - bboxW/2, 'y': np.trunc(rows[:, 2] * h) - bboxH/2,
+            'width': bboxW, 'height': bboxH})
 
 class YoloReader:
     def __init__(self):
         self.alljpg = []
         self.alltxt = []
+        self.orphanImgs = []
+        self.orphanTxts = []
+        self.recursive = False
+        self.manifest = None
+        self.instrument = NO_INSTRUMENTATION
         self.mediatorCateg = MediatorCategories()
         self.mediatorImgs = MediatorImages()
         
@@ -19,7 +97,8 @@ class YoloReader:
     def set_data_dir(self, dataDir):
         assert os.path.isdir(dataDir), "Data path must be an existing directory."
         self.dataDir = os.path.abspath(dataDir)
-        self.get_available_data()
+        with self.instrument.stage('scan'):
+            self.get_available_data()
         
     def set_names_fname(self, namesFname):
         assert os.path.isfile(namesFname), "Names file must exist."
@@ -33,68 +112,162 @@ class YoloReader:
             self.mediatorCateg.append(ID=index, name=line.replace('\n',''))
             index += 1
     
+    def set_recursive(self, recursive):
+        self.recursive = recursive
+    
+    def set_manifest(self, manifest):
+        self.manifest = manifest
+        if manifest: manifest.check_shared(self.namesFname)
+
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
+
     def get_available_data(self):
-        self.alljpg = [f for f in os.listdir(self.dataDir) if f.endswith(".jpg")]
-        self.alltxt = [f for f in os.listdir(self.dataDir) if f.endswith(".txt")]
+        # index images and annotations by path without extension in a single pass over the folders
+        self.imgsByStem = {}
+        self.txtsByStem = {}
+        self.duplicateImgs = []
+        folders = [self.dataDir]
+        while folders:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    # symbolic links to folders are not followed, so that a link to a parent folder never loops
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive: folders.append(entry.path)
+                        continue
+                    stem, ext = os.path.splitext(entry.path)
+                    ext = ext.lower()
+                    if ext in IMG_EXTENSIONS:
+                        # with several images for one annotation, the first extension of IMG_EXTENSIONS wins
+                        if stem in self.imgsByStem:
+                            previous = self.imgsByStem[stem]
+                            if IMG_EXTENSIONS.index(ext) < IMG_EXTENSIONS.index(os.path.splitext(previous)[1].lower()):
+                                self.imgsByStem[stem] = entry.path
+                                self.duplicateImgs.append(previous)
+                            else:
+                                self.duplicateImgs.append(entry.path)
+                        else:
+                            self.imgsByStem[stem] = entry.path
+                    elif ext == '.txt':
+                        self.txtsByStem[stem] = entry.path
         self.check_pairing()
+        if self.recursive: self.check_names()
+    
+    def report_files(self, files, message):
+        # one line for all files, with a few examples
+        if files:
+            examples = ', '.join(os.path.relpath(f, self.dataDir) for f in files[:MAX_REPORTED_FILES])
+            if len(files) > MAX_REPORTED_FILES: examples += ', ...'
+            self.instrument.info("{} {} ({})".format(len(files), message, examples))
     
     def check_pairing(self):
-        # check than all jpg files have an associated txt file
-        for idxJpg, jpgFile in enumerate(self.alljpg):
-            find = False
-            for idxTxt, txtFile in enumerate(self.alltxt):
-                if os.path.splitext(jpgFile)[0] == os.path.splitext(txtFile)[0]:
-                    find = True
-                    break
-            if not find:
-                print("[INFO] {} has no annotation file. Check images and annotations are in the same folder.".format(jpgFile))
-                self.alljpg.remove(jpgFile)
-        
-         # check than all txt files have an associated jpg file
-        for idxTxt, txtFile in enumerate(self.alltxt):
-            find = False
-            for idxJpg, jpgFile in enumerate(self.alljpg):
-                if os.path.splitext(jpgFile)[0] == os.path.splitext(txtFile)[0]:
-                    find = True
-                    break
-            if not find:
-                print("[INFO] {} has no image associated. Check images and annotations are in the same folder.".format(txtFile))
-                self.alltxt.remove(txtFile)
-        
-    def create_mediator_imgs(self):
-        self.mediatorImgs = MediatorImages()
+        # images and annotations are paired by path without extension
+        self.alljpg = [self.imgsByStem[stem] for stem in self.imgsByStem if stem in self.txtsByStem]
+        self.alltxt = [self.txtsByStem[stem] for stem in self.imgsByStem if stem in self.txtsByStem]
+        self.orphanImgs = [imgFile for stem, imgFile in self.imgsByStem.items() if stem not in self.txtsByStem]
+        self.orphanTxts = [txtFile for stem, txtFile in self.txtsByStem.items() if stem not in self.imgsByStem]
         
+        self.report_files(self.orphanImgs, "images have no annotation file. Check images and annotations are in the same folder.")
+        self.report_files(self.orphanTxts, "annotation files have no image associated. Check images and annotations are in the same folder.")
+        self.report_files(self.duplicateImgs, "images are ignored as another image has the same name.")
+    
+    def check_names(self):
+        # writers name annotation files after images names, images of several subfolders must then have different names
+        folderByName = {}
+        duplicates = []
         for imgFile in self.alljpg:
-            imgFile = os.path.join(self.dataDir, imgFile)
-            txtFile = os.path.splitext(imgFile)[0] + '.txt'
-            # open annotations file with csv to use delimiters
-            yoloAnnot = open(txtFile, 'r')
-            readCSV = csv.reader(yoloAnnot, delimiter=' ')
+            name = os.path.splitext(os.path.basename(imgFile))[0]
+            if name in folderByName: duplicates.append(imgFile)
+            else: folderByName[name] = imgFile
+        if duplicates:
+            examples = ', '.join('{} and {}'.format(os.path.relpath(folderByName[os.path.splitext(os.path.basename(imgFile))[0]], self.dataDir),
+                                                    os.path.relpath(imgFile, self.dataDir)) for imgFile in duplicates[:MAX_REPORTED_FILES])
+            if len(duplicates) > MAX_REPORTED_FILES: examples += ', ...'
+            raise(Exception('{} images of subfolders have the same name as another image, their annotations would overwrite each other: {}.'.format(len(duplicates), examples)))
+        
+    def create_stream(self):
+        stream = MediatorStream(objCateg=self.mediatorCateg, manifest=self.manifest)
+        stream.records = self.instrument.track(self.iter_records(stream), 'read')
+        self.instrument.set_total(len(self.alljpg))
+        return(stream)
+    
+    def iter_records(self, stream):
+        pairs = zip(self.alljpg, self.alltxt)
+        # skip files unchanged since the last incremental conversion
+        if self.manifest: pairs = ((imgFile, txtFile) for imgFile, txtFile in pairs if self.manifest.check([txtFile, imgFile]))
+        
+        # annotations files are read and parsed by batches
+        while True:
+            batch = [pair for _, pair in zip(range(LABELS_BATCH), pairs)]
+            if not batch: break
+            for record in self.create_batch_records(stream, batch):
+                yield(record)
+    
+    def create_batch_records(self, stream, batch):
+        # read images headers to get their dimensions
+        with self.instrument.stage('probe'):
+            sizes = [probe_image(imgFile) for imgFile, _ in batch]
+        
+        with self.instrument.stage('read'):
+            contents = []
+            for _, txtFile in batch:
+                with open(txtFile, 'rb') as yoloAnnot:
+                    contents.append(yoloAnnot.read())
+        self.instrument.count('bytes_read', sum(len(content) for content in contents))
+        
+        with self.instrument.stage('parse'):
+            # all rows of the batch are converted to pixels at once, then split by image
+            rows, counts = parse_yolo_labels(contents, [txtFile for _, txtFile in batch])
+            columns = get_pixel_bboxs(rows, counts, np.array([size[0] for size in sizes], dtype=np.float64),
+                                      np.array([size[1] for size in sizes], dtype=np.float64))
+            columns['id'] = stream.get_new_bbox_ids(len(rows))
+            bboxsList = split_bboxs(np.concatenate(([0], np.cumsum(counts))).tolist(), **columns)
             
-            # open image to get its dimensions
-            img = Image.open(imgFile)
-            w, h = img.size
-            depth = len(img.split())
-
-            mediatorBboxs = MediatorBboxs()
-            for row in readCSV:
-                classID = int(row[0])
-                bboxH = float(int(float(row[4]) * h))
-                bboxW = float(int(float(row[3]) * w))
-                xmin = int(float(row[1]) * w) - bboxW/2
-                ymin = int(float(row[2]) * h) - bboxH/2
-                
-                mediatorBboxs.append(ID=self.mediatorImgs.get_new_bbox_id(), labelID=classID+1, # mediator categories ID start with 1
-                                     x=xmin, y=ymin, height=bboxH, width=bboxW)
-            self.mediatorImgs.append(path=imgFile, width=w, height=h, depth=depth, bboxs=mediatorBboxs, handlepath=True)
-        yoloAnnot.close()
+            # paths found by get_available_data are already absolute
+            records = []
+            for (imgFile, txtFile), (w, h, depth), mediatorBboxs in zip(batch, sizes, bboxsList):
+                imgDir, fname = os.path.split(imgFile)
+                records.append(stream.create_record(path=imgFile, folder=os.path.basename(imgDir), fname=fname, width=w, height=h, depth=depth,
+                                                    bboxs=mediatorBboxs, sourceFiles=[txtFile, imgFile], handlepath=False))
+        return(records)
+    
+    def create_mediator_imgs(self):
+        self.mediatorImgs = self.create_stream().to_mediator().imgList
+    
+    def translate2stream(self, dataDir, namesFname, recursive=False, manifest=None, instrument=None):
+        """
+        Translate Yolo files to MediatorStream Class, images are read one by one while the stream is browsed.
+        
+        input: dataDir: folder path containing images and yolo annotations (images and annotations must have the same name)
+               namesFname: file path containing classes names at Yolo format
+               recursive: also look for images (.jpg/.jpeg/.png) and annotations in subfolders, images of all folders must have different names
+               manifest: ConversionManifest object of an incremental conversion, only files changed since the last run are read.
+                         The same manifest must be given to the writer.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
+               
+        output: a MediatorStream Class object yielding images records
+        """
+        # set variables
+        self.set_instrumentation(instrument)
+        self.set_recursive(recursive)
+        self.set_data_dir(dataDir)
+        self.set_names_fname(namesFname)
+        self.set_manifest(manifest)
+        
+        # create mediator stream
+        self.instrument.info('Streaming YOLO annotations ...')
+        return(self.create_stream())
         
-    def translate2mediator(self, dataDir, namesFname):
+    def translate2mediator(self, dataDir, namesFname, recursive=False, manifest=None, instrument=None):
         """
         Translate Yolo files to Mediator Class.
         
         input: dataDir: folder path containing images and yolo annotations (images and annotations must have the same name)
                namesFname: file path containing classes names at Yolo format
+               recursive: also look for images (.jpg/.jpeg/.png) and annotations in subfolders, images of all folders must have different names
+               manifest: ConversionManifest object of an incremental conversion, only files changed since the last run are read.
+                         The same manifest must be given to the writer.
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress
                
         output: a Mediator Class object containing annotations and classes informations
         
@@ -102,23 +275,29 @@ class YoloReader:
         for more informations about Yolo annotation format: https://github.com/AlexeyAB/Yolo_mark/issues/60
         """
         # set variables
+        self.set_instrumentation(instrument)
+        self.set_recursive(recursive)
         self.set_data_dir(dataDir)
         self.set_names_fname(namesFname)
-        
-        # create classes dict 
-        self.create_mediator_categ()
+        self.set_manifest(manifest)
         
         # create mediator objects
-        print('[INFO] Loading YOLO annotations ...')
+        self.instrument.info('Loading YOLO annotations ...')
         self.create_mediator_imgs()
-        return(Mediator(objImgs=self.mediatorImgs, objCateg=self.mediatorCateg))
+        self.instrument.finish()
+        return(Mediator(objImgs=self.mediatorImgs, objCateg=self.mediatorCateg, manifest=self.manifest))
         
     
 class YoloWriter:
+    # derived data used by the writer (see MediatorClass.DERIVED_DATA)
+    derivedData = ('relative_centers',)
+    
     def __init__(self):
         self.mediator = Mediator()
         self.dataDir = './yolo_annot/'
         self.namesFname = './yolo.names'
+        self.manifest = None
+        self.instrument = NO_INSTRUMENTATION
         
     def set_output_dir(self, outputAnnotDir):
         if not os.path.isdir(outputAnnotDir):
@@ -129,40 +308,51 @@ class YoloWriter:
         self.namesFname = os.path.abspath(outputNamesFname)
         
     def set_mediator(self, mediator):
-        assert type(mediator) is Mediator, 'mediator variable must be a Mediator object.'
+        assert isinstance(mediator, Mediator), 'mediator variable must be a Mediator or MediatorStream object.'
         self.mediator = mediator
+    
+    def set_instrumentation(self, instrument):
+        self.instrument = instrument or NO_INSTRUMENTATION
         
     def write_names(self):
         names = open(self.namesFname, 'w')
         for index in range(self.mediator.categList.get_num_classes()):
             names.write("{}\n".format(self.mediator.categList.get_class_name(index+1)[0]))
         names.close()
-        print("[INFO] Successfully created .names file at {}".format(self.namesFname))
+        self.instrument.info("Successfully created .names file at {}".format(self.namesFname))
     
     def write_annot(self):
-        for imgObject in self.mediator.imgList.list:       
-            txtFname = os.path.splitext(os.path.basename(imgObject['path']))[0] + '.txt'
-            txtFile = os.path.join(self.dataDir, txtFname)
-            yoloAnnot = open(txtFile, 'w')
-            
-            for bbox in imgObject['bboxs'].list:
-                labelnum = int(bbox['labelID']-1)
-                relW = float(bbox['width'] / imgObject['width'])
-                relH = float(bbox['height'] / imgObject['height'])
-                relX = float((bbox['x'] + bbox['width']/2) / imgObject['width'])
-                relY = float((bbox['y'] + bbox['height']/2) / imgObject['height'])
+        for imgObject in self.instrument.track(self.mediator.iter_records(), 'written'):
+            with self.instrument.stage('write'):
+                txtFname = os.path.splitext(os.path.basename(imgObject['path']))[0] + '.txt'
+                txtFile = os.path.join(self.dataDir, txtFname)
+                yoloAnnot = open(txtFile, 'w')
+                
+                # all bboxs of the current image are normalised at once
+                relative = self.mediator.get_derived(imgObject, 'relative_centers')
+                labelnums = [labelID - 1 for labelID in imgObject['bboxs'].get_column('labelID')]
+                
+                for row in zip(labelnums, relative['x'].tolist(), relative['y'].tolist(), relative['width'].tolist(), relative['height'].tolist()):
+                    yoloAnnot.write("{} {:0.6f} {:0.6f} {:0.6f} {:0.6f}\n".format(*row))
+                self.instrument.count('bytes_written', yoloAnnot.tell())
+                yoloAnnot.close()
             
-                yoloAnnot.write("{} {:0.6f} {:0.6f} {:0.6f} {:0.6f}\n".format(labelnum, relX, relY, relW, relH))
-            yoloAnnot.close()
+            if self.manifest and imgObject['sourceFiles']:
+                self.manifest.set_outputs(imgObject['sourceFiles'], [txtFile])
         
         
-    def write(self, mediator, outputAnnotDir='./yolo_annot/', outputNamesFname='./yolo.names'):
+    def write(self, mediator, outputAnnotDir='./yolo_annot/', outputNamesFname='./yolo.names', manifest=None, instrument=None):
         """
         Translate Mediator class object to Yolo annotations files.
         
-        input: mediator: Mediator object obtained by reading in another format
+        input: mediator: Mediator or MediatorStream object obtained by reading in another format
                outputAnnotDir: folder path where annotations will be stored
                outputNamesFname: file path where classes names will be stored
+               manifest: ConversionManifest object given to the reader for an incremental conversion,
+                         outputs of deleted sources are removed and the manifest is saved at the end.
+                         Given to the writer only, all sources are written and recorded for the next runs
+               instrument: Instrumentation object (e.g. Profiler) receiving messages, stages timings, counters and progress,
+                           its profile is reported at the end
 
         for more informations about Yolo annotation format: https://github.com/AlexeyAB/Yolo_mark/issues/60
         """
@@ -170,10 +360,14 @@ class YoloWriter:
         self.set_mediator(mediator)
         self.set_output_dir(outputAnnotDir)
         self.set_output_namesfile(outputNamesFname)
+        self.manifest = manifest
+        self.set_instrumentation(instrument)
         
-        # write files
-        self.write_names()
-        print("[INFO] Successfully created label map at {}".format(self.namesFname))
-        print("[INFO] Writing YOLO annotations files ...")
+        # write files, names last as a stream may discover classes while being browsed
+        self.instrument.info("Writing YOLO annotations files ...")
         self.write_annot()
-        print("[INFO] Successfully created annotations files at {}".format(self.dataDir))
+        self.instrument.info("Successfully created annotations files at {}".format(self.dataDir))
+        self.write_names()
+        self.instrument.info("Successfully created label map at {}".format(self.namesFname))
+        if self.manifest: self.manifest.finish(self.mediator.categList, self.instrument)
+        self.instrument.finish()
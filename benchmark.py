@@ -0,0 +1,648 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+
+from PIL import Image
+
+from FormatRegistry import FORMATS, convert, convert_many, get_reader, get_writer
+from ImageProbe import probe_image
+from Instrumentation import Instrumentation, Profiler
+from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+from CocoDataClass import CocoReader
+from PascalVocDataClass import PascalVocReader, PascalVocWriter
+from SnapshotDataClass import SnapshotReader, SnapshotWriter
+
+
+def make_mediator(numImgs, bboxsPerImg=4, numClasses=20, imgFile=None, imgDir=None):
+    # synthetic Mediator with fixed-size images and bboxs spread over the classes, all images may share one existing imgFile
+    # or be named 0000001.jpg, 0000002.jpg, ... in imgDir
+    mediatorCateg = MediatorCategories()
+    for idx in range(numClasses):
+        mediatorCateg.append(ID=idx+1, name='class{}'.format(idx))
+    
+    mediatorImgs = MediatorImages()
+    for idx in range(numImgs):
+        mediatorBboxs = MediatorBboxs()
+        for idxBox in range(bboxsPerImg):
+            mediatorBboxs.append(ID=mediatorImgs.get_new_bbox_id(), labelID=(idx+idxBox) % numClasses + 1,
+                                 x=10.0+idxBox, y=20.0+idxBox, width=100.0, height=50.0)
+        mediatorImgs.append(path=imgFile or os.path.join(imgDir or '/tmp/synthetic', '{:07d}.jpg'.format(idx+1)), width=640, height=480, depth=3, bboxs=mediatorBboxs)
+    return(Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg))
+
+
+def make_coco_json(jsonFname, numAnnots, annotsPerImg=8, numClasses=80):
+    # synthetic COCO file, roughly 8 annotations per image like COCO instances files
+    numImgs = max(1, numAnnots // annotsPerImg)
+    outJson = {'info': {'year': 2021, 'version': '1.0', 'description': 'benchmark', 'contributor': 'benchmark',
+                        'url': 'http://unknown.org', 'date_created': '2021-01-01'},
+               'licenses': [{'id':1, 'url':'https://creativecommons.org/publicdomain/zero/1.0/', 'name':'Public Domain'}],
+               'categories': [{'id': idx+1, 'name': 'class{}'.format(idx), 'supercategory': 'Unspecified'} for idx in range(numClasses)],
+               'images': [{'id': idx+1, 'width': 640, 'height': 480, 'file_name': '{:07d}.jpg'.format(idx+1), 'license': 1}
+                          for idx in range(numImgs)],
+               'annotations': [{'id': idx+1, 'image_id': (idx % numImgs)+1, 'category_id': (idx % numClasses)+1,
+                                'bbox': [10.0, 20.0, 100.0, 50.0], 'iscrowd': 0, 'segmentation': [0,0,0], 'area': 0.0}
+                               for idx in range(numAnnots)]}
+    jsonOpen = open(jsonFname, 'w')
+    json.dump(outJson, jsonOpen)
+    jsonOpen.close()
+
+
+def bench_coco_load(scales=(10000, 100000, 1000000)):
+    """
+    Time CocoReader.translate2mediator on synthetic COCO files.
+    
+    input: scales: numbers of annotations to benchmark
+    """
+    tmpDir = tempfile.mkdtemp()
+    for numAnnots in scales:
+        jsonFname = os.path.join(tmpDir, 'coco_{}.json'.format(numAnnots))
+        make_coco_json(jsonFname, numAnnots)
+        
+        start = time.perf_counter()
+        CocoReader().translate2mediator(jsonFname=jsonFname)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] coco_load annotations={} seconds={:.3f} annotations/s={:.0f}'.format(numAnnots, elapsed, numAnnots/elapsed))
+        os.remove(jsonFname)
+    os.rmdir(tmpDir)
+
+
+def coco_parse_child(jsonFname, incremental):
+    # run in its own process so that peak RSS only accounts for one parsing
+    start = time.perf_counter()
+    mediator = CocoReader().translate2stream(jsonFname=jsonFname, incremental=incremental)
+    numImgs = sum(1 for record in mediator.iter_records())
+    elapsed = time.perf_counter() - start
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'images': numImgs, 'seconds': elapsed, 'peak_rss_mb': peakRss}))
+
+
+def bench_coco_parse(scales=(100000, 1000000)):
+    """
+    Compare peak RSS and wall time of incremental COCO parsing against json.load.
+    
+    input: scales: numbers of annotations to benchmark
+    """
+    tmpDir = tempfile.mkdtemp()
+    for numAnnots in scales:
+        jsonFname = os.path.join(tmpDir, 'coco_{}.json'.format(numAnnots))
+        make_coco_json(jsonFname, numAnnots)
+        sizeMb = os.path.getsize(jsonFname) / 1024**2
+        
+        for incremental in (False, True):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '_coco_parse_child', jsonFname, str(int(incremental))],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print('[BENCH] coco_parse annotations={} file_mb={:.1f} mode={} seconds={:.3f} peak_rss_mb={:.1f}'.format(
+                  numAnnots, sizeMb, 'incremental' if incremental else 'json.load', result['seconds'], result['peak_rss_mb']))
+        os.remove(jsonFname)
+    os.rmdir(tmpDir)
+
+
+def bench_voc_workers(numImgs=20000, workers=(1, 2, 4, 8, 16)):
+    """
+    Time PascalVocReader.translate2mediator on a synthetic PascalVOC folder for several numbers of worker processes.
+    
+    input: numImgs: number of annotation files
+           workers: numbers of worker processes to benchmark
+    """
+    tmpDir = tempfile.mkdtemp()
+    PascalVocWriter().write(mediator=make_mediator(numImgs), outputAnnotDir=tmpDir)
+    
+    for numWorkers in workers:
+        start = time.perf_counter()
+        PascalVocReader().translate2mediator(dataDir=tmpDir, workers=numWorkers)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] voc_workers files={} workers={} seconds={:.3f} files/s={:.0f}'.format(numImgs, numWorkers, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_voc_write(numImgs=100000, workers=(1, 4)):
+    """
+    Time PascalVocWriter.write with ElementTree against templates, with several numbers of threads.
+    
+    input: numImgs: number of annotation files
+           workers: numbers of threads to benchmark with templates
+    """
+    mediator = make_mediator(numImgs)
+    tmpDir = tempfile.mkdtemp()
+    
+    runs = [('etree', {'useTemplates': False})] + [('templates workers={}'.format(num), {'workers': num}) for num in workers]
+    for name, kwargs in runs:
+        start = time.perf_counter()
+        PascalVocWriter().write(mediator=mediator, outputAnnotDir=tmpDir, **kwargs)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] voc_write files={} engine={} seconds={:.3f} files/s={:.0f}'.format(numImgs, name, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_image_probe(numImgs=500, size=(1360, 800)):
+    """
+    Compare images/s when getting image dimensions with PIL full decoding against header probing.
+    
+    input: numImgs: number of JPEG images
+           size: width and height of images
+    """
+    tmpDir = tempfile.mkdtemp()
+    imgFiles = [os.path.join(tmpDir, '{:07d}.jpg'.format(idx)) for idx in range(numImgs)]
+    img = Image.effect_noise(size, 64).convert('RGB')
+    for imgFile in imgFiles:
+        img.save(imgFile)
+    
+    def pil_split(imgFile):
+        img = Image.open(imgFile)
+        return(img.size[0], img.size[1], len(img.split()))
+    
+    for name, probe in (('pil_split', pil_split), ('header', probe_image)):
+        start = time.perf_counter()
+        for imgFile in imgFiles:
+            probe(imgFile)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] image_probe images={} method={} seconds={:.3f} images/s={:.0f}'.format(numImgs, name, elapsed, numImgs/elapsed))
+    
+    for imgFile in imgFiles:
+        os.remove(imgFile)
+    os.rmdir(tmpDir)
+
+
+def bench_tfrecord_write(numImgs=5000, workers=(1, 2, 4, 8), numShards=8):
+    """
+    Time TfrecordsWriter.write for several numbers of worker processes, TensorFlow is required.
+    
+    input: numImgs: number of examples
+           workers: numbers of worker processes to benchmark
+           numShards: number of .record files
+    """
+    from TfrecordsDataClass import TfrecordsWriter
+    
+    tmpDir = tempfile.mkdtemp()
+    imgFile = os.path.join(tmpDir, 'img.jpg')
+    Image.effect_noise((640, 480), 64).convert('RGB').save(imgFile)
+    mediator = make_mediator(numImgs, imgFile=imgFile)
+    
+    for numWorkers in workers:
+        start = time.perf_counter()
+        TfrecordsWriter().write(mediator=mediator, outputAnnotFile=os.path.join(tmpDir, 'bench.record'), outputLabelsFile=os.path.join(tmpDir, 'bench.pbtxt'),
+                                numShards=numShards, workers=numWorkers)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] tfrecord_write images={} shards={} workers={} seconds={:.3f} images/s={:.0f}'.format(numImgs, numShards, numWorkers, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_tfrecord_read(numImgs=5000):
+    """
+    Compare images/s when reading annotations of a TFRecord file with and without decoding images, TensorFlow is required.
+    
+    input: numImgs: number of examples
+    """
+    import tensorflow as tf
+    from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+    
+    tmpDir = tempfile.mkdtemp()
+    imgFile = os.path.join(tmpDir, 'img.jpg')
+    Image.effect_noise((640, 480), 64).convert('RGB').save(imgFile)
+    tfrecFname = os.path.join(tmpDir, 'bench.record')
+    labelsFname = os.path.join(tmpDir, 'bench.pbtxt')
+    TfrecordsWriter().write(mediator=make_mediator(numImgs, imgFile=imgFile), outputAnnotFile=tfrecFname, outputLabelsFile=labelsFname)
+    
+    def read_decode():
+        # annotations plus the image decoding done by the reader before
+        reader = TfrecordsReader()
+        reader.translate2mediator(tfrecFname, labelsFname)
+        for features in tf.data.TFRecordDataset(tfrecFname).batch(reader.batchSize).map(reader.extract_fn):
+            for encoded in features['image/encoded'].values:
+                tf.io.decode_image(encoded)
+    
+    def read_annotations():
+        TfrecordsReader().translate2mediator(tfrecFname, labelsFname)
+    
+    for name, read in (('decode', read_decode), ('annotations', read_annotations)):
+        start = time.perf_counter()
+        read()
+        elapsed = time.perf_counter() - start
+        print('[BENCH] tfrecord_read images={} method={} seconds={:.3f} images/s={:.0f}'.format(numImgs, name, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_tfrecord_parse(numImgs=50000, batchSizes=(16, 256, 1024)):
+    """
+    Compare examples/s when reading annotations of a TFRecord file for several parsing batch sizes, TensorFlow is required.
+    
+    input: numImgs: number of examples
+           batchSizes: numbers of examples parsed at once to benchmark
+    """
+    from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+    
+    # small images, so that parsing annotations is timed rather than reading images
+    tmpDir = tempfile.mkdtemp()
+    imgFile = os.path.join(tmpDir, 'img.jpg')
+    Image.effect_noise((32, 32), 64).convert('RGB').save(imgFile)
+    tfrecFname = os.path.join(tmpDir, 'bench.record')
+    labelsFname = os.path.join(tmpDir, 'bench.pbtxt')
+    TfrecordsWriter().write(mediator=make_mediator(numImgs, imgFile=imgFile), outputAnnotFile=tfrecFname, outputLabelsFile=labelsFname)
+    
+    for batchSize in batchSizes:
+        start = time.perf_counter()
+        TfrecordsReader().translate2mediator(tfrecFname, labelsFname, batchSize=batchSize)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] tfrecord_parse images={} batch_size={} seconds={:.3f} images/s={:.0f}'.format(numImgs, batchSize, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_tfrecord_index(numImgs=50000, workers=(1, 2, 4, 8), numSamples=1000):
+    """
+    Time building the offsets index of a TFRecord file, reading random examples with it and reading the whole file
+    with several worker processes.
+    
+    input: numImgs: number of examples
+           workers: numbers of worker processes to benchmark
+           numSamples: number of examples read at random positions
+    """
+    import random
+    from TfrecordCodec import TFRecordFile, build_index
+    from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+    
+    tmpDir = tempfile.mkdtemp()
+    imgFile = os.path.join(tmpDir, 'img.jpg')
+    Image.effect_noise((32, 32), 64).convert('RGB').save(imgFile)
+    tfrecFname = os.path.join(tmpDir, 'bench.record')
+    labelsFname = os.path.join(tmpDir, 'bench.pbtxt')
+    TfrecordsWriter().write(mediator=make_mediator(numImgs, imgFile=imgFile), outputAnnotFile=tfrecFname, outputLabelsFile=labelsFname)
+    
+    start = time.perf_counter()
+    build_index(tfrecFname)
+    print('[BENCH] tfrecord_index build images={} seconds={:.3f}'.format(numImgs, time.perf_counter() - start))
+    
+    recordFile = TFRecordFile(tfrecFname)
+    start = time.perf_counter()
+    for position in random.sample(range(numImgs), numSamples):
+        recordFile.get_record(position)
+    elapsed = time.perf_counter() - start
+    recordFile.close()
+    print('[BENCH] tfrecord_index random_reads={} seconds={:.3f} reads/s={:.0f}'.format(numSamples, elapsed, numSamples/elapsed))
+    
+    for numWorkers in workers:
+        start = time.perf_counter()
+        TfrecordsReader().translate2mediator(tfrecFname, labelsFname, workers=numWorkers)
+        elapsed = time.perf_counter() - start
+        print('[BENCH] tfrecord_index read images={} workers={} seconds={:.3f} images/s={:.0f}'.format(numImgs, numWorkers, elapsed, numImgs/elapsed))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_tfrecord_codec(numImgs=2000, repeats=3):
+    """
+    Compare import time of TensorFlow against the pure Python codec, then time writing records with each
+    when TensorFlow is installed. tests/test_tfrecord_codec.py checks that both give the same records.
+    
+    input: numImgs: number of examples written
+           repeats: number of imports timed, the best one is kept
+    """
+    from TfrecordCodec import TFRecordWriter, encode_example
+    
+    for module in ('TfrecordCodec', 'tensorflow'):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, '-c', 'import {}'.format(module)], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        if result.returncode:
+            print('[BENCH] tfrecord_codec import={} not installed'.format(module))
+        else:
+            print('[BENCH] tfrecord_codec import={} seconds={:.3f}'.format(module, min(times)))
+    
+    try:
+        import tensorflow as tf
+    except ImportError:
+        print('[BENCH] tfrecord_codec writing skipped, TensorFlow is not installed')
+        return
+    
+    imgBytes = os.urandom(50000)
+    examples = [{'image/height': ('int64', [480]), 'image/width': ('int64', [640]),
+                 'image/filename': ('bytes', ['{:07d}.jpg'.format(idx).encode('utf8')]), 'image/encoded': ('bytes', [imgBytes]),
+                 'image/object/bbox/xmin': ('float', [0.1*(idx % 10), 0.5]), 'image/object/class/text': ('bytes', [b'class0', b'class1']),
+                 'image/object/class/label': ('int64', [1, idx - numImgs//2])} for idx in range(numImgs)]
+    
+    tmpDir = tempfile.mkdtemp()
+    codecFname = os.path.join(tmpDir, 'codec.record')
+    tfFname = os.path.join(tmpDir, 'tf.record')
+    tfFeatures = {'bytes': lambda values: tf.train.Feature(bytes_list=tf.train.BytesList(value=values)),
+                  'float': lambda values: tf.train.Feature(float_list=tf.train.FloatList(value=values)),
+                  'int64': lambda values: tf.train.Feature(int64_list=tf.train.Int64List(value=values))}
+    
+    start = time.perf_counter()
+    writer = TFRecordWriter(codecFname)
+    for example in examples:
+        writer.write(encode_example(example))
+    writer.close()
+    print('[BENCH] tfrecord_codec write images={} backend=codec seconds={:.3f}'.format(numImgs, time.perf_counter() - start))
+    
+    start = time.perf_counter()
+    writer = tf.io.TFRecordWriter(tfFname)
+    for example in examples:
+        writer.write(tf.train.Example(features=tf.train.Features(feature={name: tfFeatures[kind](values) for name, (kind, values) in example.items()})).SerializeToString())
+    writer.close()
+    print('[BENCH] tfrecord_codec write images={} backend=tensorflow seconds={:.3f}'.format(numImgs, time.perf_counter() - start))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+def bench_snapshot(scales=(100000, 1000000)):
+    """
+    Time loading a COCO file by parsing it and from a snapshot of its Mediator.
+    
+    input: scales: numbers of annotations to benchmark
+    """
+    tmpDir = tempfile.mkdtemp()
+    for numAnnots in scales:
+        jsonFname = os.path.join(tmpDir, 'coco.json')
+        snapshotFname = os.path.join(tmpDir, 'coco.snapshot')
+        make_coco_json(jsonFname, numAnnots)
+        
+        start = time.perf_counter()
+        mediator = CocoReader().translate2mediator(jsonFname=jsonFname)
+        parseTime = time.perf_counter() - start
+        start = time.perf_counter()
+        SnapshotWriter().write(mediator=mediator, outputFile=snapshotFname)
+        saveTime = time.perf_counter() - start
+        del mediator
+        
+        # loading maps the file and checks it, records are built while browsed
+        start = time.perf_counter()
+        stream = SnapshotReader().translate2stream(snapshotFname=snapshotFname)
+        loadTime = time.perf_counter() - start
+        start = time.perf_counter()
+        numImgs = sum(1 for _ in stream.iter_records())
+        browseTime = time.perf_counter() - start
+        stream.close()
+        
+        print('[BENCH] snapshot annotations={} images={} coco_parse_seconds={:.3f} save_seconds={:.3f} load_seconds={:.4f} browse_seconds={:.3f} size_mb={:.1f} coco_size_mb={:.1f}'.format(
+              numAnnots, numImgs, parseTime, saveTime, loadTime, browseTime, os.path.getsize(snapshotFname)/1e6, os.path.getsize(jsonFname)/1e6))
+        os.remove(jsonFname)
+        os.remove(snapshotFname)
+    os.rmdir(tmpDir)
+
+
+def bench_yolo_read(numImgs=1000000, bboxsPerImg=4):
+    """
+    Time streaming a synthetic YOLO tree, with the time spent in each stage of the reader.
+    
+    input: numImgs: number of images and annotations files
+           bboxsPerImg: number of bboxs of each image
+    """
+    tmpDir = tempfile.mkdtemp()
+    readArgs = make_dataset('yolo', tmpDir, numImgs, bboxsPerImg)
+    
+    profiler = Profiler(progress=None, verbose=False)
+    start = time.perf_counter()
+    stream = get_reader('yolo')().translate2stream(instrument=profiler, **readArgs)
+    numBboxs = sum(record['bboxs'].get_num_bboxs() for record in stream.iter_records())
+    elapsed = time.perf_counter() - start
+    
+    stages = profiler.get_report()['stages']
+    labelsTime = stages['read']['seconds'] + stages['parse']['seconds']
+    print('[BENCH] yolo_read images={} seconds={:.3f} boxes/s={:.0f} labels_boxes/s={:.0f} {}'.format(
+          numImgs, elapsed, numBboxs/elapsed, numBboxs/labelsTime, ' '.join('{}_seconds={:.3f}'.format(name, stage['seconds']) for name, stage in stages.items())))
+    shutil.rmtree(tmpDir)
+
+
+def bench_fanout(numImgs=20000, bboxsPerImg=4, formats=('yolo', 'pascalvoc', 'coco', 'tfrecord')):
+    """
+    Time writing a synthetic YOLO tree to several formats, with one conversion per format and with one MultiWriter.
+    
+    input: numImgs: number of images of the tree
+           bboxsPerImg: number of bboxs of each image
+           formats: formats written
+    """
+    tmpDir = tempfile.mkdtemp()
+    readArgs = make_dataset('yolo', os.path.join(tmpDir, 'source'), numImgs, bboxsPerImg)
+    quiet = Instrumentation(verbose=False)
+    for fmt in formats:
+        get_writer(fmt) # modules are imported before timing
+    
+    times = {}
+    for mode in ('sequential', 'fanout'):
+        targets = [(fmt, get_dataset_args(fmt, os.path.join(tmpDir, mode, fmt))[1]) for fmt in formats]
+        for fmt, _ in targets:
+            os.makedirs(os.path.join(tmpDir, mode, fmt))
+        start = time.perf_counter()
+        if mode == 'sequential':
+            for fmt, writeArgs in targets:
+                convert('yolo', fmt, readArgs, writeArgs, instrument=quiet)
+        else:
+            convert_many('yolo', targets, readArgs, instrument=quiet)
+        times[mode] = time.perf_counter() - start
+    
+    print('[BENCH] fanout images={} formats={} sequential_seconds={:.3f} fanout_seconds={:.3f} speedup={:.2f}'.format(
+          numImgs, ','.join(formats), times['sequential'], times['fanout'], times['sequential']/times['fanout']))
+    shutil.rmtree(tmpDir)
+
+
+def get_dataset_args(fmt, dataDir):
+    # (reader arguments, writer arguments) of a dataset of format fmt in dataDir, YOLO annotations are next to images
+    imgDir = os.path.join(dataDir, 'images')
+    return({'yolo': ({'dataDir': imgDir, 'namesFname': os.path.join(dataDir, 'classes.names')},
+                     {'outputAnnotDir': imgDir, 'outputNamesFname': os.path.join(dataDir, 'classes.names')}),
+            'pascalvoc': ({'dataDir': os.path.join(dataDir, 'annotations')},
+                          {'outputAnnotDir': os.path.join(dataDir, 'annotations')}),
+            'coco': ({'jsonFname': os.path.join(dataDir, 'coco.json')},
+                     {'outputAnnotFile': os.path.join(dataDir, 'coco.json')}),
+            'tfrecord': ({'tfrecFname': os.path.join(dataDir, 'data.record'), 'labelsFname': os.path.join(dataDir, 'labels.pbtxt')},
+                         {'outputAnnotFile': os.path.join(dataDir, 'data.record'), 'outputLabelsFile': os.path.join(dataDir, 'labels.pbtxt')}),
+            'snapshot': ({'snapshotFname': os.path.join(dataDir, 'mediator.snapshot')},
+                         {'outputFile': os.path.join(dataDir, 'mediator.snapshot')})}[fmt])
+
+MAX_LINKS = 60000
+
+def make_dataset(fmt, dataDir, numImgs, bboxsPerImg=4, numClasses=20):
+    """
+    Generate a synthetic dataset, images being hard links to a few copies of one small JPEG so that any scale fits on disk.
+    
+    input: fmt: format name, one of FormatRegistry.FORMATS keys
+           dataDir: folder where images and annotations are written
+           numImgs: number of images
+           bboxsPerImg: number of bboxs of each image
+           numClasses: number of classes, bboxs are spread over them
+    
+    output: reader arguments of the dataset
+    """
+    imgDir = os.path.join(dataDir, 'images')
+    os.makedirs(imgDir, exist_ok=True)
+    imgFile = os.path.join(dataDir, 'img.jpg')
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(imgFile)
+    for idx in range(numImgs):
+        # file systems limit the number of hard links of a file (65000 on ext4), a copy is linked every MAX_LINKS images
+        if idx % MAX_LINKS == 0:
+            linkFile = os.path.join(dataDir, 'img{}.jpg'.format(idx // MAX_LINKS))
+            shutil.copyfile(imgFile, linkFile)
+        os.link(linkFile, os.path.join(imgDir, '{:07d}.jpg'.format(idx+1)))
+    
+    readArgs, writeArgs = get_dataset_args(fmt, dataDir)
+    get_writer(fmt)().write(mediator=make_mediator(numImgs, bboxsPerImg, numClasses, imgDir=imgDir), **writeArgs)
+    return(readArgs)
+
+
+def suite_child(srcFormat, dstFormat, srcDir, dstDir):
+    # one conversion in its own process, so that peak RSS only accounts for it
+    readArgs, _ = get_dataset_args(srcFormat, srcDir)
+    _, writeArgs = get_dataset_args(dstFormat, dstDir)
+    os.makedirs(os.path.join(dstDir, 'images'), exist_ok=True)
+    
+    # modules imports (TensorFlow for instance) are timed apart from the conversion
+    start = time.perf_counter()
+    get_reader(srcFormat)
+    get_writer(dstFormat)
+    importTime = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    convert(srcFormat, dstFormat, readArgs, writeArgs)
+    elapsed = time.perf_counter() - start
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'seconds': elapsed, 'import_seconds': importTime, 'peak_rss_mb': peakRss}))
+
+
+def bench_suite(scales=(1000,), bboxsPerImg=4, numClasses=20, formats=None, outputFname='benchmark_results.json'):
+    """
+    Time every reader/writer pair on synthetic datasets, each conversion streaming in its own process.
+    
+    input: scales: numbers of images to benchmark, from 1000 to 1000000
+           bboxsPerImg: number of bboxs of each image
+           numClasses: number of classes
+           formats: formats names to benchmark, all registered formats by default
+           outputFname: JSON file where results are written, one entry per scale and pair of formats
+    
+    output: list of results dicts
+    """
+    formats = formats or list(FORMATS)
+    results = []
+    for numImgs in scales:
+        tmpDir = tempfile.mkdtemp()
+        for srcFormat in formats:
+            srcDir = os.path.join(tmpDir, 'src_' + srcFormat)
+            make_dataset(srcFormat, srcDir, numImgs, bboxsPerImg, numClasses)
+            
+            for dstFormat in formats:
+                dstDir = os.path.join(tmpDir, 'dst_' + dstFormat)
+                # COCO and TFRecord files only keep images names, conversions run from the images folder
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '_suite_child', srcFormat, dstFormat, srcDir, dstDir],
+                                        cwd=os.path.join(srcDir, 'images'), check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                result.update({'source': srcFormat, 'target': dstFormat, 'images': numImgs, 'boxes': numImgs*bboxsPerImg,
+                               'classes': numClasses, 'images_per_s': numImgs/result['seconds'],
+                               'boxes_per_s': numImgs*bboxsPerImg/result['seconds']})
+                results.append(result)
+                print('[BENCH] suite {}->{} images={} seconds={:.3f} images/s={:.0f} boxes/s={:.0f} peak_rss_mb={:.1f}'.format(
+                      srcFormat, dstFormat, numImgs, result['seconds'], result['images_per_s'], result['boxes_per_s'], result['peak_rss_mb']))
+                shutil.rmtree(dstDir)
+            shutil.rmtree(srcDir)
+        shutil.rmtree(tmpDir)
+    
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    reportOpen = open(outputFname, 'w')
+    json.dump(report, reportOpen, indent=2)
+    reportOpen.close()
+    print('[INFO] Benchmark results written at {}'.format(os.path.abspath(outputFname)))
+    return(results)
+
+
+# YOLO to PascalVOC conversion of the repository data, importing every format like example.py did or through the registry
+COLD_START_SCRIPTS = {'eager': '''
+from YoloDataClass import YoloReader, YoloWriter
+from PascalVocDataClass import PascalVocReader, PascalVocWriter
+from SnapshotDataClass import SnapshotReader, SnapshotWriter
+from CocoDataClass import CocoReader, CocoWriter
+from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+mediator = YoloReader().translate2mediator(dataDir='./data/yolo_data/source', namesFname='./data/yolo_data/classes.names')
+PascalVocWriter().write(mediator=mediator, outputAnnotDir={outputDir!r})
+''',
+                      'registry': '''
+from FormatRegistry import convert
+convert('yolo', 'pascalvoc', readArgs={{'dataDir': './data/yolo_data/source', 'namesFname': './data/yolo_data/classes.names'}},
+        writeArgs={{'outputAnnotDir': {outputDir!r}}})
+'''}
+
+def bench_cold_start(repeats=5):
+    """
+    Time a YOLO to PascalVOC conversion in a new Python process, imports included.
+    
+    input: repeats: number of processes timed for each way of importing, the best one is kept
+    """
+    tmpDir = tempfile.mkdtemp()
+    for name, script in COLD_START_SCRIPTS.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', script.format(outputDir=tmpDir)], cwd=os.path.dirname(os.path.abspath(__file__)),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        print('[BENCH] cold_start conversion=yolo2pascalvoc imports={} seconds={:.3f}'.format(name, min(times)))
+    
+    for fname in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, fname))
+    os.rmdir(tmpDir)
+
+
+BENCHMARKS = {'coco_load': bench_coco_load,
+              'coco_parse': bench_coco_parse,
+              'voc_workers': bench_voc_workers,
+              'voc_write': bench_voc_write,
+              'image_probe': bench_image_probe,
+              'tfrecord_write': bench_tfrecord_write,
+              'tfrecord_read': bench_tfrecord_read,
+              'tfrecord_parse': bench_tfrecord_parse,
+              'tfrecord_index': bench_tfrecord_index,
+              'tfrecord_codec': bench_tfrecord_codec,
+              'snapshot': bench_snapshot,
+              'yolo_read': bench_yolo_read,
+              'fanout': bench_fanout,
+              'cold_start': bench_cold_start,
+              'suite': bench_suite}
+
+def parse_argument(value):
+    # benchmark arguments are given as name=value, value being JSON or a plain string
+    try:
+        return(json.loads(value))
+    except ValueError:
+        return(value)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['_coco_parse_child']:
+        coco_parse_child(sys.argv[2], bool(int(sys.argv[3])))
+        sys.exit(0)
+    if sys.argv[1:2] == ['_suite_child']:
+        suite_child(*sys.argv[2:6])
+        sys.exit(0)
+    
+    # e.g. python benchmark.py suite scales=[1000,100000] bboxsPerImg=8
+    names = [arg for arg in sys.argv[1:] if '=' not in arg] or list(BENCHMARKS)
+    kwargs = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+    for name in names:
+        BENCHMARKS[name](**{key: parse_argument(value) for key, value in kwargs.items()})
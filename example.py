@@ -1,37 +1,49 @@
 # -*- coding: utf-8 -*-
 
-from YoloDataClass import YoloReader, YoloWriter
-from PascalVocDataClass import PascalVocReader, PascalVocWriter
-from CocoDataClass import CocoReader, CocoWriter
-from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+# readers and writers are imported at first use, so that converting YOLO to PascalVOC does not import TensorFlow for instance
+from FormatRegistry import get_reader, get_writer, convert, convert_many
 
 
 """ Uncomment the required reader. """
-reader = YoloReader()
+reader = get_reader('yolo')()
 mediator = reader.translate2mediator(dataDir= './data/yolo_data/source', namesFname='./data/yolo_data/classes.names')
 
-# reader = PascalVocReader()
+# reader = get_reader('pascalvoc')()
 # mediator = reader.translate2mediator(dataDir= './data/pascalvoc_data/source')
 
-# reader = CocoReader()
+# reader = get_reader('coco')()
 # mediator = reader.translate2mediator(jsonFname='./data/coco_data/coco.json')
 
-# reader = TfrecordsReader()
+# reader = get_reader('tfrecord')()
 # mediator = reader.translate2mediator(tfrecFname='./data/tfrecord_data/tfrecord.records', labelsFname='./data/tfrecord_data/tfrecords.pbtxt',
 #                                      saveImgs=True, outputImgsDir='./data/tfrecord_data/tfrec_imgs/')
 
 
+# to convert without holding the whole dataset in memory, use translate2stream with the same inputs instead, e.g.
+# mediator = reader.translate2stream(dataDir= './data/yolo_data/source', namesFname='./data/yolo_data/classes.names')
+
+
 """ Uncomment the required writer """
-# writer = YoloWriter()
+# writer = get_writer('yolo')()
 # writer.write(mediator=mediator, outputAnnotDir='./data/tfrecord_data/yolo_annot/', outputNamesFname='./data/tfrecord_data/yolo.names')
 
-writer = PascalVocWriter()
+writer = get_writer('pascalvoc')()
 writer.write(mediator=mediator, outputAnnotDir='./data/yolo_data/pascalvoc_annot/')
 
-# writer = CocoWriter()
+# writer = get_writer('coco')()
 # writer.write(mediator=mediator, outputAnnotFile='./data/pascalvoc_data/coco.json')
 
 # in case you're converting COCO annotations to TFRecord annotations, enableDownload is highly recommanded
-# writer = TfrecordsWriter()
+# writer = get_writer('tfrecord')()
 # writer.write(mediator=mediator, outputAnnotFile='./data/coco_data/tfrecord.records', outputLabelsFile='./data/coco_data/tfrecords.pbtxt',
-#              enableDownload=True)
\ No newline at end of file
+#              enableDownload=True)
+
+
+""" Or read and write in one call """
+# convert('yolo', 'pascalvoc', readArgs={'dataDir': './data/yolo_data/source', 'namesFname': './data/yolo_data/classes.names'},
+#         writeArgs={'outputAnnotDir': './data/yolo_data/pascalvoc_annot/'})
+
+
+""" Or write several formats from a single read """
+# convert_many('yolo', [('pascalvoc', {'outputAnnotDir': './data/yolo_data/pascalvoc_annot/'}), ('coco', {'outputAnnotFile': './data/yolo_data/coco.json'})],
+#              readArgs={'dataDir': './data/yolo_data/source', 'namesFname': './data/yolo_data/classes.names'})
\ No newline at end of file
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+# modules are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+
+
+def make_mediator(imgFile, numImgs=4, classNames=('person', 'dog', 'car')):
+    # small Mediator whose images all use imgFile and whose bboxs are spread over classNames
+    mediatorCateg = MediatorCategories()
+    for idx, name in enumerate(classNames):
+        mediatorCateg.append(ID=idx+1, name=name)
+    
+    mediatorImgs = MediatorImages()
+    for idx in range(numImgs):
+        mediatorBboxs = MediatorBboxs()
+        for idxBox in range(len(classNames)):
+            mediatorBboxs.append(ID=mediatorImgs.get_new_bbox_id(), labelID=(idx+idxBox) % len(classNames) + 1,
+                                 x=10+idxBox, y=20+idxBox, width=100, height=50)
+        mediatorImgs.append(path=imgFile, width=640, height=480, depth=3, bboxs=mediatorBboxs)
+    return(Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg))
+
+
+@pytest.fixture
+def img_file(tmp_path):
+    imgFile = str(tmp_path / 'img.jpg')
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(imgFile)
+    return(imgFile)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import CocoDataClass
+from conftest import make_mediator
+from CocoDataClass import CocoReader, CocoWriter
+from MultiWriter import MultiWriter
+from PascalVocDataClass import PascalVocReader, PascalVocWriter
+
+
+@pytest.fixture
+def voc_dir(tmp_path, img_file):
+    # PascalVOC annotations, whose categories are complete only once a stream has been browsed
+    PascalVocWriter().write(mediator=make_mediator(img_file, numImgs=5), outputAnnotDir=str(tmp_path / 'voc'))
+    return(str(tmp_path / 'voc'))
+
+
+def write_coco(mediator, outputFile, chunkSize=2):
+    cocoWriter = CocoWriter()
+    cocoWriter.chunkSize = chunkSize
+    cocoWriter.write(mediator=mediator, outputAnnotFile=outputFile)
+    return(open(outputFile).read())
+
+
+def test_streams_and_mediators_give_the_same_file(tmp_path, voc_dir):
+    fromMediator = write_coco(PascalVocReader().translate2mediator(dataDir=voc_dir), str(tmp_path / 'mediator.json'))
+    fromStream = write_coco(PascalVocReader().translate2stream(dataDir=voc_dir), str(tmp_path / 'stream.json'))
+    assert fromStream == fromMediator
+    assert '"categories": [{"id": 1' in fromStream
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_multiwriter_targets_give_the_same_file(tmp_path, voc_dir, stream):
+    reference = write_coco(PascalVocReader().translate2mediator(dataDir=voc_dir), str(tmp_path / 'reference.json'))
+    reader = PascalVocReader()
+    mediator = reader.translate2stream(dataDir=voc_dir) if stream else reader.translate2mediator(dataDir=voc_dir)
+    MultiWriter().write(mediator=mediator, targets=[('coco', {'outputAnnotFile': str(tmp_path / 'multi.json')})])
+    assert open(str(tmp_path / 'multi.json')).read() == reference
+
+
+@pytest.mark.parametrize('incremental, size, expected', [(None, 1<<30, False), (None, 0, True), (True, 1<<30, True), (False, 0, False)])
+def test_parsing_mode(tmp_path, voc_dir, monkeypatch, incremental, size, expected):
+    # json.load unless the file is larger than INCREMENTAL_SIZE or incremental parsing is asked
+    reference = write_coco(PascalVocReader().translate2mediator(dataDir=voc_dir), str(tmp_path / 'reference.json'))
+    monkeypatch.setattr(CocoDataClass, 'INCREMENTAL_SIZE', size)
+    cocoReader = CocoReader()
+    mediator = cocoReader.translate2mediator(jsonFname=str(tmp_path / 'reference.json'), incremental=incremental)
+    assert cocoReader.incremental is expected
+    assert write_coco(mediator, str(tmp_path / 'coco.json')) == reference
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_duplicate_image_ids_raise(tmp_path, img_file, incremental):
+    mediator = make_mediator(img_file, numImgs=3)
+    mediator.imgList.list[2]['id'] = mediator.imgList.list[0]['id']
+    write_coco(mediator, str(tmp_path / 'coco.json'))
+    with pytest.raises(Exception, match='Multiple objects have the ID {}'.format(mediator.imgList.list[0]['id'])):
+        CocoReader().translate2mediator(jsonFname=str(tmp_path / 'coco.json'), incremental=incremental)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import make_mediator
+from CocoDataClass import CocoWriter
+from FormatRegistry import FORMATS, convert, convert_many, get_reader, get_writer, register_format
+from Instrumentation import Profiler
+from YoloDataClass import YoloReader, YoloWriter
+
+
+@pytest.fixture
+def coco_file(tmp_path, img_file):
+    cocoFile = str(tmp_path / 'coco.json')
+    CocoWriter().write(mediator=make_mediator(img_file, numImgs=3), outputAnnotFile=cocoFile)
+    return(cocoFile)
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_convert_reports_profile_once(tmp_path, coco_file, capsys, stream):
+    profiler = Profiler(progress=None)
+    capsys.readouterr()
+    convert('coco', 'yolo', {'jsonFname': coco_file},
+            {'outputAnnotDir': str(tmp_path / 'yolo'), 'outputNamesFname': str(tmp_path / 'yolo.names')},
+            stream=stream, instrument=profiler)
+    
+    assert capsys.readouterr().out.count('[INFO] Profile:') == 1
+    assert profiler.counters['images_read'] == 3 and profiler.counters['images_written'] == 3
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_convert_many_reports_profile_once(tmp_path, coco_file, capsys, stream):
+    profiler = Profiler(progress=None)
+    capsys.readouterr()
+    convert_many('coco', [('yolo', {'outputAnnotDir': str(tmp_path / 'yolo'), 'outputNamesFname': str(tmp_path / 'yolo.names')})],
+                 {'jsonFname': coco_file}, stream=stream, instrument=profiler)
+    
+    assert capsys.readouterr().out.count('[INFO] Profile:') == 1
+    assert profiler.counters['images_read'] == 3 and profiler.counters['yolo/images_written'] == 3
+
+
+def test_convert_imports_only_needed_formats(tmp_path, img_file):
+    dataDir = tmp_path / 'yolo'
+    dataDir.mkdir()
+    mediator = make_mediator(img_file, numImgs=2)
+    for idx, img in enumerate(mediator.imgList.list):
+        img['path'] = shutil.copyfile(img_file, str(dataDir / '{}.jpg'.format(idx)))
+    YoloWriter().write(mediator=mediator, outputAnnotDir=str(dataDir), outputNamesFname=str(tmp_path / 'yolo.names'))
+    
+    # a fresh process, as modules imported by other tests stay in sys.modules
+    script = ("import sys\n"
+              "from FormatRegistry import convert\n"
+              "convert('yolo', 'pascalvoc', {{'dataDir': {!r}, 'namesFname': {!r}}}, {{'outputAnnotDir': {!r}}})\n"
+              "print(sorted(name for name in ('CocoDataClass', 'TfrecordsDataClass', 'SnapshotDataClass', 'MultiWriter', "
+              "'tensorflow', 'requests') if name in sys.modules))").format(str(dataDir), str(tmp_path / 'yolo.names'), str(tmp_path / 'voc'))
+    rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=rootDir, capture_output=True, text=True, check=True).stdout
+    
+    assert output.splitlines()[-1] == '[]'
+    assert sorted(os.listdir(str(tmp_path / 'voc'))) == ['0.xml', '1.xml']
+
+
+def test_register_format(monkeypatch):
+    # the registered format is removed from FORMATS after the test
+    monkeypatch.setitem(FORMATS, 'yolo-read-only', ('YoloDataClass', 'YoloReader', None))
+    register_format('yolo-read-only', 'YoloDataClass', 'YoloReader', None)
+    
+    assert get_reader('yolo-read-only') is YoloReader
+    with pytest.raises(Exception, match='Format yolo-read-only has no writer.'):
+        get_writer('yolo-read-only')
+    with pytest.raises(AssertionError, match='Unknown format unknown'):
+        get_reader('unknown')
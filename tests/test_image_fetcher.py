@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+from ImageFetcher import ImageFetcher
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # /img/<n> answers after (10-n) ms, /flaky/<n> fails with a 503 on its first request, /down/<n> always fails
+    requests = Counter()
+
+    def do_GET(self):
+        self.requests[self.path] += 1
+        kind, number = self.path.strip('/').split('/')
+        if kind == 'down' or (kind == 'flaky' and self.requests[self.path] == 1):
+            self.send_response(503)
+            self.end_headers()
+            return
+        if kind == 'img': time.sleep(max(0, 10 - int(number)) / 1000)
+        body = self.path.encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ImageHandler.requests = Counter()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield('http://127.0.0.1:{}'.format(httpd.server_address[1]))
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_cache_hit(tmp_path, server):
+    url = server + '/img/1'
+    assert ImageFetcher(cacheDir=str(tmp_path), workers=1).fetch(url) == b'/img/1'
+    
+    fetcher = ImageFetcher(cacheDir=str(tmp_path), workers=1)
+    assert fetcher.fetch(url) == b'/img/1'
+    assert (fetcher.numDownloads, fetcher.numCacheHits) == (0, 1)
+    assert ImageHandler.requests['/img/1'] == 1
+
+
+def test_retry_after_server_error(server):
+    fetcher = ImageFetcher(workers=1, backoff=0.01)
+    assert fetcher.fetch(server + '/flaky/1') == b'/flaky/1'
+    assert ImageHandler.requests['/flaky/1'] == 2
+
+
+def test_failure_after_all_retries(server):
+    with pytest.raises(Exception, match='failed after 3 attempts'):
+        ImageFetcher(workers=1, retries=2, backoff=0.01).fetch(server + '/down/1')
+    assert ImageHandler.requests['/down/1'] == 3
+
+
+def test_order_with_several_workers(server):
+    # first images answer last, results still come in items order
+    items = list(range(10)) + [None]
+    fetcher = ImageFetcher(workers=4, maxInFlight=8)
+    results = list(fetcher.iter_fetch(items, lambda item: None if item is None else '{}/img/{}'.format(server, item)))
+    assert [item for item, _ in results] == items
+    assert [content for _, content in results] == [b'/img/%d' % item for item in range(10)] + [None]
+    assert fetcher.numDownloads == 10
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+from PIL import Image
+
+from ImageProbe import probe_header, probe_image
+
+
+def pil_dimensions(path):
+    img = Image.open(path)
+    dimensions = (img.size[0], img.size[1], len(img.getbands()))
+    img.close()
+    return(dimensions)
+
+
+@pytest.mark.parametrize('fmt, mode, saveKwargs', [('JPEG', 'RGB', {}),
+                                                   ('JPEG', 'L', {}),
+                                                   ('JPEG', 'CMYK', {}),
+                                                   ('JPEG', 'RGB', {'progressive': True}),
+                                                   ('JPEG', 'RGB', {'exif': b'Exif\x00\x00' + b'\x00'*64, 'icc_profile': b'\x00'*300}),
+                                                   ('PNG', 'RGB', {}),
+                                                   ('PNG', 'RGBA', {}),
+                                                   ('PNG', 'L', {}),
+                                                   ('PNG', 'LA', {}),
+                                                   ('PNG', 'P', {}),
+                                                   ('PNG', '1', {}),
+                                                   ('PNG', 'I;16', {}),
+                                                   ('BMP', 'RGB', {}),
+                                                   ('GIF', 'P', {})])
+def test_probe_matches_pil(tmp_path, fmt, mode, saveKwargs):
+    imgFile = str(tmp_path / 'img.{}'.format(fmt.lower()))
+    Image.new(mode, (321, 123)).save(imgFile, fmt, **saveKwargs)
+    
+    assert probe_image(imgFile) == pil_dimensions(imgFile)
+    assert probe_image(imgFile)[:2] == (321, 123)
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_probe_reads_header_whatever_the_extension(tmp_path, fmt):
+    imgFile = str(tmp_path / 'misnamed.bmp')
+    Image.new('RGB', (64, 48)).save(imgFile, fmt)
+    
+    with open(imgFile, 'rb') as imgOpen:
+        assert probe_header(imgOpen) == (64, 48, 3)
+    assert probe_image(imgFile) == pil_dimensions(imgFile)
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_truncated_header_is_not_probed(fmt):
+    data = io.BytesIO()
+    Image.new('RGB', (64, 48)).save(data, fmt)
+    
+    # cut before the frame (JPEG) or inside IHDR (PNG)
+    assert probe_header(io.BytesIO(data.getvalue()[:12 if fmt == 'PNG' else 4])) is None
+    assert probe_header(io.BytesIO(b'GIF89a' + data.getvalue())) is None
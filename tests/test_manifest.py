@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import pytest
+
+from conftest import make_mediator
+from CocoDataClass import CocoWriter
+from ManifestClass import ConversionManifest
+from PascalVocDataClass import PascalVocWriter
+from TfrecordsDataClass import TfrecordsWriter
+from YoloDataClass import YoloReader, YoloWriter
+
+
+@pytest.fixture
+def yolo_dir(tmp_path, img_file):
+    # YOLO tree of 3 images with their annotations
+    dataDir = tmp_path / 'yolo'
+    dataDir.mkdir()
+    for idx in range(3):
+        shutil.copyfile(img_file, str(dataDir / '{}.jpg'.format(idx)))
+    mediator = make_mediator(img_file, numImgs=3)
+    for idx, img in enumerate(mediator.imgList.list):
+        img['path'] = str(dataDir / '{}.jpg'.format(idx))
+    YoloWriter().write(mediator=mediator, outputAnnotDir=str(dataDir), outputNamesFname=str(tmp_path / 'classes.names'))
+    return(dataDir)
+
+
+@pytest.mark.parametrize('writeArgs', [(CocoWriter, {'outputAnnotFile': 'coco.json'}),
+                                       (TfrecordsWriter, {'outputAnnotFile': 'data.record', 'outputLabelsFile': 'labels.pbtxt'})])
+def test_single_file_writers_reject_manifest_streams(tmp_path, yolo_dir, writeArgs):
+    Writer, args = writeArgs
+    manifest = ConversionManifest(str(tmp_path / 'manifest.json'))
+    stream = YoloReader().translate2stream(dataDir=str(yolo_dir), namesFname=str(tmp_path / 'classes.names'), manifest=manifest)
+    with pytest.raises(AssertionError, match='manifest'):
+        Writer().write(mediator=stream, **{key: str(tmp_path / value) for key, value in args.items()})
+    
+    # the same stream read without manifest is written
+    stream = YoloReader().translate2stream(dataDir=str(yolo_dir), namesFname=str(tmp_path / 'classes.names'))
+    Writer().write(mediator=stream, **{key: str(tmp_path / value) for key, value in args.items()})
+
+
+@pytest.mark.parametrize('Writer, fileExt', [(PascalVocWriter, '.xml'), (YoloWriter, '.txt')])
+def test_manifest_given_to_the_writer_only(tmp_path, yolo_dir, capsys, Writer, fileExt):
+    outputDir = tmp_path / 'output'
+    writeArgs = {'outputNamesFname': str(tmp_path / 'output.names')} if Writer is YoloWriter else {}
+    for _ in range(2):
+        mediator = YoloReader().translate2mediator(dataDir=str(yolo_dir), namesFname=str(tmp_path / 'classes.names'))
+        Writer().write(mediator=mediator, outputAnnotDir=str(outputDir), manifest=ConversionManifest(str(tmp_path / 'manifest.json')), **writeArgs)
+        assert sorted(os.listdir(str(outputDir))) == ['{}{}'.format(idx, fileExt) for idx in range(3)]
+        assert '3 sources converted, 0 unchanged, 0 removed' in capsys.readouterr().out
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import json
+import shutil
+
+import pytest
+
+from CocoDataClass import CocoReader, CocoWriter
+from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+from SnapshotDataClass import SnapshotReader, SnapshotWriter
+from YoloDataClass import YoloReader
+
+
+def write_coco_json(jsonFname, bboxs):
+    # one image whose annotations have the given bboxs
+    jsonOpen = open(jsonFname, 'w')
+    json.dump({'info': {'year': 2021, 'version': '1.0', 'description': 'test', 'contributor': 'test', 'url': 'http://unknown.org', 'date_created': '2021-01-01'},
+               'licenses': [{'id': 1, 'url': 'http://unknown.org', 'name': 'test'}],
+               'categories': [{'id': 1, 'name': 'person', 'supercategory': 'Unspecified'}],
+               'images': [{'id': 7, 'width': 640, 'height': 480, 'file_name': 'a.jpg', 'license': 1}],
+               'annotations': [{'id': idx+1, 'image_id': 7, 'category_id': 1, 'bbox': bbox, 'iscrowd': 0, 'segmentation': [], 'area': 0.0}
+                               for idx, bbox in enumerate(bboxs)]}, jsonOpen)
+    jsonOpen.close()
+
+
+def test_coco_keeps_integer_coordinates(tmp_path):
+    bboxs = [[1, 2, 3, 4], [1.5, 2.0, 3, 4.25]]
+    write_coco_json(str(tmp_path / 'in.json'), bboxs)
+    mediator = CocoReader().translate2mediator(jsonFname=str(tmp_path / 'in.json'))
+    CocoWriter().write(mediator=mediator, outputAnnotFile=str(tmp_path / 'out.json'))
+    
+    outBboxs = [annotation['bbox'] for annotation in json.load(open(str(tmp_path / 'out.json')))['annotations']]
+    assert outBboxs == bboxs
+    assert [[type(value) for value in bbox] for bbox in outBboxs] == [[type(value) for value in bbox] for bbox in bboxs]
+
+
+def test_missing_coordinates_are_none(tmp_path):
+    mediatorBboxs = MediatorBboxs()
+    mediatorBboxs.append(labelID=1)
+    assert mediatorBboxs.list[0]['x'] is None and mediatorBboxs.get_coords() == [(None, None, None, None)]
+    
+    mediatorCateg = MediatorCategories()
+    mediatorCateg.append(ID=1, name='person')
+    mediatorImgs = MediatorImages()
+    mediatorImgs.append(path='a.jpg', width=640, height=480, depth=3, bboxs=mediatorBboxs)
+    CocoWriter().write(mediator=Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg), outputAnnotFile=str(tmp_path / 'out.json'))
+    # strict JSON, without NaN
+    content = json.loads(open(str(tmp_path / 'out.json')).read(), parse_constant=lambda name: pytest.fail('{} written'.format(name)))
+    assert content['annotations'][0]['bbox'] == [None, None, None, None]
+
+
+def test_bbox_views_keep_given_types():
+    mediatorBboxs = MediatorBboxs()
+    mediatorBboxs.append(labelID=1, x=1, y=2.5, width=3, height=None)
+    bbox = mediatorBboxs.list[0]
+    assert (bbox['x'], bbox['y'], bbox['width'], bbox['height']) == (1, 2.5, 3, None) and type(bbox['x']) is int
+    bbox['x'] = 1.5
+    bbox['height'] = 4
+    assert mediatorBboxs.get_coords() == [(1.5, 2.5, 3, 4)] and type(mediatorBboxs.get_coords()[0][3]) is int
+    assert 'intCoords' not in dict(bbox)
+
+
+def test_bbox_list_is_read_only():
+    mediatorBboxs = MediatorBboxs()
+    mediatorBboxs.append(labelID=1, x=1, y=2, width=3, height=4)
+    with pytest.raises(AttributeError):
+        mediatorBboxs.list.append({'labelID': 1})
+    assert mediatorBboxs.get_num_bboxs() == 1
+
+
+def test_snapshot_keeps_integer_coordinates(tmp_path):
+    write_coco_json(str(tmp_path / 'in.json'), [[1, 2, 3, 4], [1.5, 2.0, 3, None]])
+    mediator = CocoReader().translate2mediator(jsonFname=str(tmp_path / 'in.json'))
+    SnapshotWriter().write(mediator=mediator, outputFile=str(tmp_path / 'mediator.snapshot'))
+    snapMed = SnapshotReader().translate2mediator(snapshotFname=str(tmp_path / 'mediator.snapshot'))
+    assert [img['bboxs'].get_coords() for img in snapMed.imgList.list] == [img['bboxs'].get_coords() for img in mediator.imgList.list]
+
+
+def test_images_share_one_bbox_table():
+    mediatorImgs = MediatorImages()
+    for idx in range(3):
+        mediatorBboxs = MediatorBboxs()
+        for idxBox in range(2):
+            mediatorBboxs.append(ID=10*idx+idxBox, labelID=1, x=idx, y=idxBox, width=3, height=4)
+        mediatorImgs.append(path='{}.jpg'.format(idx), bboxs=mediatorBboxs)
+    bboxsList = [img['bboxs'] for img in mediatorImgs.list]
+    assert all(bboxs.table is mediatorImgs.bboxTable for bboxs in bboxsList) and len(mediatorImgs.bboxTable) == 6
+    
+    # rows followed by other images are copied before being extended, the others are left as they are
+    bboxsList[0].append(ID=2, labelID=1, x=0, y=2, width=3, height=4)
+    bboxsList[1].list[0]['x'] = 7
+    assert [list(bboxs.get_column('id')) for bboxs in bboxsList] == [[0, 1, 2], [10, 11], [20, 21]]
+    assert [[coords[0] for coords in bboxs.get_coords()] for bboxs in bboxsList] == [[0, 0, 0], [7, 1], [2, 2]]
+    assert [list(bboxs.get_arrays()['y']) for bboxs in bboxsList] == [[0, 1, 2], [0, 1], [0, 1]]
+
+
+def test_snapshot_of_a_stream(tmp_path, img_file):
+    # bboxs of a YOLO stream are stored by batches of images, images may have no bbox
+    dataDir = tmp_path / 'yolo'
+    dataDir.mkdir()
+    open(str(tmp_path / 'yolo.names'), 'w').write('person\ndog\n')
+    for idx in range(5):
+        shutil.copyfile(img_file, str(dataDir / '{}.jpg'.format(idx)))
+        open(str(dataDir / '{}.txt'.format(idx)), 'w').write(''.join('{} 0.5 0.5 0.{} 0.2\n'.format(idxBox % 2, idx+1) for idxBox in range(idx % 3)))
+    stream = YoloReader().translate2stream(dataDir=str(dataDir), namesFname=str(tmp_path / 'yolo.names'))
+    SnapshotWriter().write(mediator=stream, outputFile=str(tmp_path / 'mediator.snapshot'))
+    
+    yoloMed = YoloReader().translate2mediator(dataDir=str(dataDir), namesFname=str(tmp_path / 'yolo.names'))
+    snapMed = SnapshotReader().translate2mediator(snapshotFname=str(tmp_path / 'mediator.snapshot'))
+    assert [[dict(bbox) for bbox in img['bboxs'].list] for img in snapMed.imgList.list] == \
+           [[dict(bbox) for bbox in img['bboxs'].list] for img in yoloMed.imgList.list]
+    assert [img['bboxs'].get_num_bboxs() for img in snapMed.imgList.list] == [0, 1, 2, 0, 1]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from conftest import make_mediator
+from Instrumentation import Profiler
+from MediatorClass import Mediator, DERIVED_DATA
+from MultiWriter import MultiWriter, MediatorBranch
+
+
+def test_profile_is_reported_once(tmp_path, img_file, capsys):
+    profiler = Profiler(progress=None)
+    MultiWriter().write(mediator=make_mediator(img_file, numImgs=3),
+                        targets=[('coco', {'outputAnnotFile': str(tmp_path / 'coco.json')}),
+                                 ('yolo', {'outputAnnotDir': str(tmp_path / 'yolo'), 'outputNamesFname': str(tmp_path / 'yolo.names')})],
+                        instrument=profiler)
+    
+    assert capsys.readouterr().out.count('[INFO] Profile:') == 1
+    # images given to the targets are not counted as written by the MultiWriter itself
+    assert profiler.counters['images_dispatched'] == 3 and 'images_written' not in profiler.counters
+    assert profiler.counters['coco/images_written'] == 3 and profiler.counters['yolo/images_written'] == 3
+    assert profiler.get_progress()['images'] == 3
+
+
+def test_derived_data_of_different_images_computed_in_parallel(monkeypatch):
+    # both computations must run at once to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    calls = []
+    def read_slowly(mediator, record):
+        calls.append(record['id'])
+        barrier.wait()
+        return(record['id'])
+    monkeypatch.setitem(DERIVED_DATA, 'slow', read_slowly)
+    
+    # the third branch is given the same image as the first one
+    records = [{'id': 1}, {'id': 2}]
+    records.append(records[0])
+    current = [(records[0], {}), (records[1], {})]
+    current.append(current[0])
+    lock = threading.Lock()
+    branches = [MediatorBranch(Mediator(), frozenset(['slow']), lock) for _ in records]
+    results = [None] * len(records)
+    def get(idx):
+        branches[idx].current = current[idx]
+        results[idx] = branches[idx].get_derived(records[idx], 'slow')
+    threads = [threading.Thread(target=get, args=(idx,)) for idx in range(len(records))]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    
+    assert results == [1, 2, 1] and sorted(calls) == [1, 2]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from conftest import make_mediator
+from MediatorClass import Mediator, MediatorImages, MediatorCategories, MediatorBboxs
+from PascalVocDataClass import PascalVocReader, PascalVocWriter, parse_xml_file
+
+
+CLASS_NAMES = ('dog & "cat"', '<person>', "it's", 'café')
+
+def make_voc_mediator(tmp_path):
+    # images whose texts need escaping, or whose optional fields are missing
+    mediatorCateg = MediatorCategories()
+    for idx, name in enumerate(CLASS_NAMES):
+        mediatorCateg.append(ID=idx+1, name=name)
+    
+    mediatorImgs = MediatorImages()
+    imgsKwargs = [{'path': str(tmp_path / 'a&b <c>.jpg'), 'sourceName': 'VOC & co', 'sourceImg': '<flickr>', 'sourceAnnot': "'x'"},
+                  {'path': str(tmp_path / 'missing.jpg'), 'handlepath': False, 'sourceName': None, 'sourceImg': None, 'sourceAnnot': '',
+                   'segmented': None},
+                  {'path': str(tmp_path / 'nobbox.jpg')}]
+    poses = ['a<b>&c', None, '', 'Unspecified']
+    for idxImg, imgKwargs in enumerate(imgsKwargs):
+        mediatorBboxs = MediatorBboxs()
+        for idx in range(len(CLASS_NAMES) if idxImg < 2 else 0):
+            mediatorBboxs.append(ID=mediatorImgs.get_new_bbox_id(), labelID=idx+1, x=10+idx, y=20.7, width=100, height=50.2,
+                                 pose=poses[idx], truncated=idx % 2, occluded=idx % 3, difficult=idx // 2)
+        mediatorImgs.append(width=640, height=480, depth=3, bboxs=mediatorBboxs, **imgKwargs)
+    return(Mediator(objImgs=mediatorImgs, objCateg=mediatorCateg))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_templates_render_as_element_tree(tmp_path, workers):
+    mediator = make_voc_mediator(tmp_path)
+    PascalVocWriter().write(mediator=mediator, outputAnnotDir=str(tmp_path / 'etree'), useTemplates=False)
+    PascalVocWriter().write(mediator=mediator, outputAnnotDir=str(tmp_path / 'templates'), workers=workers)
+    
+    xmlFnames = sorted(os.listdir(str(tmp_path / 'etree')))
+    assert xmlFnames == ['a&b <c>.xml', 'missing.xml', 'nobbox.xml']
+    assert sorted(os.listdir(str(tmp_path / 'templates'))) == xmlFnames
+    for xmlFname in xmlFnames:
+        with open(str(tmp_path / 'etree' / xmlFname), 'rb') as xmlOpen: expected = xmlOpen.read()
+        with open(str(tmp_path / 'templates' / xmlFname), 'rb') as xmlOpen: rendered = xmlOpen.read()
+        assert rendered == expected, xmlFname
+
+
+def test_escaped_names_read_back(tmp_path):
+    PascalVocWriter().write(mediator=make_voc_mediator(tmp_path), outputAnnotDir=str(tmp_path / 'voc'))
+    
+    imgInfo, bboxs = parse_xml_file(str(tmp_path / 'voc' / 'a&b <c>.xml'))
+    assert imgInfo['path'] == str(tmp_path / 'a&b <c>.jpg') and imgInfo['sourceName'] == 'VOC & co'
+    assert [bbox[0] for bbox in bboxs] == list(CLASS_NAMES)
+    assert bboxs[0][5] == 'a<b>&c'
+
+
+def test_parallel_parsing_gives_the_same_mediator(tmp_path, img_file):
+    mediator = make_mediator(img_file, numImgs=40)
+    for idx, img in enumerate(mediator.imgList.list):
+        img['path'] = str(tmp_path / '{:02d}.jpg'.format(idx))
+    PascalVocWriter().write(mediator=mediator, outputAnnotDir=str(tmp_path / 'voc'))
+    
+    vocMeds = [PascalVocReader().translate2mediator(dataDir=str(tmp_path / 'voc'), workers=workers) for workers in (1, 3)]
+    
+    # files are read in directory order, IDs must not depend on the number of workers
+    assert vocMeds[0].imgList.get_num_imgs() == 40
+    assert [(categ['id'], categ['name']) for categ in vocMeds[0].categList.list] == [(categ['id'], categ['name']) for categ in vocMeds[1].categList.list]
+    for img, parallelImg in zip(vocMeds[0].imgList.list, vocMeds[1].imgList.list):
+        assert (img['id'], img['path'], img['sourceFiles']) == (parallelImg['id'], parallelImg['path'], parallelImg['sourceFiles'])
+        assert img['bboxs'].list == parallelImg['bboxs'].list
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from conftest import make_mediator
+from SnapshotDataClass import SnapshotReader, SnapshotWriter
+
+
+def test_missing_image_sizes_are_restored(tmp_path, img_file):
+    mediator = make_mediator(img_file, numImgs=3)
+    imgs = mediator.imgList.list
+    imgs[0]['width'], imgs[1]['height'], imgs[2]['depth'], imgs[2]['id'] = None, None, None, None
+    SnapshotWriter().write(mediator=mediator, outputFile=str(tmp_path / 'mediator.snapshot'))
+    
+    snapMed = SnapshotReader().translate2mediator(snapshotFname=str(tmp_path / 'mediator.snapshot'))
+    keys = ('id', 'width', 'height', 'depth')
+    assert [[img[key] for key in keys] for img in snapMed.imgList.list] == [[img[key] for key in keys] for img in imgs]
+
+
+def test_reserved_value_is_rejected(tmp_path, img_file):
+    mediator = make_mediator(img_file, numImgs=1)
+    mediator.imgList.list[0]['width'] = -1
+    with pytest.raises(AssertionError, match='missing values'):
+        SnapshotWriter().write(mediator=mediator, outputFile=str(tmp_path / 'mediator.snapshot'))
+
+
+def test_stream_is_closed(tmp_path, img_file):
+    SnapshotWriter().write(mediator=make_mediator(img_file, numImgs=2), outputFile=str(tmp_path / 'mediator.snapshot'))
+    with SnapshotReader().translate2stream(snapshotFname=str(tmp_path / 'mediator.snapshot')) as stream:
+        assert len(list(stream.iter_records())) == 2
+    assert stream.snapshot.data.closed and stream.snapshot.fileOpen.closed
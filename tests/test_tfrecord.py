@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import make_mediator
+from ImageProbe import detect_format
+from TfrecordCodec import iter_tfrecord, decode_example
+from TfrecordsDataClass import TfrecordsReader, TfrecordsWriter
+
+
+def test_roundtrip_keeps_every_class(tmp_path, img_file):
+    mediator = make_mediator(img_file)
+    TfrecordsWriter().write(mediator=mediator, outputAnnotFile=str(tmp_path / 'data.record'), outputLabelsFile=str(tmp_path / 'labels.pbtxt'))
+    tfrecMed = TfrecordsReader().translate2mediator(tfrecFname=str(tmp_path / 'data.record'), labelsFname=str(tmp_path / 'labels.pbtxt'))
+    
+    assert [(categ['id'], categ['name']) for categ in tfrecMed.categList.list] == [(1, 'person'), (2, 'dog'), (3, 'car')]
+    for img, tfrecImg in zip(mediator.imgList.list, tfrecMed.imgList.list):
+        assert type(tfrecImg['width']) is int and type(tfrecImg['height']) is int
+        assert [tfrecMed.categList.get_class_name(labelID)[0] for labelID in tfrecImg['bboxs'].get_column('labelID')] == \
+               [mediator.categList.get_class_name(labelID)[0] for labelID in img['bboxs'].get_column('labelID')]
+
+
+@pytest.mark.parametrize('saveFormat, transcode, imgFormat', [('JPEG', None, b'jpeg'), ('PNG', None, b'png'), ('BMP', None, b'jpg'),
+                                                             ('JPEG', 'jpeg', b'jpeg'), ('JPEG', 'png', b'png'), ('PNG', 'jpeg', b'jpeg')])
+def test_image_format(tmp_path, saveFormat, transcode, imgFormat):
+    # format found in images content, whatever their file extension, which is only used for formats other than JPEG and PNG
+    imgFile = str(tmp_path / 'fake.jpg')
+    Image.new('RGB', (64, 48), (128, 128, 128)).save(imgFile, format=saveFormat)
+    TfrecordsWriter().write(mediator=make_mediator(imgFile, numImgs=1), outputAnnotFile=str(tmp_path / 'data.record'),
+                            outputLabelsFile=str(tmp_path / 'labels.pbtxt'), transcode=transcode)
+    example = decode_example(next(iter_tfrecord(str(tmp_path / 'data.record'))))
+    assert example['image/format'] == [imgFormat]
+    assert detect_format(example['image/encoded'][0]) == (imgFormat.decode('utf8') if imgFormat != b'jpg' else None)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sharded_writing(tmp_path, img_file, workers):
+    mediator = make_mediator(img_file, numImgs=7)
+    for idx, img in enumerate(mediator.imgList.list):
+        img['fname'] = '{}.jpg'.format(idx)
+    TfrecordsWriter().write(mediator=mediator, outputAnnotFile=str(tmp_path / 'single.record'), outputLabelsFile=str(tmp_path / 'labels.pbtxt'))
+    TfrecordsWriter().write(mediator=mediator, outputAnnotFile=str(tmp_path / 'data.record'), outputLabelsFile=str(tmp_path / 'labels.pbtxt'),
+                            numShards=3, workers=workers)
+    
+    shardFnames = ['data-{:05d}-of-00003.record'.format(idx) for idx in range(3)]
+    assert sorted(fname for fname in os.listdir(str(tmp_path)) if fname.startswith('data')) == shardFnames
+    # image i is in shard i % 3, serialised as in a single file whatever the number of workers
+    records = list(iter_tfrecord(str(tmp_path / 'single.record')))
+    for idx, shardFname in enumerate(shardFnames):
+        shardRecords = list(iter_tfrecord(str(tmp_path / shardFname)))
+        assert shardRecords == records[idx::3]
+        assert [decode_example(record)['image/filename'][0] for record in shardRecords] == \
+               ['{}.jpg'.format(idxImg).encode('utf8') for idxImg in range(idx, 7, 3)]
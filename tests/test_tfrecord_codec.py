@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from TfrecordCodec import TFRecordWriter, iter_tfrecord, encode_example, decode_example
+
+tf = pytest.importorskip('tensorflow')
+
+EXAMPLES = [{'image/height': ('int64', [480]), 'image/width': ('int64', [640]),
+             'image/filename': ('bytes', ['{:03d}.jpg'.format(idx).encode('utf8')]), 'image/encoded': ('bytes', [bytes(range(256)) * (idx+1)]),
+             'image/object/bbox/xmin': ('float', [0.1*idx, 0.5, -1.25]), 'image/object/class/text': ('bytes', [b'class0', b'\xc3\xa9t\xc3\xa9']),
+             'image/object/class/label': ('int64', [1, -1, idx - 5, -2**63, 2**63-1]),
+             'image/object/difficult': ('int64', []), 'image/object/bbox/ymin': ('float', []), 'image/object/view': ('bytes', [])}
+            for idx in range(10)]
+TF_FEATURES = {'bytes': lambda values: tf.train.Feature(bytes_list=tf.train.BytesList(value=values)),
+               'float': lambda values: tf.train.Feature(float_list=tf.train.FloatList(value=values)),
+               'int64': lambda values: tf.train.Feature(int64_list=tf.train.Int64List(value=values))}
+
+
+def to_tf_example(example):
+    return(tf.train.Example(features=tf.train.Features(feature={name: TF_FEATURES[kind](values) for name, (kind, values) in example.items()})))
+
+
+def parse_tf(data):
+    # feature name -> (kind, values) parsed by TensorFlow
+    features = tf.train.Example.FromString(data).features.feature
+    return({name: (feature.WhichOneof('kind')[:-len('_list')], list(getattr(feature, feature.WhichOneof('kind')).value)) for name, feature in features.items()})
+
+
+def parse_codec(data):
+    return({name: list(values) for name, values in decode_example(data).items()})
+
+
+def write_records(fname, backend):
+    if backend == 'codec':
+        writer = TFRecordWriter(fname)
+        for example in EXAMPLES:
+            writer.write(encode_example(example))
+    else:
+        writer = tf.io.TFRecordWriter(fname)
+        for example in EXAMPLES:
+            writer.write(to_tf_example(example).SerializeToString())
+    writer.close()
+
+
+@pytest.mark.parametrize('backend', ['codec', 'tensorflow'])
+def test_codec_and_tensorflow_read_the_same_records(tmp_path, backend):
+    fname = str(tmp_path / 'data.record')
+    write_records(fname, backend)
+    
+    tfRecords = [data.numpy() for data in tf.data.TFRecordDataset(fname)]
+    codecRecords = list(iter_tfrecord(fname))
+    assert tfRecords == codecRecords and len(codecRecords) == len(EXAMPLES)
+    for example, data in zip(EXAMPLES, codecRecords):
+        tfExample = parse_tf(data)
+        assert {name: kind for name, (kind, _) in tfExample.items()} == {name: kind for name, (kind, _) in example.items()}
+        # floats are rounded to float32 by both writers
+        assert all(tfExample[name][1] == values for name, (kind, values) in example.items() if kind != 'float')
+        assert parse_codec(data) == {name: values for name, (_, values) in tfExample.items()}
+
+
+def test_features_order_does_not_matter():
+    # map entries order is left to protobuf implementations, examples are equal once parsed
+    example = EXAMPLES[3]
+    reverse = dict(reversed(list(example.items())))
+    assert encode_example(example) != encode_example(reverse)
+    assert tf.train.Example.FromString(encode_example(example)) == tf.train.Example.FromString(encode_example(reverse)) == to_tf_example(example)
+    assert parse_codec(encode_example(example)) == parse_codec(encode_example(reverse)) == parse_codec(to_tf_example(reverse).SerializeToString())
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import pytest
+
+from YoloDataClass import YoloReader, parse_yolo_labels
+
+
+@pytest.fixture
+def names_file(tmp_path):
+    namesFname = str(tmp_path / 'classes.names')
+    open(namesFname, 'w').write('person\n')
+    return(namesFname)
+
+
+def add_image(img_file, folder, name, txtExt='.txt'):
+    os.makedirs(folder, exist_ok=True)
+    shutil.copyfile(img_file, os.path.join(folder, name + '.jpg'))
+    open(os.path.join(folder, name + txtExt), 'w').write('0 0.5 0.5 0.2 0.2\n')
+
+
+def test_recursive_reads_subfolders(tmp_path, img_file, names_file):
+    dataDir = str(tmp_path / 'yolo')
+    add_image(img_file, dataDir, 'a')
+    add_image(img_file, os.path.join(dataDir, 'sub'), 'b', txtExt='.TXT')
+    
+    mediator = YoloReader().translate2mediator(dataDir=dataDir, namesFname=names_file, recursive=True)
+    assert sorted(img['fname'] for img in mediator.imgList.list) == ['a.jpg', 'b.jpg']
+    assert YoloReader().translate2mediator(dataDir=dataDir, namesFname=names_file).imgList.get_num_imgs() == 1
+
+
+def test_recursive_rejects_duplicate_names(tmp_path, img_file, names_file):
+    dataDir = str(tmp_path / 'yolo')
+    add_image(img_file, os.path.join(dataDir, 'train'), 'a')
+    add_image(img_file, os.path.join(dataDir, 'val'), 'a')
+    with pytest.raises(Exception, match='same name'):
+        YoloReader().translate2mediator(dataDir=dataDir, namesFname=names_file, recursive=True)
+
+
+def test_recursive_skips_linked_folders(tmp_path, img_file, names_file):
+    dataDir = str(tmp_path / 'yolo')
+    add_image(img_file, dataDir, 'a')
+    # a link to the data folder itself would be browsed forever
+    os.symlink(dataDir, os.path.join(dataDir, 'loop'))
+    mediator = YoloReader().translate2mediator(dataDir=dataDir, namesFname=names_file, recursive=True)
+    assert [img['fname'] for img in mediator.imgList.list] == ['a.jpg']
+
+
+def test_rows_with_wrong_number_of_fields():
+    # 6 and 4 fields rows give 5 fields per row on average, they must not be shifted
+    with pytest.raises(Exception, match='each row must have 5 fields'):
+        parse_yolo_labels([b'0 .5 .5 .2 .2\n', b'0 .1 .2 .3 .4 9\n1 .5 .5 .2\n'], ['a.txt', 'b.txt'])
+    
+    # extra fields are ignored, blank lines and a missing last newline are accepted
+    rows, counts = parse_yolo_labels([b'0 .1 .2 .3 .4 9\n\n1 .5 .5 .2 .2', b'2 .3 .3 .3 .3\r\n', b''], ['a.txt', 'b.txt', 'c.txt'])
+    assert rows.tolist() == [[0, .1, .2, .3, .4], [1, .5, .5, .2, .2], [2, .3, .3, .3, .3]] and counts.tolist() == [2, 1, 0]